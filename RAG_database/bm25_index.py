@@ -0,0 +1,276 @@
+"""
+BM25 Inverted Index for the Course Collection
+与向量库使用同一批分块（VectorStoreBuilder 的 load_course_data / load_major_data /
+load_requirement_group_data），补充 dense 检索召回不到的关键词：课程代码、科目名、UOC 规则、学期代码等。
+
+build_vector_store.py 在写完 Chroma 后生成 postings 文件（course_data/vector_store_bm25.npz），
+后端启动时加载。文件格式（np.savez_compressed）:
+    ids            所有分块 id，'\\n' 拼接后的 utf-8 字节
+    vocab          按字典序排列的词表，'\\n' 拼接后的 utf-8 字节
+    term_offsets   int64[V+1]，第 t 个词的 postings 位于 [term_offsets[t], term_offsets[t+1])
+    postings_docs  int32，行号（每个词内递增）
+    postings_tf    uint16，词频
+    doc_len        int32[N]，分块的词数
+    params         float64[2]，(k1, b)
+"""
+
+import os
+import re
+import time
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .packed_storage import PackedIdLookup, PackedStrings
+except ImportError:
+    from packed_storage import PackedIdLookup, PackedStrings
+
+FORMAT_VERSION = 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+what which who how can i me my you your do does about tell
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    小写 + 字母数字切分 + 去停用词 + 简单的复数折叠（courses -> course）
+
+    课程代码保持为一个词（COMP9417 -> comp9417）
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall((text or "").lower()):
+        if token in _STOP_WORDS:
+            continue
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _join(strings: Sequence[str]) -> np.ndarray:
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _split(buffer: np.ndarray) -> List[str]:
+    text = buffer.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+class BM25Index:
+    """词项优先（term-major）的 CSR postings + Okapi BM25 打分"""
+
+    def __init__(self,
+                 ids: Sequence[str],
+                 vocab: Sequence[str],
+                 term_offsets: np.ndarray,
+                 postings_docs: np.ndarray,
+                 postings_tf: np.ndarray,
+                 doc_len: np.ndarray,
+                 k1: float = 1.2,
+                 b: float = 0.75):
+        # ids / 词表存成 numpy 字节缓冲：多 worker preload + fork 时保持 copy-on-write 共享
+        self.ids = ids if isinstance(ids, PackedStrings) else PackedStrings(list(ids))
+        self.vocab = vocab if isinstance(vocab, PackedStrings) else PackedStrings(list(vocab))
+        self.term_offsets = np.asarray(term_offsets, dtype=np.int64)
+        self.postings_docs = np.asarray(postings_docs, dtype=np.int32)
+        self.postings_tf = np.asarray(postings_tf, dtype=np.uint16)
+        self.doc_len = np.asarray(doc_len, dtype=np.int32)
+        self.k1 = float(k1)
+        self.b = float(b)
+
+        if len(self.term_offsets) != len(self.vocab) + 1 or len(self.doc_len) != len(self.ids):
+            raise ValueError("Inconsistent BM25 postings arrays")
+
+        self.term_id = PackedIdLookup(list(self.vocab))
+        n = len(self.ids)
+        df = np.diff(self.term_offsets).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(self.doc_len.mean()) if n else 1.0
+        # 分母里只和文档有关的部分，查询时直接按行号取
+        self._len_norm = (self.k1 * (1.0 - self.b + self.b * self.doc_len / max(avgdl, 1e-6))).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ------------------------------------------------------------------
+    # 构建 / 持久化
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build(cls, ids: Sequence[str], documents: Sequence[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        builder = BM25Builder()
+        for doc_id, text in zip(ids, documents):
+            builder.add(doc_id, text)
+        return builder.finish(k1=k1, b=b)
+
+    def save(self, path: str):
+        """原子写入（先写临时文件再 rename）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                format_version=np.array([FORMAT_VERSION], dtype=np.int32),
+                ids=_join(self.ids),
+                vocab=_join(self.vocab),
+                term_offsets=self.term_offsets,
+                postings_docs=self.postings_docs,
+                postings_tf=self.postings_tf,
+                doc_len=self.doc_len,
+                params=np.array([self.k1, self.b], dtype=np.float64),
+            )
+        os.replace(tmp_path, path)
+        print(f"  [OK] BM25 postings saved: {path} ({path.stat().st_size / 1e6:.1f}MB)")
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        start = time.time()
+        with np.load(path) as data:
+            version = int(data["format_version"][0])
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported BM25 postings format {version} (expected {FORMAT_VERSION})")
+            k1, b = data["params"].tolist()
+            index = cls(
+                _split(data["ids"]),
+                _split(data["vocab"]),
+                data["term_offsets"],
+                data["postings_docs"],
+                data["postings_tf"],
+                data["doc_len"],
+                k1=k1,
+                b=b,
+            )
+        print(f"[OK] BM25 index loaded: {len(index)} chunks, {len(index.vocab)} terms "
+              f"in {time.time() - start:.2f}s")
+        return index
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def scores(self, query: str) -> np.ndarray:
+        """整个语料的 BM25 分数（float32[N]，不含查询词的分块为 0）"""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term, qtf in Counter(tokenize(query)).items():
+            t = self.term_id.get(term)
+            if t is None:
+                continue
+            start, end = self.term_offsets[t], self.term_offsets[t + 1]
+            rows = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end].astype(np.float32)
+            # 同一个词内行号不重复，可以直接 fancy-index 累加
+            scores[rows] += qtf * self.idf[t] * tf * (self.k1 + 1.0) / (tf + self._len_norm[rows])
+        return scores
+
+    def search(self, query: str, top_k: int = 10, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Args:
+            query: 查询文本
+            top_k: 返回个数
+            mask: 可选的候选行布尔掩码（例如 MetadataFilterIndex.mask 的结果）
+
+        Returns:
+            [(行号, BM25 分数)]，按分数降序，只包含分数 > 0 的分块
+        """
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) == 0:
+            return []
+        if len(candidates) > top_k:
+            top = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[top]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(row), float(scores[row])) for row in order]
+
+    def search_many(self, queries: Sequence[str], top_k: int = 10) -> List[List[Tuple[int, float]]]:
+        return [self.search(query, top_k) for query in queries]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "chunks": len(self.ids),
+            "terms": len(self.vocab),
+            "postings": int(len(self.postings_docs)),
+            "avg_doc_len": round(float(self.doc_len.mean()), 1) if len(self.ids) else 0.0,
+            "k1": self.k1,
+            "b": self.b,
+        }
+
+
+class BM25Builder:
+    """
+    流式构建 postings：分块逐个加入，立即切词，只保留 id、词频和文档长度，不保留原文
+
+    build_vector_store.py 边 embed 边加入，构建期间内存与 postings 大小成正比，而不是语料原文。
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self._doc_len = array("i")
+        self._postings: Dict[str, array] = {}  # term -> [row, tf, row, tf, ...]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, doc_id: str, text: str):
+        row = len(self.ids)
+        self.ids.append(doc_id)
+        counts = Counter(tokenize(text))
+        self._doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            entries = self._postings.get(term)
+            if entries is None:
+                entries = self._postings[term] = array("i")
+            entries.append(row)
+            entries.append(min(tf, 65535))
+
+    def finish(self, exclude: Sequence[str] = (), k1: float = 1.2, b: float = 0.75) -> BM25Index:
+        """
+        生成索引
+
+        Args:
+            exclude: 不进入索引的分块 id（例如写入 Chroma 失败的分块），其余分块按加入顺序重新编号
+        """
+        start = time.time()
+        exclude = set(exclude)
+        keep = np.fromiter((doc_id not in exclude for doc_id in self.ids), dtype=bool, count=len(self.ids))
+        new_row = np.cumsum(keep) - 1
+        ids = [doc_id for doc_id, kept in zip(self.ids, keep) if kept]
+        doc_len = np.asarray(self._doc_len, dtype=np.int32)[keep]
+
+        vocab: List[str] = []
+        docs_parts: List[np.ndarray] = []
+        tf_parts: List[np.ndarray] = []
+        for term in sorted(self._postings):
+            entries = np.asarray(self._postings[term], dtype=np.int64).reshape(-1, 2)
+            entries = entries[keep[entries[:, 0]]]
+            if not len(entries):
+                continue
+            vocab.append(term)
+            docs_parts.append(new_row[entries[:, 0]])
+            tf_parts.append(entries[:, 1])
+
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(d) for d in docs_parts])
+        postings_docs = np.concatenate(docs_parts).astype(np.int32) if docs_parts else np.zeros(0, np.int32)
+        postings_tf = np.concatenate(tf_parts).astype(np.uint16) if tf_parts else np.zeros(0, np.uint16)
+
+        index = BM25Index(ids, vocab, term_offsets, postings_docs, postings_tf, doc_len, k1=k1, b=b)
+        print(f"[OK] BM25 index built: {len(index)} chunks, {len(vocab)} terms, "
+              f"{len(postings_docs)} postings in {time.time() - start:.2f}s")
+        return index
+
+
+def bm25_path_for(persist_directory: str) -> Path:
+    """postings 文件放在 persist 目录旁边，例如 course_data/vector_store_bm25.npz"""
+    persist_path = Path(persist_directory)
+    return persist_path.with_name(f"{persist_path.name}_bm25.npz")
@@ -5,8 +5,13 @@ Vector Store Builder for UNSW Course Data
 
 import json
 import os
+import argparse
+import hashlib
+import queue
+import threading
+import time
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Generator
+from typing import List, Dict, Any, Optional, Generator, Iterable, Iterator, Callable
 from dataclasses import dataclass
 import chromadb
 from chromadb.config import Settings
@@ -15,9 +20,21 @@ from chromadb.config import Settings
 from tqdm import tqdm
 # import time # 不再需要 time.sleep
 from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer
 import torch
 import pickle
 import re
+import numpy as np
+
+try:
+    from .embedding_cache import EmbeddingCache
+    from .parallel_encoder import MultiProcessEncoder, length_bucketed_batches
+    from .bm25_index import BM25Builder, bm25_path_for
+except ImportError:
+    # 直接以脚本方式运行 (python RAG_database/build_vector_store.py)
+    from embedding_cache import EmbeddingCache
+    from parallel_encoder import MultiProcessEncoder, length_bucketed_batches
+    from bm25_index import BM25Builder, bm25_path_for
 
 @dataclass
 class EmbeddingDocument:
@@ -26,6 +43,11 @@ class EmbeddingDocument:
     text: str  # Text to embed
     metadata: Dict[str, Any]  # Metadata for filtering
     source_type: str  # "course", "major", "requirement_group", "prerequisite"
+    token_count: Optional[int] = None  # 含特殊 token 的长度（流水线中填充）
+
+
+# 流水线各阶段之间队列的结束标记
+_STREAM_END = object()
 
 
 class VectorStoreBuilder:
@@ -35,23 +57,68 @@ class VectorStoreBuilder:
     def __init__(self,
                  model_name: str = 'BAAI/bge-small-en-v1.5',
                  batch_size: int = 32,
-                 collection_name: str = "unsw_courses"):
+                 collection_name: str = "unsw_courses",
+                 incremental: bool = False,
+                 cache_dir: Optional[str] = None,
+                 cache_dtype: str = "float32",
+                 stream_batch_size: int = 256,
+                 queue_size: int = 4,
+                 workers: int = 1,
+                 split_overlap_tokens: int = 32):
         """
         [已修改] 初始化本地 SentenceTransformer 和配置
+
+        Args:
+            incremental: 增量模式。只对内容哈希发生变化的分块重新 embed + upsert，
+                         并删除已不存在的 id（见 build_vector_store）
+            cache_dir: 持久化 embedding 缓存目录（None 表示不使用缓存）
+            cache_dtype: 缓存矩阵的精度，'float32' 或 'float16'
+            stream_batch_size: 流水线中每个 embed/upsert 批次的文档数
+            queue_size: 阶段之间队列的最大批次数（决定内存上限）
+            workers: >1 时使用多进程 CPU 编码（每个进程一份模型，按长度分桶）
+            split_overlap_tokens: 超长 overview / 要求组描述切分时相邻片段的重叠 token 数
         """
         self.collection_name = collection_name
         self.batch_size = batch_size
-        
-        print(f"Loading local embedding model: {model_name}...")
-        device_to_use = 'cuda' if torch.cuda.is_available() else 'cpu'
-        print(f"Using device: {device_to_use}")
-
-        self.model = SentenceTransformer(model_name, device=device_to_use)
-        print("[OK] Local model loaded.")
-        
-        # 获取模型的维度
-        self.dimensions = self.model.get_sentence_embedding_dimension()
-        print(f"Model dimensions: {self.dimensions}")
+        self.model_name = model_name
+        self.incremental = incremental
+        self.stream_batch_size = stream_batch_size
+        self.queue_size = queue_size
+        self.workers = max(1, workers)
+
+        self.model = None
+        self.encoder = None
+        if self.workers > 1:
+            # 多进程模式：主进程不加载模型，每个 worker 各一份
+            self.encoder = MultiProcessEncoder(model_name, workers=self.workers, batch_size=batch_size)
+            self.dimensions = self.encoder.dimensions
+            # 每个流式批次至少要能让所有 worker 都分到任务
+            self.stream_batch_size = max(stream_batch_size, self.workers * batch_size * 2)
+        else:
+            print(f"Loading local embedding model: {model_name}...")
+            device_to_use = 'cuda' if torch.cuda.is_available() else 'cpu'
+            print(f"Using device: {device_to_use}")
+
+            self.model = SentenceTransformer(model_name, device=device_to_use)
+            print("[OK] Local model loaded.")
+            
+            # 获取模型的维度
+            self.dimensions = self.model.get_sentence_embedding_dimension()
+            print(f"Model dimensions: {self.dimensions}")
+
+        # 独立的 tokenizer 实例：只在生产者线程里用于计数/切分，
+        # 不与编码线程共享（fast tokenizer 并发调用会报 "Already borrowed"）
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.max_seq_length = int(self.encoder.max_seq_length if self.encoder is not None
+                                  else self.model.max_seq_length)
+        self.split_overlap_tokens = split_overlap_tokens
+        self.truncated_ids: List[str] = []
+        print(f"Max sequence length: {self.max_seq_length} tokens")
+
+        self.embedding_cache = None
+        if cache_dir:
+            self.embedding_cache = EmbeddingCache(cache_dir, model_name, self.dimensions, dtype=cache_dtype)
+            print(f"[OK] Embedding cache: {self.embedding_cache.cache_path} ({len(self.embedding_cache)} entries)")
 
         self.chroma_client = None
         self.collection = None
@@ -60,25 +127,125 @@ class VectorStoreBuilder:
     # def _get_embeddings(self, ...):
     #     ...
 
+    def close(self):
+        """释放编码进程池（多进程模式）"""
+        if self.encoder is not None:
+            self.encoder.close()
+            self.encoder = None
+
+    def _encode_texts(self, texts: List[str], lengths: Optional[List[int]] = None) -> np.ndarray:
+        """
+        直接调用 SentenceTransformer 编码（不经过缓存）
+
+        [新] 按 token 长度排序分桶后再编码，最后恢复原始顺序，减少 padding 浪费
+        """
+        if lengths is None:
+            lengths = self._count_tokens(texts)
+        if self.encoder is not None:
+            return self.encoder.encode(texts, lengths=lengths)
+
+        out = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        for idx in length_bucketed_batches(lengths, self.batch_size):
+            out[idx] = self.model.encode(
+                [texts[i] for i in idx],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+        return out
+
     # 修复: _batch_embed 现在极其高效
-    def _batch_embed(self, texts: List[str]) -> List[List[float]]:
+    def _batch_embed(self, texts: List[str], lengths: Optional[List[int]] = None) -> np.ndarray:
         """
-        [已优化] 使用 SentenceTransformer 一次性高效编码所有文本。
+        [已优化] 使用 SentenceTransformer 编码一个批次的文本。
+        [新] 命中持久化缓存的文本不再重复编码。
+        [新] 直接返回 (n, dim) 的 float32 numpy 矩阵，不再逐向量 .tolist()
+
+        Args:
+            lengths: 每个文本的 token 数（由流水线预先计算），用于长度分桶
         """
-        print(f"Generating embeddings for {len(texts)} documents (model batch_size={self.batch_size})...")
-        
-        # self.model.encode() 会自动处理批量和显示进度条
-        embeddings = self.model.encode(
-            texts,
-            batch_size=self.batch_size,
-            show_progress_bar=True
-        )
-        
-        print("\n[OK] Embeddings generated.")
-        return [emb.tolist() for emb in embeddings]
+        if self.embedding_cache is not None:
+            length_by_text = dict(zip(texts, lengths)) if lengths is not None else None
+            embeddings = self.embedding_cache.encode(
+                texts,
+                lambda misses: self._encode_texts(
+                    misses,
+                    [length_by_text[t] for t in misses] if length_by_text is not None else None
+                )
+            )
+        else:
+            embeddings = self._encode_texts(texts, lengths)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    # ------------------------------------------------------------------
+    # Token 计数与按 token 预算切分
+    # ------------------------------------------------------------------
+
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """每个文本的 token 数（含 [CLS]/[SEP]），不截断"""
+        if not texts:
+            return []
+        encoded = self.tokenizer(list(texts), add_special_tokens=True, truncation=False, verbose=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _measure_batch(self, batch: List[EmbeddingDocument]):
+        """填充 token_count，并记录仍会被模型截断的分块"""
+        for doc, n_tokens in zip(batch, self._count_tokens([doc.text for doc in batch])):
+            doc.token_count = n_tokens
+            if n_tokens > self.max_seq_length:
+                self.truncated_ids.append(doc.id)
+
+    def _split_to_token_budget(self, body: str, render: Callable[[str], str]) -> List[str]:
+        """
+        把超出模型窗口的正文切成多段，每段套上相同的上下文 (render) 后都不超过 max_seq_length
+
+        Args:
+            body: 需要切分的正文（overview / 描述）
+            render: body 片段 -> 完整分块文本
 
-    def initialize_chroma(self, persist_directory: str):
-        """Initialize Chroma client and collection"""
+        Returns:
+            完整分块文本列表；不超长时只有一个元素（与切分前完全相同）
+        """
+        full_text = render(body)
+        if self._count_tokens([full_text])[0] <= self.max_seq_length:
+            return [full_text]
+        if not getattr(self.tokenizer, "is_fast", False):
+            # 没有 offset mapping 无法精确切分，交给截断报告处理
+            return [full_text]
+
+        # 上下文本身占用的 token + 特殊 token + 拼接误差余量
+        overhead = self._count_tokens([render("")])[0] + 4
+        budget = self.max_seq_length - overhead
+        if budget <= 0:
+            return [full_text]
+        # 上下文很长时缩小重叠，保证每段都有前进
+        overlap = min(self.split_overlap_tokens, budget // 4)
+
+        offsets = self.tokenizer(
+            body, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+        )["offset_mapping"]
+        step = budget - overlap
+        parts = []
+        for start in range(0, len(offsets), step):
+            end = min(start + budget, len(offsets))
+            parts.append(render(body[offsets[start][0]:offsets[end - 1][1]]))
+            if end == len(offsets):
+                break
+        return parts
+
+    @staticmethod
+    def _part_id(base_id: str, part_idx: int) -> str:
+        """第一段沿用原 id（保持与切分前兼容），后续段加 _partN 后缀"""
+        return base_id if part_idx == 0 else f"{base_id}_part{part_idx}"
+
+    def initialize_chroma(self, persist_directory: str, reset: bool = True):
+        """
+        Initialize Chroma client and collection
+
+        Args:
+            reset: True 时删除并重建 collection（全量构建）；
+                   False 时复用已有 collection（增量构建）
+        """
         persist_path = Path(persist_directory)
         persist_path.mkdir(parents=True, exist_ok=True)
         
@@ -92,6 +259,14 @@ class VectorStoreBuilder:
             )
         )
         
+        if not reset:
+            self.collection = self.chroma_client.get_or_create_collection(
+                name=self.collection_name,
+                metadata={"description": "UNSW course data with embeddings"}
+            )
+            print(f"  [OK] Reusing collection '{self.collection_name}' ({self.collection.count()} documents)")
+            return
+
         # Delete existing collection if exists
         try:
             self.chroma_client.delete_collection(name=self.collection_name)
@@ -107,6 +282,69 @@ class VectorStoreBuilder:
         
         print(f"  [OK] Created collection '{self.collection_name}'")
 
+    # ------------------------------------------------------------------
+    # 增量构建: 内容哈希 + manifest
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _hash_document(doc: EmbeddingDocument) -> str:
+        """对 id + text + metadata 计算稳定的内容哈希"""
+        payload = json.dumps(
+            {"id": doc.id, "text": doc.text, "metadata": doc.metadata},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _manifest_path(self, persist_directory: str) -> Path:
+        """manifest 放在 persist 目录旁边，例如 course_data/vector_store_manifest.json"""
+        persist_path = Path(persist_directory)
+        return persist_path.with_name(f"{persist_path.name}_manifest.json")
+
+    def _load_manifest(self, persist_directory: str) -> Dict[str, str]:
+        """
+        读取上一次构建的 {doc_id: hash}。
+        模型或 collection 不一致时返回空字典（等价于全量重建）。
+        """
+        manifest_path = self._manifest_path(persist_directory)
+        if not manifest_path.exists():
+            return {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except Exception as e:
+            print(f"  [WARN] Failed to read manifest {manifest_path.name}: {e}")
+            return {}
+
+        if manifest.get("model_name") != self.model_name or manifest.get("collection_name") != self.collection_name:
+            print("  [WARN] Manifest was built with a different model/collection, ignoring it.")
+            return {}
+        return manifest.get("documents", {})
+
+    def _save_manifest(self, persist_directory: str, hashes: Dict[str, str]):
+        """原子写入 manifest（先写临时文件再 rename）"""
+        manifest_path = self._manifest_path(persist_directory)
+        tmp_path = manifest_path.with_suffix(".json.tmp")
+        manifest = {
+            "model_name": self.model_name,
+            "collection_name": self.collection_name,
+            "documents": hashes
+        }
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+        print(f"  [OK] Manifest saved: {manifest_path} ({len(hashes)} documents)")
+
+    def _delete_ids(self, ids: List[str]):
+        """从 collection 中删除孤立的 id"""
+        if not ids:
+            return
+        chroma_batch_size = 4096
+        for i in range(0, len(ids), chroma_batch_size):
+            self.collection.delete(ids=ids[i:i + chroma_batch_size])
+        print(f"  [OK] Deleted {len(ids)} orphaned documents")
+
     def _clean_html(self, raw_html: str) -> str:
         """Helper to clean HTML tags and excessive whitespace"""
         if not raw_html:
@@ -189,9 +427,12 @@ class VectorStoreBuilder:
                 text_parts = [f"Course Code: {course_code} ({level_tag})"]
                 if course_name:
                     text_parts.append(f"Course Name: {course_name}")
-                text_parts.append(f"Overview: {overview}")
                 
-                text = ". ".join(text_parts)
+                # [新] 超过模型窗口的 overview 切成多段（每段都带课程上下文）
+                overview_texts = self._split_to_token_budget(
+                    overview,
+                    lambda part: ". ".join(text_parts + [f"Overview: {part}"])
+                )
                 
                 # --- [!!] 就在这里！这是你的修复 [!!] ---
                 terms_list = course.get("parsed_terms", [])
@@ -209,14 +450,18 @@ class VectorStoreBuilder:
                     "url": course_url
                 }
                 
-                doc = EmbeddingDocument(
-                    id=f"course_{unique_course_id}",
-                    text=text,
-                    metadata=metadata,
-                    source_type="course"
-                )
-                yield doc
-                doc_count += 1
+                for part_idx, text in enumerate(overview_texts):
+                    part_metadata = metadata
+                    if len(overview_texts) > 1:
+                        part_metadata = {**metadata, "chunk_index": part_idx, "chunk_count": len(overview_texts)}
+                    doc = EmbeddingDocument(
+                        id=self._part_id(f"course_{unique_course_id}", part_idx),
+                        text=text,
+                        metadata=part_metadata,
+                        source_type="course"
+                    )
+                    yield doc
+                    doc_count += 1
 
             # 2. [子文档] - 先修课程 (Prerequisite Chunk)
             prereq_json = course.get("parsed_prerequisite")
@@ -352,19 +597,26 @@ class VectorStoreBuilder:
                     group_title = group.get("title", "")
                     if not group_title: continue
                     
-                    text_parts = [f"Requirement Group: {group_title}", f"Major: {major_code}"]
                     description = self._clean_html(group.get("description", ""))
-                    if description: text_parts.append(f"Description: {description}")
-                    
                     group_type = group.get("vertical_grouping_label", "")
-                    if group_type: text_parts.append(f"Type: {group_type}")
-                    
                     courses = group.get("courses", [])
-                    if courses:
-                        course_codes = [c.get("code", "") for c in courses[:10]]
-                        text_parts.append(f"Includes courses: {', '.join(course_codes)}")
+                    course_codes = [c.get("code", "") for c in courses[:10]]
+
+                    def render(description_part: Optional[str]) -> str:
+                        text_parts = [f"Requirement Group: {group_title}", f"Major: {major_code}"]
+                        if description_part: text_parts.append(description_part)
+                        if group_type: text_parts.append(f"Type: {group_type}")
+                        if courses:
+                            text_parts.append(f"Includes courses: {', '.join(course_codes)}")
+                        return ". ".join(text_parts)
                     
-                    text = ". ".join(text_parts)
+                    # [新] 超过模型窗口的描述切成多段（每段都带要求组上下文）
+                    if description:
+                        group_texts = self._split_to_token_budget(
+                            description, lambda part: render(f"Description: {part}")
+                        )
+                    else:
+                        group_texts = [render(None)]
                     group_id = f"{major_code}_{group_title.replace(' ', '_')}"
                     
                     metadata = {
@@ -376,65 +628,138 @@ class VectorStoreBuilder:
                         "required_uoc": group.get("credit_points", ""),
                         "course_count": len(courses)
                     }
-                    yield EmbeddingDocument(
-                        id=f"req_group_{group_id}",
-                        text=text,
-                        metadata=metadata,
-                        source_type="requirement_group"
-                    )
-                    doc_count += 1
+                    for part_idx, text in enumerate(group_texts):
+                        part_metadata = metadata
+                        if len(group_texts) > 1:
+                            part_metadata = {**metadata, "chunk_index": part_idx, "chunk_count": len(group_texts)}
+                        yield EmbeddingDocument(
+                            id=self._part_id(f"req_group_{group_id}", part_idx),
+                            text=text,
+                            metadata=part_metadata,
+                            source_type="requirement_group"
+                        )
+                        doc_count += 1
             except Exception as e:
                 print(f"  Error processing {json_file.name}: {e}")
         print(f"  [OK] Prepared {doc_count} requirement group documents")
 
-    def add_documents_to_collection(self, documents: List[EmbeddingDocument]):
+    def _iter_batches(self, documents: Iterable[EmbeddingDocument]) -> Iterator[List[EmbeddingDocument]]:
+        """把文档流切成固定大小的批次"""
+        batch: List[EmbeddingDocument] = []
+        for doc in documents:
+            batch.append(doc)
+            if len(batch) >= self.stream_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def add_documents_to_collection(self, documents: Iterable[EmbeddingDocument]) -> List[str]:
         """
-        [FIXED]
-        Add documents to Chroma collection in batches to avoid internal limits.
+        [重构] 流式写入: parse -> chunk -> embed (批) -> upsert
+
+        - 解析/分块在生产者线程中进行，embed 在当前线程，Chroma 写入在写线程
+        - 阶段之间是容量为 queue_size 的有界队列，内存占用与语料规模无关
+        - embedding 以 numpy 矩阵直接传给 Chroma，embed 与写入并行
+
+        Args:
+            documents: 任意可迭代对象（通常是生成器）
+
+        Returns:
+            写入失败的文档 id 列表（增量模式下不会记入 manifest，下次构建会重试）
         """
         if not self.collection:
             raise RuntimeError("Collection not initialized. Call initialize_chroma() first.")
-        
-        if not documents:
-            print("  > No documents to add, skipping.")
-            return
 
-        print(f"\nAdding {len(documents)} documents to collection in batches...")
-        
-        # 1. Prepare all data first (this part is fine)
-        ids = [doc.id for doc in documents]
-        texts = [doc.text for doc in documents]
-        metadatas = [doc.metadata for doc in documents]
-        
-        # 2. Generate all embeddings first (this part is fine and efficient)
-        print("Generating all embeddings first...")
-        embeddings = self._batch_embed(texts)
-        
-        chroma_batch_size = 4096 
+        embed_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        write_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        failed_ids: List[str] = []
+        producer_errors: List[BaseException] = []
         total_added = 0
-        
-        print(f"Adding to Chroma collection in batches of {chroma_batch_size}...")
-        for i in tqdm(range(0, len(documents), chroma_batch_size), desc="Adding batches to Chroma"):
-            # Slice all lists for the current batch
-            batch_ids = ids[i:i + chroma_batch_size]
-            batch_texts = texts[i:i + chroma_batch_size]
-            batch_metadatas = metadatas[i:i + chroma_batch_size]
-            batch_embeddings = embeddings[i:i + chroma_batch_size]
-            
+        total_seen = 0
+
+        def producer():
             try:
-                # Add just this batch
-                self.collection.add(
-                    ids=batch_ids,
-                    embeddings=batch_embeddings,
-                    documents=batch_texts,
-                    metadatas=batch_metadatas
+                for batch in self._iter_batches(documents):
+                    self._measure_batch(batch)
+                    embed_queue.put(batch)
+            except BaseException as e:
+                producer_errors.append(e)
+            finally:
+                embed_queue.put(_STREAM_END)
+
+        def writer():
+            nonlocal total_added
+            while True:
+                item = write_queue.get()
+                if item is _STREAM_END:
+                    return
+                batch, embeddings = item
+                batch_ids = [doc.id for doc in batch]
+                try:
+                    # upsert: 增量模式下 id 可能已存在
+                    self.collection.upsert(
+                        ids=batch_ids,
+                        embeddings=embeddings,
+                        documents=[doc.text for doc in batch],
+                        metadatas=[doc.metadata for doc in batch]
+                    )
+                    total_added += len(batch_ids)
+                except Exception as e:
+                    print(f"\nError adding batch starting with '{batch_ids[0]}': {e}")
+                    print(f"  > Skipping this batch of {len(batch_ids)} documents.")
+                    failed_ids.extend(batch_ids)
+
+        print(f"\nStreaming documents into collection "
+              f"(batch={self.stream_batch_size}, queue={self.queue_size}, model batch_size={self.batch_size})...")
+        producer_thread = threading.Thread(target=producer, name="vs-producer", daemon=True)
+        writer_thread = threading.Thread(target=writer, name="vs-writer", daemon=True)
+        producer_thread.start()
+        writer_thread.start()
+
+        cache_misses_before = self.embedding_cache.misses if self.embedding_cache is not None else 0
+        truncated_before = len(self.truncated_ids)
+        start_time = time.time()
+        progress = tqdm(desc="Embedding + writing", unit="doc")
+        try:
+            while True:
+                batch = embed_queue.get()
+                if batch is _STREAM_END:
+                    break
+                embeddings = self._batch_embed(
+                    [doc.text for doc in batch],
+                    [doc.token_count for doc in batch]
                 )
-                total_added += len(batch_ids)
-            except Exception as e:
-                print(f"\nError adding batch starting at index {i}: {e}")
-                print(f"  > Skipping this batch of {len(batch_ids)} documents.")
-
-        print(f"\n  [OK] Added {total_added} / {len(documents)} documents to Chroma.")
+                write_queue.put((batch, embeddings))
+                total_seen += len(batch)
+                progress.update(len(batch))
+        finally:
+            progress.close()
+            write_queue.put(_STREAM_END)
+            writer_thread.join()
+
+        producer_thread.join()
+        if producer_errors:
+            raise producer_errors[0]
+
+        if total_seen == 0:
+            print("  > No documents to add, skipping.")
+            return failed_ids
+
+        elapsed = max(time.time() - start_time, 1e-6)
+        encoded = total_seen
+        if self.embedding_cache is not None:
+            encoded = self.embedding_cache.misses - cache_misses_before
+            print(f"  > Embedding cache: {total_seen - encoded} hits, {encoded} encoded")
+        print(f"\n  [OK] Added {total_added} / {total_seen} documents to Chroma.")
+        print(f"  [Timer] {elapsed:.1f}s total, {total_seen / elapsed:.1f} docs/sec "
+              f"({encoded / elapsed:.1f} encoded docs/sec, workers={self.workers})")
+        truncated = self.truncated_ids[truncated_before:]
+        if truncated:
+            preview = ", ".join(truncated[:10]) + (" ..." if len(truncated) > 10 else "")
+            print(f"  [WARN] {len(truncated)} chunks exceed {self.max_seq_length} tokens "
+                  f"and were truncated by the encoder: {preview}")
+        return failed_ids
 
     def build_vector_store(self,
                            compiled_data_path: str,
@@ -444,33 +769,93 @@ class VectorStoreBuilder:
         Build complete vector store
         """
         print("="*80)
-        print("Building Vector Store")
+        print("Building Vector Store" + (" (incremental)" if self.incremental else ""))
         print("="*80)
         
-        self.initialize_chroma(persist_directory)
-        
-        # 修复: 将生成器转换为列表以进行批量添加
-        course_docs = list(self.load_course_data(compiled_data_path))
-        major_docs = list(self.load_major_data(graduation_req_dir))
-        req_group_docs = list(self.load_requirement_group_data(graduation_req_dir))
+        previous_hashes = self._load_manifest(persist_directory) if self.incremental else {}
+        self.initialize_chroma(persist_directory, reset=not previous_hashes)
+        if previous_hashes and self.collection.count() == 0:
+            # manifest 还在但 collection 已被清空，只能全量重建
+            print("  [WARN] Collection is empty but manifest exists, falling back to a full build.")
+            previous_hashes = {}
+
+        # [重构] 不再把生成器转成列表：文档边生成边 embed 边写入
+        chunk_counts = {"course": 0, "major": 0, "requirement_group": 0}
+        current_hashes: Dict[str, str] = {}
+        # BM25 需要全部分块（增量模式下未变更的分块也要进索引）；边生成边切词，不保留原文
+        lexical = BM25Builder()
+        unchanged = 0
+
+        def counted(docs: Iterable[EmbeddingDocument], group: str) -> Iterator[EmbeddingDocument]:
+            for doc in docs:
+                chunk_counts[group] += 1
+                yield doc
 
-        all_docs = course_docs + major_docs + req_group_docs
-        
-        self.add_documents_to_collection(all_docs)
+        def changed_only(docs: Iterable[EmbeddingDocument]) -> Iterator[EmbeddingDocument]:
+            """记录每个分块的哈希，只放行新增/变更的分块"""
+            nonlocal unchanged
+            for doc in docs:
+                lexical.add(doc.id, doc.text)
+                doc_hash = self._hash_document(doc)
+                current_hashes[doc.id] = doc_hash
+                if previous_hashes.get(doc.id) == doc_hash:
+                    unchanged += 1
+                    continue
+                yield doc
+
+        def all_documents() -> Iterator[EmbeddingDocument]:
+            yield from counted(self.load_course_data(compiled_data_path), "course")
+            yield from counted(self.load_major_data(graduation_req_dir), "major")
+            yield from counted(self.load_requirement_group_data(graduation_req_dir), "requirement_group")
+
+        failed_ids = self.add_documents_to_collection(changed_only(all_documents()))
+
+        if previous_hashes:
+            orphan_ids = [doc_id for doc_id in previous_hashes if doc_id not in current_hashes]
+            total_docs = sum(chunk_counts.values())
+            print(f"\nIncremental diff: {total_docs - unchanged} new/changed, "
+                  f"{unchanged} unchanged, {len(orphan_ids)} orphaned")
+            self._delete_ids(orphan_ids)
+
+        for doc_id in failed_ids:
+            current_hashes.pop(doc_id, None)
+        self._save_manifest(persist_directory, current_hashes)
+
+        bm25 = lexical.finish(exclude=failed_ids)
+        bm25.save(str(bm25_path_for(persist_directory)))
         
         print("\n" + "="*80)
         print("Vector Store Statistics")
         print("="*80)
         print(f"Collection name: {self.collection_name}")
         print(f"Total documents: {self.collection.count()}")
-        print(f"  Course Chunks: {len(course_docs)}")
-        print(f"  Major Chunks: {len(major_docs)}")
-        print(f"  Requirement Group Chunks: {len(req_group_docs)}")
+        print(f"  Course Chunks: {chunk_counts['course']}")
+        print(f"  Major Chunks: {chunk_counts['major']}")
+        print(f"  Requirement Group Chunks: {chunk_counts['requirement_group']}")
         print(f"\nPersisted to: {persist_directory}")
 
 
 def main():
     """Build vector store"""
+
+    parser = argparse.ArgumentParser(description="Build the UNSW course vector store")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="只 embed 新增/变更的分块，并删除已不存在的 id（基于 manifest 内容哈希）"
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="不读写持久化 embedding 缓存（course_data/embedding_cache）"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="CPU 编码进程数（>1 时每个进程加载一份模型，默认 1 = 单进程）"
+    )
+    cli_args = parser.parse_args()
     
     # 修复: 本地模型不需要 API keys
     # load_dotenv()
@@ -491,6 +876,7 @@ def main():
     compiled_data_path = project_root / "course_data" / "compiled_course_data" / "compiled_data.json"
     graduation_req_dir = project_root / "course_data" / "cleaned_graduation_requirements"
     persist_directory = project_root / "course_data" / "vector_store"
+    embedding_cache_dir = None if cli_args.no_embedding_cache else project_root / "course_data" / "embedding_cache"
     
     print("="*80)
     print("UNSW Course Vector Store Builder")
@@ -500,7 +886,10 @@ def main():
     print(f"Graduation requirements: {graduation_req_dir}")
     print(f"Output: {persist_directory}")
     print(f"\nEmbedding model: {MODEL_NAME}")
-    print(f"Batch size: {BATCH_SIZE}\n")
+    print(f"Batch size: {BATCH_SIZE}")
+    print(f"Incremental: {cli_args.incremental}")
+    print(f"Embedding cache: {embedding_cache_dir or 'disabled'}")
+    print(f"Encoder workers: {cli_args.workers}\n")
     
     if not compiled_data_path.exists():
         print(f"[ERR] Compiled data not found: {compiled_data_path}")
@@ -514,14 +903,20 @@ def main():
     builder = VectorStoreBuilder(
         model_name=MODEL_NAME,
         batch_size=BATCH_SIZE,
-        collection_name=COLLECTION_NAME
+        collection_name=COLLECTION_NAME,
+        incremental=cli_args.incremental,
+        cache_dir=str(embedding_cache_dir) if embedding_cache_dir else None,
+        workers=cli_args.workers
     )
     
-    builder.build_vector_store(
-        compiled_data_path=str(compiled_data_path),
-        graduation_req_dir=str(graduation_req_dir),
-        persist_directory=str(persist_directory)
-    )
+    try:
+        builder.build_vector_store(
+            compiled_data_path=str(compiled_data_path),
+            graduation_req_dir=str(graduation_req_dir),
+            persist_directory=str(persist_directory)
+        )
+    finally:
+        builder.close()
     
     print("\n" + "="*80)
     print("[OK] Vector Store Build Complete!")
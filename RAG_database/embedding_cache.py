@@ -0,0 +1,285 @@
+"""
+Persistent Embedding Cache
+按 (model_name, 规范化文本) 缓存 SentenceTransformer 的输出，避免重复编码
+
+磁盘布局 (每个模型一个子目录):
+    <cache_dir>/<model_slug>/
+        vectors.<dtype>.bin   # 行优先的 float32/float16 矩阵 (只追加)，通过 np.memmap 读取
+        keys.<dtype>.txt      # 每行一个文本哈希，第 i 行对应矩阵第 i 行 (只追加)
+
+写入顺序是先矩阵后 keys，查询时只返回矩阵中真实存在的行。进程在两次写入之间退出会留下
+没有 key 的行（或半行 key / 半行向量）；下一次以可写方式打开、或下一次追加时，在文件锁内
+把两个文件截断到一致的长度。
+
+检索服务以只读方式打开（read_only=True）：只查询构建时写入的语料向量，不把用户查询写进缓存，
+文件大小和每个 worker 的内存索引都以语料规模为上限。
+"""
+
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl  # POSIX 下用文件锁保证多进程追加的顺序一致
+except ImportError:  # Windows 开发环境：只有进程内锁
+    fcntl = None
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：合并空白字符并去除首尾空格（大小写敏感，和编码器输入保持一致）"""
+    return " ".join((text or "").split())
+
+
+class EmbeddingCache:
+    """mmap 的 embedding 矩阵 + hash -> row 索引"""
+
+    def __init__(self,
+                 cache_dir: str,
+                 model_name: str,
+                 dimensions: int,
+                 dtype: str = "float32",
+                 read_only: bool = False):
+        """
+        Args:
+            cache_dir: 缓存根目录
+            model_name: 模型名（不同模型的向量互不复用）
+            dimensions: 向量维度
+            dtype: 'float32' 或 'float16'（float16 体积减半，余弦相似度误差 ~1e-3）
+            read_only: 只查询，不写入也不修复（检索服务使用）；未命中的文本照常编码
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported cache dtype: {dtype}")
+
+        self.model_name = model_name
+        self.read_only = read_only
+        self.dimensions = int(dimensions)
+        self.dtype = np.dtype(dtype)
+        self._row_bytes = self.dimensions * self.dtype.itemsize
+
+        model_slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.cache_path = Path(cache_dir) / model_slug
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.vectors_file = self.cache_path / f"vectors.{dtype}.bin"
+        self.keys_file = self.cache_path / f"keys.{dtype}.txt"
+
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._rows = 0
+        self._key_count = 0  # keys 文件中已读取的行数（= 下一个 key 的行号）
+        self._keys_offset = 0  # keys.txt 已读取到的字节偏移
+        self._keys_inode = None  # 修复时 keys 文件被整体替换，inode 变化说明需要从头读取
+
+        self.hits = 0
+        self.misses = 0
+
+        with self._lock:
+            if read_only:
+                self._refresh()
+            else:
+                with self._file_lock():
+                    self._repair()
+
+    # ------------------------------------------------------------------
+    # 内部方法
+    # ------------------------------------------------------------------
+
+    def _key(self, text: str) -> str:
+        payload = f"{self.model_name}\0{normalize_text(text)}"
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _reset(self):
+        self._index = {}
+        self._matrix = None
+        self._rows = 0
+        self._key_count = 0
+        self._keys_offset = 0
+        self._keys_inode = None
+
+    def _refresh(self):
+        """读取其他进程追加的新 key，并重新映射矩阵（调用方需持有锁）"""
+        if self.keys_file.exists():
+            with open(self.keys_file, "r", encoding="utf-8") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if self._keys_inode is not None and inode != self._keys_inode:
+                    # 其他进程修复时替换了 keys 文件，从头重新读取
+                    self._reset()
+                self._keys_inode = inode
+                f.seek(self._keys_offset)
+                tail = f.read()
+            # 只消费完整的行，半行留给下一次 refresh
+            complete = tail[:tail.rfind("\n") + 1] if "\n" in tail else ""
+            self._keys_offset += len(complete.encode("utf-8"))
+            for key in complete.splitlines():
+                if key:
+                    self._index.setdefault(key, self._key_count)
+                    self._key_count += 1
+
+        rows = 0
+        if self.vectors_file.exists():
+            rows = self.vectors_file.stat().st_size // self._row_bytes
+        if rows and (self._matrix is None or self._matrix.shape[0] != rows):
+            self._matrix = np.memmap(self.vectors_file, dtype=self.dtype, mode="r",
+                                     shape=(rows, self.dimensions))
+        self._rows = rows
+
+    def _repair(self):
+        """
+        把 keys 和矩阵截断到一致的长度，然后重新读取（调用方需持有锁和文件锁）
+
+        崩溃可能留下: 没有 key 的向量行、不完整的向量行、没有换行符的半行 key。
+        只保留前 min(完整 key 数, 完整行数) 条。
+        """
+        key_bytes = self.keys_file.read_bytes() if self.keys_file.exists() else b""
+        complete = key_bytes[:key_bytes.rfind(b"\n") + 1]
+        key_lengths = [len(line) + 1 for line in complete.split(b"\n")[:-1]] if complete else []
+        vector_bytes = self.vectors_file.stat().st_size if self.vectors_file.exists() else 0
+        keep = min(len(key_lengths), vector_bytes // self._row_bytes)
+
+        keep_key_bytes = sum(key_lengths[:keep])
+        if len(key_bytes) != keep_key_bytes or vector_bytes != keep * self._row_bytes:
+            print(f"[WARN] Repairing embedding cache {self.cache_path}: "
+                  f"{len(key_lengths)} keys / {vector_bytes / self._row_bytes:.1f} rows -> {keep}")
+            if self.vectors_file.exists():
+                os.truncate(self.vectors_file, keep * self._row_bytes)
+            if len(key_bytes) != keep_key_bytes:
+                # 整体替换（新 inode）而不是原地截断：其他进程据此得知已读取的偏移失效
+                tmp = self.keys_file.with_suffix(".tmp")
+                tmp.write_bytes(key_bytes[:keep_key_bytes])
+                os.replace(tmp, self.keys_file)
+        self._reset()
+        self._refresh()
+
+    def _replaced(self) -> bool:
+        """keys 文件是否被其他进程的修复替换（旧索引里的行号可能已被重新分配）"""
+        try:
+            return self._keys_inode is not None and self.keys_file.stat().st_ino != self._keys_inode
+        except OSError:
+            return False
+
+    def _lookup(self, keys: Sequence[str]) -> List[Optional[int]]:
+        # 防御：只返回矩阵中真实存在的行
+        rows = [self._index.get(k) for k in keys]
+        return [r if r is not None and r < self._rows else None for r in rows]
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程互斥（build 脚本和多个 uvicorn worker 可能同时写）"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.cache_path / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        """追加新向量（调用方需持有锁）"""
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dimensions)
+        with self._file_lock():
+            # 加锁后再同步一次，跳过其他进程刚写入的 key
+            self._refresh()
+            if self._key_count != self._rows:
+                # 持有文件锁时没有别的写入者，不一致只可能是之前的写入中途退出
+                self._repair()
+            fresh = [i for i, k in enumerate(keys) if k not in self._index]
+            if not fresh:
+                return
+            with open(self.vectors_file, "ab") as f:
+                f.write(vectors[fresh].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_file, "a", encoding="utf-8") as f:
+                f.write("".join(f"{keys[i]}\n" for i in fresh))
+            self._refresh()
+
+    # ------------------------------------------------------------------
+    # 公共接口
+    # ------------------------------------------------------------------
+
+    def encode(self,
+               texts: Sequence[str],
+               encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        返回 texts 对应的向量矩阵 (len(texts), dimensions)，float32
+
+        只有缓存未命中的文本（去重后）才会交给 encode_fn 编码，结果写回缓存（read_only 时不写）。
+        """
+        if len(texts) == 0:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+
+        keys = [self._key(t) for t in texts]
+        with self._lock:
+            if self._replaced():
+                self._refresh()
+            rows = self._lookup(keys)
+            if any(r is None for r in rows):
+                # 其他进程可能已经写入了这些文本
+                self._refresh()
+                rows = self._lookup(keys)
+
+        missing: Dict[str, str] = {}
+        for key, row, text in zip(keys, rows, texts):
+            if row is None and key not in missing:
+                missing[key] = text
+
+        with self._lock:
+            self.hits += sum(1 for r in rows if r is not None)
+            self.misses += len(missing)
+
+        fresh: Dict[str, np.ndarray] = {}
+        if missing:
+            new_keys = list(missing.keys())
+            new_vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            fresh = dict(zip(new_keys, new_vectors))
+            if not self.read_only:
+                with self._lock:
+                    self._append(new_keys, new_vectors)
+
+        out = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        hit_positions = [i for i, r in enumerate(rows) if r is not None]
+        if hit_positions:
+            with self._lock:
+                matrix = self._matrix
+            out[hit_positions] = matrix[np.asarray([rows[i] for i in hit_positions], dtype=np.int64)]
+        for i, (key, row) in enumerate(zip(keys, rows)):
+            if row is None:
+                out[i] = fresh[key]
+        return out
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """只读查询，未命中返回 None"""
+        key = self._key(text)
+        with self._lock:
+            if self._replaced():
+                self._refresh()
+            row = self._lookup([key])[0]
+            if row is None:
+                return None
+            return np.asarray(self._matrix[row], dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "model_name": self.model_name,
+            "entries": len(self._index),
+            "dtype": str(self.dtype),
+            "read_only": self.read_only,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "path": str(self.cache_path),
+        }
@@ -0,0 +1,112 @@
+"""
+Packed, Fork-Friendly Storage for Read-Only Corpus Columns
+把 ids / 文档文本 / metadata 存成一整块 numpy 字节缓冲 + 偏移数组，而不是几万个 Python 对象
+
+gunicorn preload 之后 fork 出的 worker 与 master 共享内存页（copy-on-write）。
+Python 对象每次被访问都会改引用计数、被 GC 遍历时会写 gc 头，所在的页随之被复制到每个 worker；
+numpy 缓冲只有数据本身，读取不会写页，因此一直保持共享。
+访问时按需解码（每次返回新的 str / dict），适合"每次查询只取几十行"的访问模式。
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
+
+import numpy as np
+
+
+class PackedStrings:
+    """只读字符串序列：utf-8 字节缓冲 + int64 偏移"""
+
+    def __init__(self, strings: Sequence[str] = (), buffer: Optional[np.ndarray] = None,
+                 offsets: Optional[np.ndarray] = None):
+        if buffer is not None and offsets is not None:
+            self._buffer = buffer
+            self._offsets = offsets
+            return
+        encoded = [(s or "").encode("utf-8") for s in strings]
+        self._offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            self._offsets[1:] = np.cumsum([len(b) for b in encoded])
+        self._buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8).copy()
+
+    @classmethod
+    def from_joined(cls, buffer: np.ndarray, separator: bytes = b"\n") -> "PackedStrings":
+        """从 '\\n' 拼接的字节缓冲构造（不复制数据，例如 BM25 postings 文件里的 ids）"""
+        buffer = np.asarray(buffer, dtype=np.uint8)
+        if len(buffer) == 0:
+            return cls(buffer=buffer, offsets=np.zeros(1, dtype=np.int64))
+        breaks = np.flatnonzero(buffer == separator[0])
+        # 第 i 个字符串占 [starts[i], ends[i])，分隔符不计入
+        starts = np.concatenate(([0], breaks + 1))
+        ends = np.concatenate((breaks, [len(buffer)]))
+        packed = cls.__new__(cls)
+        packed._buffer = buffer
+        packed._offsets = None
+        packed._starts = starts.astype(np.int64)
+        packed._ends = ends.astype(np.int64)
+        return packed
+
+    def _span(self, i: int):
+        if self._offsets is None:
+            return self._starts[i], self._ends[i]
+        return self._offsets[i], self._offsets[i + 1]
+
+    def __len__(self) -> int:
+        return len(self._starts) if self._offsets is None else len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+        start, end = self._span(i)
+        return self._buffer[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self) -> int:
+        offsets = (self._starts.nbytes + self._ends.nbytes) if self._offsets is None else self._offsets.nbytes
+        return int(self._buffer.nbytes + offsets)
+
+
+class PackedRecords(PackedStrings):
+    """只读 dict 序列：每条记录存成 JSON 文本，访问时解码"""
+
+    def __init__(self, records: Sequence[Dict[str, Any]] = (),
+                 dumps: Callable[[Any], str] = json.dumps):
+        super().__init__([dumps(r or {}, ensure_ascii=False, separators=(",", ":")) for r in records])
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        return json.loads(super().__getitem__(i))
+
+
+class PackedIdLookup:
+    """id -> 行号：按字典序排列的定长字节数组 + searchsorted（替代 dict[str, int]）"""
+
+    def __init__(self, ids: Sequence[str]):
+        encoded = np.array([i.encode("utf-8") for i in ids], dtype=bytes) if len(ids) else np.array([], dtype="S1")
+        self._order = np.argsort(encoded, kind="stable")
+        self._sorted = encoded[self._order]
+
+    def get(self, doc_id: str, default: Optional[int] = None) -> Optional[int]:
+        key = doc_id.encode("utf-8")
+        if len(self._sorted) == 0 or len(key) > self._sorted.dtype.itemsize:
+            return default
+        pos = int(np.searchsorted(self._sorted, key))
+        if pos < len(self._sorted) and self._sorted[pos] == key:
+            return int(self._order[pos])
+        return default
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.get(doc_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._order.nbytes + self._sorted.nbytes)
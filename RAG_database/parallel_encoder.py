@@ -0,0 +1,123 @@
+"""
+Multi-process CPU Encoder for the Vector Store Build
+每个 worker 进程持有一份 SentenceTransformer，按长度分桶后的小批次并行编码
+
+在纯 CPU 的构建机上，单进程 encode 只能用到 torch 的 intra-op 并行；
+多进程 + 每个进程少量线程可以随核数线性扩展。
+"""
+
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# --- worker 进程内的全局状态（每个进程一份模型） ---
+_WORKER_MODEL = None
+_WORKER_BATCH_SIZE = 32
+
+
+def _init_worker(model_name: str, batch_size: int, num_threads: int):
+    """进程池 initializer：限制线程数并加载模型"""
+    global _WORKER_MODEL, _WORKER_BATCH_SIZE
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(num_threads)
+    _WORKER_BATCH_SIZE = batch_size
+    _WORKER_MODEL = SentenceTransformer(model_name, device='cpu')
+
+
+def _worker_dimension() -> int:
+    return _WORKER_MODEL.get_sentence_embedding_dimension()
+
+
+def _worker_max_seq_length() -> int:
+    return int(_WORKER_MODEL.max_seq_length)
+
+
+def _worker_encode(texts: List[str]) -> np.ndarray:
+    embeddings = _WORKER_MODEL.encode(
+        texts,
+        batch_size=_WORKER_BATCH_SIZE,
+        show_progress_bar=False,
+        convert_to_numpy=True
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def length_bucketed_batches(lengths: Sequence[int], batch_size: int) -> List[List[int]]:
+    """
+    按长度（通常是 token 数）排序后切批，返回每个批次在原始列表中的下标
+
+    短的 "Prerequisites for X" 分块和长的 overview 不会落在同一个批次里，
+    避免短文本被 padding 到长文本的长度。
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+class MultiProcessEncoder:
+    """SentenceTransformer 进程池"""
+
+    def __init__(self,
+                 model_name: str,
+                 workers: int,
+                 batch_size: int = 32,
+                 threads_per_worker: Optional[int] = None):
+        """
+        Args:
+            model_name: 模型名（每个 worker 各自加载）
+            workers: worker 进程数
+            batch_size: 每个任务（一个长度桶）的文本数
+            threads_per_worker: 每个 worker 的 torch 线程数，默认 cpu_count // workers
+        """
+        self.model_name = model_name
+        self.workers = max(1, int(workers))
+        self.batch_size = batch_size
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+
+        print(f"Starting {self.workers} encoder workers "
+              f"({self.threads_per_worker} torch threads each, model={model_name})...")
+        # spawn：避免 fork 已初始化的 torch 线程池
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, batch_size, self.threads_per_worker)
+        )
+        self.dimensions = self._executor.submit(_worker_dimension).result()
+        self.max_seq_length = self._executor.submit(_worker_max_seq_length).result()
+        print(f"[OK] Encoder workers ready. Dimensions: {self.dimensions}, max_seq_length: {self.max_seq_length}")
+
+    def encode(self, texts: Sequence[str], lengths: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        并行编码，返回与 texts 顺序一致的 (n, dim) float32 矩阵
+
+        Args:
+            lengths: 每个文本的 token 数（用于分桶），缺省时用字符数近似
+        """
+        out = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        if len(texts) == 0:
+            return out
+
+        if lengths is None:
+            lengths = [len(t) for t in texts]
+        buckets = length_bucketed_batches(lengths, self.batch_size)
+        futures = [
+            self._executor.submit(_worker_encode, [texts[i] for i in idx])
+            for idx in buckets
+        ]
+        for idx, future in zip(buckets, futures):
+            out[idx] = future.result()
+        return out
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,105 @@
+"""
+Query Encoder Backends
+按配置加载查询编码器：PyTorch fp32（默认）、PyTorch 动态 int8 量化、ONNX Runtime（可选 int8 量化）
+
+所有后端都通过 SentenceTransformer 加载，tokenizer / pooling / normalize 模块完全相同，
+只替换 transformer 的推理部分，因此分词结果一致，输出向量与 fp32 的余弦相似度在容差内
+（见 backend/test/test_encoder_parity.py）。
+
+    torch       SentenceTransformer fp32（与 build_vector_store.py 完全一致）
+    torch-int8  torch.quantization.quantize_dynamic，把 nn.Linear 换成 int8（只支持 CPU）
+    onnx        sentence-transformers 的 ONNX 后端（需要 optimum[onnxruntime]）
+    onnx-int8   ONNX + onnxruntime 动态 int8 量化，首次使用时导出到 export_dir
+"""
+
+import re
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+ENCODER_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+def _load_torch_int8(model_name: str) -> SentenceTransformer:
+    model = SentenceTransformer(model_name, device="cpu")
+    # 只量化 transformer 里的 Linear 层（权重 int8，激活在运行时动态量化）
+    quantized = torch.quantization.quantize_dynamic(model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8)
+    model[0].auto_model = quantized
+    return model
+
+
+def _load_onnx_int8(model_name: str, export_dir: Path, quantization_config: str) -> SentenceTransformer:
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    model_dir = export_dir / re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    file_suffix = f"qint8_{quantization_config}"
+    onnx_file = f"onnx/model_{file_suffix}.onnx"
+
+    if not (model_dir / onnx_file).exists():
+        print(f"Exporting int8 ONNX model to {model_dir} (one-time)...")
+        model_dir.mkdir(parents=True, exist_ok=True)
+        onnx_model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        onnx_model.save(str(model_dir))
+        export_dynamic_quantized_onnx_model(
+            onnx_model, quantization_config, str(model_dir), file_suffix=file_suffix
+        )
+
+    return SentenceTransformer(
+        str(model_dir), backend="onnx", device="cpu", model_kwargs={"file_name": onnx_file}
+    )
+
+
+def load_query_encoder(model_name: str,
+                       backend: str = "torch",
+                       device: Optional[str] = None,
+                       export_dir: Optional[str] = None,
+                       quantization_config: str = "avx2") -> Tuple[SentenceTransformer, str]:
+    """
+    加载查询编码器，失败时退回 fp32 PyTorch
+
+    Args:
+        model_name: 模型名（必须与 build_vector_store.py 一致）
+        backend: ENCODER_BACKENDS 之一
+        device: 'cuda' / 'cpu'，默认自动选择（量化后端只用 CPU）
+        export_dir: onnx-int8 导出目录，默认 <project>/course_data/onnx_models
+        quantization_config: onnx-int8 的量化配置 ('avx2' / 'avx512' / 'avx512_vnni' / 'arm64')
+
+    Returns:
+        (SentenceTransformer, 实际使用的后端名)
+    """
+    if backend not in ENCODER_BACKENDS:
+        print(f"[WARN] Unknown encoder backend '{backend}', using 'torch'.")
+        backend = "torch"
+
+    if backend != "torch":
+        start = time.time()
+        try:
+            if backend == "torch-int8":
+                model = _load_torch_int8(model_name)
+            elif backend == "onnx":
+                model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+            else:
+                export_root = Path(export_dir) if export_dir else (
+                    Path(__file__).resolve().parent.parent / "course_data" / "onnx_models"
+                )
+                model = _load_onnx_int8(model_name, export_root, quantization_config)
+            print(f"[OK] Query encoder backend '{backend}' loaded in {time.time() - start:.2f}s")
+            return model, backend
+        except Exception as e:
+            print(f"[WARN] Failed to load encoder backend '{backend}', falling back to fp32 torch: {e}")
+
+    device_to_use = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    print(f"Using device: {device_to_use}")
+    return SentenceTransformer(model_name, device=device_to_use), "torch"
+
+
+def encoder_cache_key(model_name: str, backend: str) -> str:
+    """
+    embedding 缓存的模型键：量化后端的向量与 fp32 略有差异，单独缓存，
+    避免 build 脚本（fp32）复用到量化后的向量
+    """
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
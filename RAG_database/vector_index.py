@@ -0,0 +1,480 @@
+"""
+In-process Vector Index for the Course Collection
+启动时从 Chroma 导出一次全部向量，之后的 top-k 查询完全在内存里完成
+
+语料最多几万个分块，一次矩阵-向量乘 + argpartition 就能得到精确 top-k，
+不再需要每次查询都经过 Chroma 的 SQLite 往返和 metadata 反序列化。
+Chroma 仍然是唯一的数据源（build_vector_store.py 只写 Chroma）。
+
+两种模式:
+    - brute force (ivf_lists=0): 精确检索
+    - IVF (ivf_lists>0): 球面 k-means 聚类，查询时只扫描最近的 nprobe 个簇（近似检索，适合更大的语料）
+
+存储精度:
+    - float32: 直接走 BLAS
+    - float16 / int8: 内存减半 / 减到 1/4，打分时按块转回 float32（速度略慢于 float32）
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from .packed_storage import PackedIdLookup, PackedRecords, PackedStrings
+except ImportError:
+    from packed_storage import PackedIdLookup, PackedRecords, PackedStrings
+
+# float16/int8 打分时每次转换的行数（限制临时 float32 块的大小）
+_SCORE_BLOCK_ROWS = 8192
+# 过滤后剩余行占比超过该值时，直接全量打分再屏蔽（BLAS 比 gather 子矩阵更快）
+_DENSE_MASK_FRACTION = 0.3
+
+
+class MetadataFilterIndex:
+    """
+    列式 metadata 过滤索引：查询前把过滤条件解析成候选行的布尔掩码
+
+    支持 VectorSearch._build_where_filter 的全部条件:
+        source_type / study_level / major_code: 每个取值一个 bitmap（单值或列表）
+        level / min_level / max_level: 按 level 排序的行号数组 + searchsorted
+        offering_term: 每个学期一个 bitmap（offering_terms 存的是 "T1, T2" 字符串）
+
+    语义与 Chroma 的 where 一致：缺少该字段的文档不会被任何针对该字段的条件匹配。
+    每种过滤组合的掩码会被缓存（LRU），重复的过滤查询不再重新计算。
+    """
+
+    EQUALITY_FIELDS = ("source_type", "study_level", "major_code")
+    SUPPORTED_FILTERS = EQUALITY_FIELDS + ("level", "min_level", "max_level", "offering_term")
+
+    def __init__(self, metadatas: Sequence[Dict[str, Any]], cache_size: int = 256):
+        start = time.time()
+        self.num_rows = len(metadatas)
+        self.cache_size = cache_size
+
+        values: Dict[str, Dict[Any, List[int]]] = {field: {} for field in self.EQUALITY_FIELDS}
+        term_rows: Dict[str, List[int]] = {}
+        level_rows, level_values = [], []
+        for row, meta in enumerate(metadatas):
+            for field in self.EQUALITY_FIELDS:
+                if field in meta:
+                    values[field].setdefault(meta[field], []).append(row)
+            if isinstance(meta.get("level"), (int, float)):
+                level_rows.append(row)
+                level_values.append(meta["level"])
+            terms = meta.get("offering_terms")
+            if isinstance(terms, str):
+                for term in terms.split(","):
+                    term = term.strip()
+                    if term:
+                        term_rows.setdefault(term, []).append(row)
+
+        self._bitmaps: Dict[str, Dict[Any, np.ndarray]] = {
+            field: {value: self._rows_to_mask(rows) for value, rows in by_value.items()}
+            for field, by_value in values.items()
+        }
+        self._term_bitmaps = {term: self._rows_to_mask(rows) for term, rows in term_rows.items()}
+
+        order = np.argsort(np.asarray(level_values, dtype=np.float64), kind="stable")
+        self._level_rows = np.asarray(level_rows, dtype=np.int64)[order]
+        self._level_sorted = np.asarray(level_values, dtype=np.float64)[order]
+
+        self._cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        print(f"  [OK] Metadata filter index: {sum(len(v) for v in self._bitmaps.values())} value bitmaps, "
+              f"{len(self._term_bitmaps)} term bitmaps, {len(self._level_rows)} leveled rows "
+              f"({time.time() - start:.2f}s)")
+
+    def _rows_to_mask(self, rows) -> np.ndarray:
+        mask = np.zeros(self.num_rows, dtype=bool)
+        mask[np.asarray(rows, dtype=np.int64)] = True
+        return mask
+
+    def _value_mask(self, bitmaps: Dict[Any, np.ndarray], value) -> np.ndarray:
+        """单值或列表 ($in) 的并集"""
+        mask = np.zeros(self.num_rows, dtype=bool)
+        for v in (value if isinstance(value, (list, tuple, set)) else [value]):
+            bitmap = bitmaps.get(v)
+            if bitmap is not None:
+                mask |= bitmap
+        return mask
+
+    def _level_mask(self, lo: float = -np.inf, hi: float = np.inf) -> np.ndarray:
+        start = np.searchsorted(self._level_sorted, lo, side="left")
+        end = np.searchsorted(self._level_sorted, hi, side="right")
+        return self._rows_to_mask(self._level_rows[start:end])
+
+    @staticmethod
+    def _cache_key(filters: Dict[str, Any]) -> tuple:
+        return tuple(sorted(
+            (k, tuple(sorted(map(str, v))) if isinstance(v, (list, tuple, set)) else v)
+            for k, v in filters.items()
+        ))
+
+    def supports(self, filters: Dict[str, Any]) -> bool:
+        return all(k in self.SUPPORTED_FILTERS for k in filters)
+
+    def _compute(self, filters: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(self.num_rows, dtype=bool)
+        for field in self.EQUALITY_FIELDS:
+            if field in filters:
+                mask &= self._value_mask(self._bitmaps[field], filters[field])
+        if "level" in filters:
+            levels = filters["level"]
+            level_mask = np.zeros(self.num_rows, dtype=bool)
+            for level in (levels if isinstance(levels, (list, tuple, set)) else [levels]):
+                level_mask |= self._level_mask(level, level)
+            mask &= level_mask
+        if "min_level" in filters or "max_level" in filters:
+            mask &= self._level_mask(filters.get("min_level", -np.inf), filters.get("max_level", np.inf))
+        if "offering_term" in filters:
+            mask &= self._value_mask(self._term_bitmaps, filters["offering_term"])
+        return mask
+
+    def mask(self, **filters) -> np.ndarray:
+        """过滤条件 -> 只读布尔掩码 (num_rows,)，按过滤组合缓存"""
+        key = self._cache_key(filters)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+        mask = self._compute(filters)
+        mask.setflags(write=False)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = mask
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return mask
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "cached_masks": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class InMemoryVectorIndex:
+    """归一化向量矩阵 + 文档/metadata 列表"""
+
+    def __init__(self,
+                 ids: Sequence[str],
+                 documents: Sequence[str],
+                 metadatas: Sequence[Dict[str, Any]],
+                 embeddings,
+                 dtype: str = "float32",
+                 space: str = "l2",
+                 ivf_lists: int = 0,
+                 nprobe: int = 8,
+                 seed: int = 0,
+                 packed: bool = False):
+        """
+        Args:
+            ids / documents / metadatas / embeddings: 与 Chroma collection.get() 的返回一一对应
+            dtype: 矩阵存储精度 'float32' / 'float16' / 'int8'
+            space: Chroma 的距离度量 ('l2' / 'cosine' / 'ip')，返回的 distance 与 Chroma 一致
+            ivf_lists: IVF 簇数，0 表示精确的 brute force
+            nprobe: IVF 查询时扫描的簇数
+            packed: 把 ids / documents / metadatas 存成 numpy 字节缓冲（见 packed_storage），
+                    preload + fork 的多 worker 部署下这些列保持 copy-on-write 共享
+        """
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+        if space not in ("l2", "cosine", "ip"):
+            raise ValueError(f"Unsupported distance space: {space}")
+
+        self.ids: List[str] = list(ids)
+        self.documents: List[str] = [d or "" for d in documents]
+        self.metadatas: List[Dict[str, Any]] = [m or {} for m in metadatas]
+        self.row_by_id: Dict[str, int] = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.filters = MetadataFilterIndex(self.metadatas)
+        self.packed = bool(packed)
+        if self.packed:
+            # 过滤索引已经建好，原始对象列表可以丢弃
+            self.ids = PackedStrings(self.ids)
+            self.documents = PackedStrings(self.documents)
+            self.metadatas = PackedRecords(self.metadatas)
+            self.row_by_id = PackedIdLookup(list(self.ids))
+        self.dtype = dtype
+        self.space = space
+        self.nprobe = max(1, int(nprobe))
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(self.ids), -1)
+        self.dimensions = matrix.shape[1] if matrix.size else 0
+
+        # 原始范数（l2 / ip 度量需要），矩阵本身存单位向量
+        self._norms = np.linalg.norm(matrix, axis=1).astype(np.float32)
+        unit = matrix / np.maximum(self._norms, 1e-12)[:, None]
+
+        self._scales: Optional[np.ndarray] = None
+        if dtype == "int8":
+            # 按行对称量化：x ≈ q * scale
+            scales = np.maximum(np.abs(unit).max(axis=1), 1e-12) / 127.0
+            self._matrix = np.round(unit / scales[:, None]).astype(np.int8)
+            self._scales = scales.astype(np.float32)
+        else:
+            self._matrix = np.ascontiguousarray(unit, dtype=dtype)
+
+        # IVF: 簇中心 + CSR 形式的倒排表（_list_rows[_list_offsets[c]:_list_offsets[c+1]]）
+        self._centroids: Optional[np.ndarray] = None
+        self._list_rows: Optional[np.ndarray] = None
+        self._list_offsets: Optional[np.ndarray] = None
+        if ivf_lists and len(self.ids) > ivf_lists:
+            self._train_ivf(int(ivf_lists), seed=seed)
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_chroma(cls, collection, page_size: int = 5000, **kwargs) -> "InMemoryVectorIndex":
+        """分页导出 Chroma collection（向量 + 文档 + metadata）"""
+        start = time.time()
+        total = collection.count()
+        ids, documents, metadatas, embeddings = [], [], [], []
+        for offset in range(0, total, page_size):
+            page = collection.get(
+                limit=page_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+            embeddings.extend(page["embeddings"])
+
+        if "space" not in kwargs:
+            kwargs["space"] = ((getattr(collection, "metadata", None) or {}).get("hnsw:space") or "l2")
+        index = cls(ids, documents, metadatas, embeddings, **kwargs)
+        mode = f"IVF({index.num_lists} lists, nprobe={index.nprobe})" if index.is_ivf else "brute force"
+        print(f"[OK] In-memory vector index: {len(index)} vectors, {index.dtype}, {mode}, "
+              f"exported in {time.time() - start:.2f}s")
+        return index
+
+    def _as_float32(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """把（部分）矩阵转成 float32 单位向量"""
+        block = self._matrix if rows is None else self._matrix[rows]
+        block = block.astype(np.float32, copy=False)
+        if self._scales is not None:
+            scales = self._scales if rows is None else self._scales[rows]
+            block = block * scales[:, None]
+        return block
+
+    def _train_ivf(self, nlist: int, iters: int = 10, seed: int = 0, sample_per_list: int = 256):
+        """球面 k-means：在采样上训练簇中心，再把所有向量分配到最近的簇"""
+        start = time.time()
+        n = len(self.ids)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n, size=min(n, nlist * sample_per_list), replace=False))
+        sample = self._as_float32(sample_rows)
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # 空簇用随机样本重新播种
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1), 1e-12)[:, None]
+
+        assign = np.empty(n, dtype=np.int64)
+        for start_row in range(0, n, _SCORE_BLOCK_ROWS):
+            rows = np.arange(start_row, min(start_row + _SCORE_BLOCK_ROWS, n))
+            assign[rows] = np.argmax(self._as_float32(rows) @ centroids.T, axis=1)
+
+        self._centroids = centroids.astype(np.float32)
+        self._list_rows = np.argsort(assign, kind="stable")
+        self._list_offsets = np.searchsorted(assign[self._list_rows], np.arange(nlist + 1))
+        print(f"  [OK] IVF trained: {nlist} lists in {time.time() - start:.2f}s")
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    @property
+    def is_ivf(self) -> bool:
+        return self._centroids is not None
+
+    @property
+    def num_lists(self) -> int:
+        return 0 if self._centroids is None else len(self._centroids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _cosine(self, query_unit: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """单位查询向量 (dim,) 或矩阵 (dim, m) 与（部分）矩阵行的余弦相似度"""
+        if self.dtype == "float32" and self._scales is None:
+            block = self._matrix if rows is None else self._matrix[rows]
+            return block @ query_unit
+
+        n = len(self.ids) if rows is None else len(rows)
+        out = np.empty((n,) + query_unit.shape[1:], dtype=np.float32)
+        for start in range(0, n, _SCORE_BLOCK_ROWS):
+            end = min(start + _SCORE_BLOCK_ROWS, n)
+            block_rows = np.arange(start, end) if rows is None else rows[start:end]
+            out[start:end] = self._as_float32(block_rows) @ query_unit
+        return out
+
+    def _distances(self, cosine: np.ndarray, norms: np.ndarray, query_norm) -> np.ndarray:
+        """余弦相似度 -> Chroma 度量下的距离（cosine 为 (n,) 或 (n, m)，query_norm 为标量或 (m,)）"""
+        if cosine.ndim == 2:
+            norms = norms[:, None]
+        if self.space == "cosine":
+            return 1.0 - cosine
+        if self.space == "ip":
+            return 1.0 - query_norm * norms * cosine
+        return np.maximum(query_norm ** 2 + norms ** 2 - 2.0 * query_norm * norms * cosine, 0.0)
+
+    def _resolve_mask(self, mask: Optional[np.ndarray]):
+        """
+        掩码 -> (rows, masked_out, matched)
+            rows: 需要 gather 打分的行（None 表示全量打分）
+            masked_out: 全量打分后需要屏蔽的行（None 表示不屏蔽）
+        """
+        if mask is None:
+            return None, None, len(self.ids)
+        matched = int(np.count_nonzero(mask))
+        if matched >= _DENSE_MASK_FRACTION * len(self.ids):
+            # 宽松的过滤：全量打分后屏蔽，比 gather 子矩阵便宜
+            return None, ~mask, matched
+        return np.flatnonzero(mask), None, matched
+
+    def _candidate_rows(self, query_unit: np.ndarray) -> np.ndarray:
+        """IVF: 最近 nprobe 个簇的所有行"""
+        centroid_scores = self._centroids @ query_unit
+        probe = min(self.nprobe, len(centroid_scores))
+        lists = np.argpartition(-centroid_scores, probe - 1)[:probe]
+        return np.concatenate([
+            self._list_rows[self._list_offsets[c]:self._list_offsets[c + 1]] for c in lists
+        ])
+
+    def search(self,
+               query_embedding,
+               top_k: int = 5,
+               mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Args:
+            query_embedding: 查询向量（未归一化也可以）
+            top_k: 返回条数
+            mask: 可选的布尔数组 (len(self),)，只在 True 的行里检索（通常来自 self.filters.mask(...)）
+
+        Returns:
+            [(row, distance), ...]，按 distance 升序（distance 与 Chroma 的度量一致）
+        """
+        if len(self.ids) == 0 or top_k <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        query_norm = float(np.linalg.norm(query))
+        query_unit = query / max(query_norm, 1e-12)
+
+        rows = None
+        if self.is_ivf:
+            rows = self._candidate_rows(query_unit)
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) < top_k:
+                # 探测的簇里候选太少（常见于强过滤），退回到精确检索
+                rows = None
+        masked_out = None
+        if rows is None:
+            rows, masked_out, matched = self._resolve_mask(mask)
+            top_k = min(top_k, matched)
+        if top_k <= 0 or (rows is not None and len(rows) == 0):
+            return []
+
+        cosine = self._cosine(query_unit, rows)
+        distances = self._distances(cosine, self._norms if rows is None else self._norms[rows], query_norm)
+        if masked_out is not None:
+            distances[masked_out] = np.inf
+
+        k = min(top_k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind="stable")]
+        row_ids = top if rows is None else rows[top]
+        return [(int(r), float(distances[t])) for r, t in zip(row_ids, top)]
+
+    def search_many(self,
+                    query_embeddings,
+                    top_k: int = 5,
+                    mask: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """
+        批量查询：所有查询共用一次矩阵-矩阵乘（IVF 模式下各查询的候选簇不同，逐个查询）
+
+        Returns:
+            每个查询一个 [(row, distance), ...] 列表，与 search() 的结果相同
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        if self.is_ivf or len(queries) <= 1:
+            return [self.search(q, top_k, mask=mask) for q in queries]
+        if len(self.ids) == 0 or top_k <= 0:
+            return [[] for _ in queries]
+
+        query_norms = np.linalg.norm(queries, axis=1)
+        query_units = queries / np.maximum(query_norms, 1e-12)[:, None]
+
+        rows, masked_out, matched = self._resolve_mask(mask)
+        k = min(top_k, matched)
+        if k <= 0 or (rows is not None and len(rows) == 0):
+            return [[] for _ in queries]
+
+        cosine = self._cosine(query_units.T, rows)  # (n, m)
+        distances = self._distances(cosine, self._norms if rows is None else self._norms[rows], query_norms[None, :])
+        if masked_out is not None:
+            distances[masked_out, :] = np.inf
+
+        n = distances.shape[0]
+        top = np.argpartition(distances, k - 1, axis=0)[:k] if k < n else np.tile(np.arange(n)[:, None], (1, len(queries)))
+        top_distances = np.take_along_axis(distances, top, axis=0)
+        order = np.argsort(top_distances, axis=0, kind="stable")
+        top = np.take_along_axis(top, order, axis=0)
+        top_distances = np.take_along_axis(top_distances, order, axis=0)
+        row_ids = top if rows is None else rows[top]
+
+        return [
+            [(int(r), float(d)) for r, d in zip(row_ids[:, j], top_distances[:, j])]
+            for j in range(len(queries))
+        ]
+
+    def get_by_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        row = self.row_by_id.get(doc_id)
+        if row is None:
+            return None
+        return {"id": doc_id, "text": self.documents[row], "metadata": dict(self.metadatas[row])}
+
+    def columns_nbytes(self) -> int:
+        """packed 模式下 ids / documents / metadatas / id 查找表占用的字节数"""
+        if not self.packed:
+            return 0
+        return self.ids.nbytes + self.documents.nbytes + self.metadatas.nbytes + self.row_by_id.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "vectors": len(self.ids),
+            "dimensions": self.dimensions,
+            "dtype": self.dtype,
+            "space": self.space,
+            "mode": "ivf" if self.is_ivf else "brute_force",
+            "ivf_lists": self.num_lists,
+            "nprobe": self.nprobe,
+            "matrix_mb": round(self._matrix.nbytes / 1e6, 2),
+            "packed_columns_mb": round(self.columns_nbytes() / 1e6, 2) if self.packed else None,
+            "filter_cache": self.filters.stats(),
+        }
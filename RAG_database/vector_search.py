@@ -4,15 +4,41 @@ Vector Search Interface for UNSW Course Data
 """
 
 import os
+import json
+import hashlib
+import time
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 # from openai import OpenAI # No longer needed
 # from dotenv import load_dotenv # No longer needed
-from sentence_transformers import SentenceTransformer
-import torch
+
+try:
+    from .embedding_cache import EmbeddingCache
+except ImportError:
+    try:
+        from RAG_database.embedding_cache import EmbeddingCache
+    except ImportError:
+        from embedding_cache import EmbeddingCache
+
+try:
+    from .query_encoder import load_query_encoder, encoder_cache_key
+except ImportError:
+    try:
+        from RAG_database.query_encoder import load_query_encoder, encoder_cache_key
+    except ImportError:
+        from query_encoder import load_query_encoder, encoder_cache_key
+
+try:
+    from .vector_index import InMemoryVectorIndex
+except ImportError:
+    try:
+        from RAG_database.vector_index import InMemoryVectorIndex
+    except ImportError:
+        from vector_index import InMemoryVectorIndex
 
 
 @dataclass
@@ -41,7 +67,15 @@ class VectorSearch:
     def __init__(self,
                  persist_directory: str,
                  model_name: str = 'BAAI/bge-large-en-v1.5',
-                 collection_name: str = "unsw_courses"):
+                 collection_name: str = "unsw_courses",
+                 cache_dir: Optional[str] = None,
+                 cache_dtype: str = "float32",
+                 index_backend: str = "chroma",
+                 index_dtype: str = "float32",
+                 ivf_lists: int = 0,
+                 ivf_nprobe: int = 8,
+                 similar_table_path: Optional[str] = None,
+                 encoder_backend: str = "torch"):
         """
         [MODIFIED] Initialize vector search with local SentenceTransformer
         
@@ -49,18 +83,39 @@ class VectorSearch:
             persist_directory: Chroma database directory
             model_name: Local embedding model name (must match builder)
             collection_name: Collection name
+            cache_dir: Persistent embedding cache directory (shared with the builder), None to disable
+            cache_dtype: Cache matrix precision, 'float32' or 'float16'
+            index_backend: 'chroma' (query Chroma directly), 'numpy' (in-memory brute force)
+                           or 'ivf' (in-memory clustered, approximate)
+            index_dtype: In-memory matrix precision, 'float32' / 'float16' / 'int8'
+            ivf_lists: Number of IVF clusters (0 = sqrt(N)), only used by 'ivf'
+            ivf_nprobe: Clusters scanned per query, only used by 'ivf'
+            similar_table_path: Precomputed similar-course table (JSON), loaded if it exists
+            encoder_backend: Query encoder backend, 'torch' / 'torch-int8' / 'onnx' / 'onnx-int8'
         """
         self.persist_directory = Path(persist_directory)
         self.collection_name = collection_name
         self.model_name = model_name
 
-        # Initialize local model
-        print(f"Loading local embedding model: {self.model_name}...")
-        device_to_use = 'cuda' if torch.cuda.is_available() else 'cpu'
-        print(f"Using device: {device_to_use}")
-        self.model = SentenceTransformer(self.model_name, device=device_to_use)
+        # Initialize local model (optionally quantized, see query_encoder.py)
+        print(f"Loading local embedding model: {self.model_name} (backend={encoder_backend})...")
+        self.model, self.encoder_backend = load_query_encoder(self.model_name, encoder_backend)
         self.dimensions = self.model.get_sentence_embedding_dimension()
         print(f"[OK] Local model loaded. Dimensions: {self.dimensions}")
+
+        # Persistent embedding cache (same layout as the builder's, so stored
+        # document texts, e.g. in find_similar_courses, are cache hits).
+        # Read-only: user queries are not written, the cache stays corpus-sized
+        self.embedding_cache = None
+        if cache_dir:
+            try:
+                self.embedding_cache = EmbeddingCache(
+                    cache_dir, encoder_cache_key(self.model_name, self.encoder_backend),
+                    self.dimensions, dtype=cache_dtype, read_only=True
+                )
+                print(f"[OK] Embedding cache loaded: {len(self.embedding_cache)} entries")
+            except Exception as e:
+                print(f"[WARN] Failed to open embedding cache: {e}")
         
         # Initialize Chroma client
         self.chroma_client = chromadb.PersistentClient(
@@ -75,9 +130,36 @@ class VectorSearch:
         except Exception as e:
             raise RuntimeError(f"Failed to load collection '{collection_name}': {e}")
 
+        # In-memory index: exported from Chroma once, Chroma stays the source of truth
+        self.index = None
+        if index_backend in ("numpy", "ivf"):
+            try:
+                lists = 0
+                if index_backend == "ivf":
+                    lists = ivf_lists or int(self.collection.count() ** 0.5)
+                self.index = InMemoryVectorIndex.from_chroma(
+                    self.collection, dtype=index_dtype, ivf_lists=lists, nprobe=ivf_nprobe
+                )
+            except Exception as e:
+                print(f"[WARN] Failed to build in-memory index, falling back to Chroma queries: {e}")
+                self.index = None
+
+        # Precomputed similar-course table (see build_similar_courses_table)
+        self.similar_table: Dict[str, List[List[Any]]] = {}
+        self._overview_mask: Optional[np.ndarray] = None
+        self._similar_docs: Dict[str, Any] = {}
+        self._similar_keys: Dict[Any, str] = {}
+        if similar_table_path:
+            self.load_similar_courses_table(similar_table_path)
+
     def _get_query_embedding(self, query: str) -> List[float]:
         """[MODIFIED] Get embedding for query text using local model"""
         try:
+            if self.embedding_cache is not None:
+                return self.embedding_cache.encode(
+                    [query],
+                    lambda texts: self.model.encode(texts, show_progress_bar=False)
+                )[0].tolist()
             # self.model.encode returns a list of numpy arrays
             embedding_array = self.model.encode([query], show_progress_bar=False)
             # Get the first (and only) embedding and convert to list
@@ -145,6 +227,15 @@ class VectorSearch:
         
         return None
 
+    def _get_query_embeddings(self, queries: List[str]):
+        """Batch query embeddings: one model.encode call for all cache misses"""
+        if self.embedding_cache is not None:
+            return self.embedding_cache.encode(
+                queries,
+                lambda texts: self.model.encode(texts, show_progress_bar=False)
+            )
+        return self.model.encode(list(queries), show_progress_bar=False)
+
     def search(self,
                query: str,
                top_k: int = 5,
@@ -155,29 +246,80 @@ class VectorSearch:
         """
         # Get query embedding
         query_embedding = self._get_query_embedding(query)
+        return self.search_by_embedding(query_embedding, top_k, query=query, **filters)
+
+    def search_by_embedding(self,
+                            embedding,
+                            top_k: int = 5,
+                            query: str = "",
+                            **filters) -> SearchResponse:
+        """
+        Search with a precomputed embedding (e.g. a document's stored vector)
+
+        Args:
+            embedding: Query vector, same model/dimensions as the collection
+            query: Label reported in SearchResponse.query
+        """
+        # In-memory index: filters resolve to a cached candidate mask before scoring
+        if self.index is not None and self.index.filters.supports(filters):
+            mask = self.index.filters.mask(**filters) if filters else None
+            hits = self.index.search(embedding, top_k, mask=mask)
+            return self._index_response(query, hits, filters)
         
         # Build filter
         where_filter = self._build_where_filter(**filters)
         
         # Query Chroma
         results = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=[list(map(float, embedding))],
             n_results=top_k,
             where=where_filter,
             include=["documents", "metadatas", "distances"]
         )
-        
-        # Parse results
+        return self._chroma_response(query, results, 0, filters)
+
+    def search_many(self,
+                    queries: List[str],
+                    top_k: int = 5,
+                    **filters) -> List[SearchResponse]:
+        """
+        Batched semantic search: one encode call and one matrix op (or one Chroma query)
+
+        Returns:
+            One SearchResponse per query, in the same order
+        """
+        if not queries:
+            return []
+        query_embeddings = self._get_query_embeddings(queries)
+        if self.index is not None and self.index.filters.supports(filters):
+            mask = self.index.filters.mask(**filters) if filters else None
+            all_hits = self.index.search_many(query_embeddings, top_k, mask=mask)
+            return [self._index_response(q, hits, filters) for q, hits in zip(queries, all_hits)]
+
+        results = self.collection.query(
+            query_embeddings=[list(map(float, e)) for e in query_embeddings],
+            n_results=top_k,
+            where=self._build_where_filter(**filters),
+            include=["documents", "metadatas", "distances"]
+        )
+        return [self._chroma_response(q, results, i, filters) for i, q in enumerate(queries)]
+
+    def _chroma_response(self,
+                         query: str,
+                         results: Dict[str, Any],
+                         i: int,
+                         filters: Dict[str, Any]) -> SearchResponse:
+        """Parse the i-th query of a Chroma query result"""
         search_results = []
-        if results['ids'] and results['ids'][0]:
-            for i in range(len(results['ids'][0])):
+        if results['ids'] and len(results['ids']) > i and results['ids'][i]:
+            for j in range(len(results['ids'][i])):
                 result = SearchResult(
-                    id=results['ids'][0][i],
-                    text=results['documents'][0][i],
-                    metadata=results['metadatas'][0][i],
-                    distance=results['distances'][0][i],
-                    score=1.0 - results['distances'][0][i],  # Convert distance to similarity
-                    source_type=results['metadatas'][0][i].get('source_type', 'unknown')
+                    id=results['ids'][i][j],
+                    text=results['documents'][i][j],
+                    metadata=results['metadatas'][i][j],
+                    distance=results['distances'][i][j],
+                    score=1.0 - results['distances'][i][j],  # Convert distance to similarity
+                    source_type=results['metadatas'][i][j].get('source_type', 'unknown')
                 )
                 search_results.append(result)
         
@@ -188,6 +330,29 @@ class VectorSearch:
             filters_applied=filters
         )
 
+    def _index_response(self,
+                        query: str,
+                        hits: List[Tuple[int, float]],
+                        filters: Dict[str, Any]) -> SearchResponse:
+        """Build a SearchResponse from in-memory index hits (same shape as Chroma)"""
+        search_results = []
+        for row, distance in hits:
+            metadata = dict(self.index.metadatas[row])
+            search_results.append(SearchResult(
+                id=self.index.ids[row],
+                text=self.index.documents[row],
+                metadata=metadata,
+                distance=distance,
+                score=1.0 - distance,
+                source_type=metadata.get('source_type', 'unknown')
+            ))
+        return SearchResponse(
+            query=query,
+            results=search_results,
+            total_results=len(search_results),
+            filters_applied=filters
+        )
+
     def search_courses(self,
                        query: str,
                        top_k: int = 5,
@@ -244,7 +409,15 @@ class VectorSearch:
         [已修复] Find courses similar to a given course
         - 修复: 使用 $and 操作符来构建 where 过滤器，以兼容ChromaDB
         - 新增: 允许按 study_level (UG/PG) 筛选
+        - [新] 优先读取预计算的相似课程表 (build_similar_courses_table)，O(1)
+        - [新] 否则直接用 collection 中已存储的向量查询，不再重新编码课程文本
         """
+        # 预计算表：常数时间读取
+        if exclude_self:
+            cached = self._similar_from_table(course_code, top_k, study_level)
+            if cached is not None:
+                return cached
+
         try:
             # [!!] 修复：为ChromaDB构建一个 $and 过滤器 [!!]
             get_where_list = [
@@ -261,11 +434,12 @@ class VectorSearch:
 
             result = self.collection.get(
                 where=get_where, # <-- [!!] 使用新的 $and 过滤器
-                limit=1, # 只取第一个匹配项 (例如 UG 的)
-                include=["documents", "metadatas"]
+                include=["embeddings", "metadatas"] # [新] 只取已存储的向量（课程的所有分段，通常只有几条）
             )
+            # 与预计算表相同：只用每门课第一段 overview 的向量
+            rows = [i for i, meta in enumerate(result['metadatas']) if self._is_course_overview(meta)]
             
-            if not result['ids']:
+            if not rows:
                 error_msg = f"Course {course_code}"
                 if study_level:
                     error_msg += f" (Level: {study_level})"
@@ -277,24 +451,15 @@ class VectorSearch:
                     filters_applied={"error": error_msg}
                 )
             
-            # 使用找到的第一个课程的文本作为查询
-            course_text = result['documents'][0]
-            
-            # Search for similar
-            response = self.search_courses(
-                query=course_text,
-                top_k=top_k + (1 if exclude_self else 0)
+            # 直接使用该课程已存储的向量作为查询（不经过 SentenceTransformer）
+            course_embedding = result['embeddings'][rows[0]]
+            return self._search_course_overviews(
+                course_embedding,
+                top_k=top_k,
+                query=f"Similar to {course_code}",
+                exclude_code=course_code if exclude_self else None
             )
             
-            # Filter out self if needed
-            if exclude_self:
-                # (这个逻辑是正确的，基于 course_code 排除)
-                response.results = [r for r in response.results if r.metadata.get("course_code") != course_code][:top_k]
-                response.total_results = len(response.results)
-            
-            response.query = f"Similar to {course_code}"
-            return response
-            
         except Exception as e:
             print(f"Error finding similar courses: {e}")
             return SearchResponse(
@@ -302,8 +467,198 @@ class VectorSearch:
                 results=[], total_results=0,
                 filters_applied={"error": str(e)}
             )
+
+    # ------------------------------------------------------------------
+    # 预计算的相似课程表
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _is_course_overview(meta: Optional[Dict[str, Any]]) -> bool:
+        """相似课程只比较每门课第一段 overview（预计算表和实时查询使用同一批行）"""
+        meta = meta or {}
+        return meta.get("source_type") == "course" and meta.get("chunk_index", 0) == 0
+
+    def _search_course_overviews(self,
+                                 embedding,
+                                 top_k: int,
+                                 query: str,
+                                 exclude_code: Optional[str] = None) -> SearchResponse:
+        """在课程 overview 第一段中检索（build_similar_courses_table 的实时版本）"""
+        # 同一课程最多有 UG/PG 等几个版本，多取几条再过滤（与预计算表相同）
+        fetch_k = top_k + (4 if exclude_code else 0)
+        filters = {"source_type": "course"}
+        if self.index is not None:
+            if self._overview_mask is None:
+                self._overview_mask = np.fromiter(
+                    (self._is_course_overview(meta) for meta in self.index.metadatas),
+                    dtype=bool, count=len(self.index)
+                )
+            hits = self.index.search(embedding, fetch_k, mask=self._overview_mask)
+            response = self._index_response(query, hits, filters)
+        else:
+            # Chroma 的 where 不能表达 "chunk_index 缺失或为 0"，_partN 分段多取再筛掉
+            response = self.search_by_embedding(embedding, top_k=fetch_k * 3, query=query, **filters)
+        response.results = [
+            r for r in response.results
+            if self._is_course_overview(r.metadata)
+            and (exclude_code is None or r.metadata.get("course_code") != exclude_code)
+        ][:top_k]
+        response.total_results = len(response.results)
+        return response
+
+    def _fetch_course_overviews(self, page_size: int = 5000) -> Dict[str, List[Any]]:
+        """分页取出所有课程 overview 分块（每门课只取第一段）的向量、文本和 metadata"""
+        ids, documents, metadatas, embeddings = [], [], [], []
+        offset = 0
+        while True:
+            page = self.collection.get(
+                where={"source_type": "course"},
+                limit=page_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            for doc_id, doc, meta, emb in zip(page['ids'], page['documents'], page['metadatas'], page['embeddings']):
+                if self._is_course_overview(meta):
+                    ids.append(doc_id)
+                    documents.append(doc)
+                    metadatas.append(meta or {})
+                    embeddings.append(emb)
+            if len(page['ids']) < page_size:
+                break
+            offset += page_size
+        return {"ids": ids, "documents": documents, "metadatas": metadatas, "embeddings": embeddings}
+
+    def build_similar_courses_table(self, top_n: int = 10, batch_size: int = 256) -> Dict[str, List[List[Any]]]:
+        """
+        [批量] 为每门课程预计算 top-N 相似课程
+
+        所有课程向量一次性读出，按批做矩阵乘，自身和同 course_code 的其他版本 (UG/PG) 被排除。
+
+        Args:
+            top_n: 每门课程保留的相似课程数
+            batch_size: 每批查询的课程数
+
+        Returns:
+            {doc_id: [[similar_doc_id, distance], ...]}（同时保存在 self.similar_table）
+        """
+        start = time.time()
+        courses = self._fetch_course_overviews()
+        space = ((getattr(self.collection, "metadata", None) or {}).get("hnsw:space") or "l2")
+        index = InMemoryVectorIndex(
+            courses["ids"], courses["documents"], courses["metadatas"], courses["embeddings"], space=space
+        )
+        codes = [m.get("course_code") for m in index.metadatas]
+        # 同一课程最多有 UG/PG 等几个版本，多取几条再过滤
+        fetch_k = top_n + 4
+
+        table: Dict[str, List[List[Any]]] = {}
+        for batch_start in range(0, len(index), batch_size):
+            batch_rows = range(batch_start, min(batch_start + batch_size, len(index)))
+            all_hits = index.search_many(
+                [courses["embeddings"][row] for row in batch_rows], top_k=fetch_k
+            )
+            for row, hits in zip(batch_rows, all_hits):
+                table[index.ids[row]] = [
+                    [index.ids[hit_row], round(distance, 6)]
+                    for hit_row, distance in hits
+                    if codes[hit_row] != codes[row]
+                ][:top_n]
+
+        self._set_similar_table(table, index.ids, index.documents, index.metadatas)
+        print(f"[OK] Similar-course table: {len(table)} courses x top {top_n} "
+              f"in {time.time() - start:.2f}s")
+        return table
+
+    def _set_similar_table(self, table, ids, documents, metadatas):
+        self.similar_table = table
+        self._similar_docs = {doc_id: (doc, meta) for doc_id, doc, meta in zip(ids, documents, metadatas)}
+        # course_code (+ study_level) -> doc_id
+        self._similar_keys = {}
+        for doc_id, meta in zip(ids, metadatas):
+            code = meta.get("course_code")
+            if doc_id not in table or not code:
+                continue
+            self._similar_keys.setdefault((code, None), doc_id)
+            self._similar_keys.setdefault((code, meta.get("study_level")), doc_id)
+
+    def _data_version(self) -> str:
+        """
+        向量库内容的版本：构建 manifest（{doc_id: 内容哈希}）的哈希
+
+        增量重建只改课程文本时分块数不变，只比较 collection.count() 会继续使用过期的表。
+        没有 manifest（旧的构建产物）时退回到分块数。
+        """
+        manifest_path = self.persist_directory.with_name(f"{self.persist_directory.name}_manifest.json")
+        try:
+            return "manifest:" + hashlib.blake2b(manifest_path.read_bytes(), digest_size=16).hexdigest()
+        except OSError:
+            return f"count:{self.collection.count()}"
+
+    def save_similar_courses_table(self, path: str):
+        """把相似课程表写成 JSON（原子替换）"""
+        path = Path(path)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model_name": self.model_name, "collection_name": self.collection_name,
+                       "data_version": self._data_version(), "table": self.similar_table}, f)
+        os.replace(tmp_path, path)
+        print(f"[OK] Similar-course table saved: {path}")
+
+    def load_similar_courses_table(self, path: str) -> bool:
+        """读取 save_similar_courses_table 写出的 JSON，并一次性取回涉及的文档"""
+        path = Path(path)
+        if not path.exists():
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get("model_name") != self.model_name or payload.get("collection_name") != self.collection_name:
+                print(f"[WARN] Similar-course table {path} was built for another model/collection, ignoring.")
+                return False
+            if payload.get("data_version") != self._data_version():
+                print(f"[WARN] Similar-course table {path} is stale (collection changed), ignoring.")
+                return False
+            table = payload["table"]
+            doc_ids = sorted(set(table) | {hit[0] for hits in table.values() for hit in hits})
+            docs = self.collection.get(ids=doc_ids, include=["documents", "metadatas"])
+            self._set_similar_table(table, docs['ids'], docs['documents'], docs['metadatas'])
+            print(f"[OK] Similar-course table loaded: {len(table)} courses")
+            return True
+        except Exception as e:
+            print(f"[WARN] Failed to load similar-course table {path}: {e}")
+            return False
+
+    def _similar_from_table(self, course_code: str, top_k: int, study_level: Optional[str]) -> Optional[SearchResponse]:
+        """预计算表命中时直接构造 SearchResponse；未命中（或表中条数不足）返回 None"""
+        if not self.similar_table:
+            return None
+        doc_id = self._similar_keys.get((course_code, study_level))
+        hits = self.similar_table.get(doc_id) if doc_id else None
+        if hits is None or len(hits) < top_k:
+            return None
+
+        results = []
+        for similar_id, distance in hits[:top_k]:
+            doc, meta = self._similar_docs.get(similar_id, ("", {}))
+            results.append(SearchResult(
+                id=similar_id,
+                text=doc,
+                metadata=dict(meta),
+                distance=distance,
+                score=1.0 - distance,
+                source_type=meta.get('source_type', 'course')
+            ))
+        return SearchResponse(
+            query=f"Similar to {course_code}",
+            results=results,
+            total_results=len(results),
+            filters_applied={"source_type": "course", "precomputed": True}
+        )
+
     def get_by_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get document by ID"""
+        if self.index is not None:
+            return self.index.get_by_id(doc_id)
         try:
             result = self.collection.get(
                 ids=[doc_id],
@@ -325,11 +680,17 @@ class VectorSearch:
         """Get collection statistics"""
         total = self.collection.count()
         
-        return {
+        stats = {
             "collection_name": self.collection_name,
             "total_documents": total,
-            "persist_directory": str(self.persist_directory)
+            "persist_directory": str(self.persist_directory),
+            "encoder_backend": self.encoder_backend
         }
+        if self.embedding_cache is not None:
+            stats["embedding_cache"] = self.embedding_cache.stats()
+        if self.index is not None:
+            stats["vector_index"] = self.index.stats()
+        return stats
 
 
 def main():
@@ -347,6 +708,8 @@ def main():
     script_dir = Path(__file__).parent
     project_root = script_dir.parent # Assuming script is in RAG_database
     persist_directory = project_root / "course_data" / "vector_store"
+    embedding_cache_dir = project_root / "course_data" / "embedding_cache"
+    similar_table_path = project_root / "course_data" / "similar_courses.json"
     
     print("="*80)
     print("Vector Search Test (Local Model Mode)")
@@ -363,7 +726,9 @@ def main():
     searcher = VectorSearch(
         persist_directory=str(persist_directory),
         model_name=LOCAL_MODEL_NAME,
-        collection_name=COLLECTION_NAME
+        collection_name=COLLECTION_NAME,
+        cache_dir=str(embedding_cache_dir),
+        index_backend="numpy"
     )
     
     # Test 1: Search courses
@@ -396,6 +761,9 @@ def main():
     print("\n\n" + "="*80)
     print("TEST 3: Find courses similar to COMP3900")
     print("="*80)
+    if not searcher.load_similar_courses_table(str(similar_table_path)):
+        searcher.build_similar_courses_table(top_n=10)
+        searcher.save_similar_courses_table(str(similar_table_path))
     response = searcher.find_similar_courses("COMP3900", top_k=5)
     
     for i, result in enumerate(response.results, 1):
@@ -14,5 +14,7 @@ if sys.platform.startswith("win"):
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# 服务器进程：chatbot 启动时预加载检索模型（见 chatbot/apps.py）
+os.environ.setdefault('CHATBOT_SERVE_REQUESTS', 'true')
 
 application = get_asgi_application()
@@ -16,9 +16,10 @@ Including another URLconf
 """
 from pathlib import Path
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from chatbot import views as chatbot_views
 
 api_patterns = [
     path("chatbot/", include("chatbot.urls")),
@@ -29,6 +30,7 @@ api_patterns = [
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    re_path(r"^ready/?$", chatbot_views.ready, name="ready"),
     path("api/", include(api_patterns)),
 ]
 
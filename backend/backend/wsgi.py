@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# 服务器进程：chatbot 启动时预加载检索模型（见 chatbot/apps.py）
+os.environ.setdefault('CHATBOT_SERVE_REQUESTS', 'true')
 
 application = get_wsgi_application()
@@ -3,9 +3,50 @@
 import threading
 import traceback
 import os
+import sys
+import time
 from django.apps import AppConfig
 import asyncio
 
+# 启动时预加载模型（false = 首次请求时懒加载）
+EAGER_MODEL_PRELOAD = os.getenv("EAGER_MODEL_PRELOAD", "true").lower() == "true"
+
+# 服务器入口（backend/asgi.py、backend/wsgi.py）在 import 应用之前设置为 true；
+# 其他进程（manage.py 的 migrate / loaddata / 自定义命令等）不预加载
+SERVE_REQUESTS_ENV = "CHATBOT_SERVE_REQUESTS"
+
+
+def _should_preload() -> bool:
+    """
+    只在真正处理请求的进程里预加载（白名单）
+
+    - runserver：开启自动重载时父进程只负责监视文件，请求由 RUN_MAIN=true 的子进程处理
+    - uvicorn / gunicorn / daphne：import backend.asgi / backend.wsgi 时设置 CHATBOT_SERVE_REQUESTS，
+      每个 worker（gunicorn preload 时是 master）各自执行 ready()
+    """
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "runserver":
+        return "--noreload" in sys.argv or os.environ.get("RUN_MAIN") == "true"
+    return os.environ.get(SERVE_REQUESTS_ENV, "").lower() == "true"
+
+
+def _register_cleanup():
+    import atexit
+    from .db_manager import close_db_pool
+
+    def cleanup():
+        """清理函数"""
+        try:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(close_db_pool())
+            loop.close()
+        except Exception:
+            pass
+
+    atexit.register(cleanup)
+
+
 class ChatbotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chatbot'
@@ -13,55 +54,70 @@ class ChatbotConfig(AppConfig):
     def ready(self):
         """
         Django 启动时初始化：
-        1. 加载混合检索模块（单例模式，只初始化一次）
+        1. 加载混合检索模块（Embedding 模型、Reranker、Chroma、知识图谱）并预热
         2. 预编译 LangGraph（复用已加载的检索模块）
-        
-        关键：先加载检索模块，再编译图，避免重复初始化
+
+        关键：先加载检索模块，再编译图，避免重复初始化。
+        各步骤耗时记录在 READINESS 中，由 /ready 接口返回。
+        RETRIEVAL_PREFORK=true（gunicorn preload）时改为在 master 里同步加载，预热留给各 worker。
         """
-        # 只在主进程运行（避免 reload 时重复）
-        if os.environ.get("RUN_MAIN") == "true":
-            print("[SKIP] [Chatbot.ready] Reload 子进程检测到，跳过初始化。")
+        from chatbot.langgraph_agent.readiness import READINESS
+
+        if not _should_preload():
+            print("[SKIP] [Chatbot.ready] 当前进程不处理请求，跳过初始化。")
+            return
+
+        from .prefork import RETRIEVAL_PREFORK
+        if RETRIEVAL_PREFORK:
+            # gunicorn --preload: 在 master 里同步加载，fork 之前必须完成（见 chatbot/prefork.py）
+            from .prefork import preload_before_fork
+            try:
+                preload_before_fork()
+            except Exception as e:
+                print(f"[ERR] [Chatbot.ready] prefork 加载失败: {e}")
+                traceback.print_exc()
+                READINESS.mark_failed(str(e))
+            _register_cleanup()
+            return
+
+        if not EAGER_MODEL_PRELOAD:
+            print("[SKIP] [Chatbot.ready] EAGER_MODEL_PRELOAD=false，模型将在首次请求时加载。")
+            READINESS.mark_ready(mode="lazy")
             return
 
         def _init_in_background():
-            """后台初始化：先加载模块，再编译图"""
+            """后台初始化：先加载模块并预热，再编译图"""
             try:
-                # === 步骤 1：加载混合检索模块 ===
+                # === 步骤 1：加载并预热混合检索模块 ===
                 print("[START] [Chatbot.ready] Step 1: 加载混合检索模块...")
-                from chatbot.langgraph_agent import parallel_search_and_rerank
-                print("[OK] [Chatbot.ready] Hybrid Search 模块已加载")
+                from chatbot.langgraph_agent.parallel_search_and_rerank import warmup_hybrid_search
+                warmup_hybrid_search()
+                print("[OK] [Chatbot.ready] Hybrid Search 模块已加载并预热")
                 print("   -> VectorSearch, Reranker, KnowledgeGraph 已就绪")
 
                 # === 步骤 2：预编译 LangGraph ===
                 print("\n[BUILD] [Chatbot.ready] Step 2: 预编译 LangGraph...")
                 from chatbot.langgraph_agent.main_graph import warmup_graph
-                
-                graph = warmup_graph()
+
+                start = time.time()
+                # warmup_graph 是协程，必须在事件循环里执行
+                graph = asyncio.run(warmup_graph())
                 if graph:
+                    READINESS.record("graph", time.time() - start)
                     print("[OK] [Chatbot.ready] LangGraph 预编译成功")
                     print("   -> 所有节点已加载（复用已初始化的检索模块）")
                 else:
+                    READINESS.record("graph", time.time() - start, error="compile failed")
                     print("[WARN] [Chatbot.ready] LangGraph 预编译失败（将在首次请求时编译）")
 
+                READINESS.mark_ready()
                 print("\n[DONE] [Chatbot.ready] 初始化完成，服务已就绪！\n")
-                import atexit
-                from .db_manager import close_db_pool
-                
-                def cleanup():
-                    """清理函数"""
-                    try:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        loop.run_until_complete(close_db_pool())
-                        loop.close()
-                    except Exception:
-                        pass
-                    
-                atexit.register(cleanup)
+                _register_cleanup()
             except Exception as e:
                 print(f"[ERR] [Chatbot.ready] 初始化失败: {e}")
                 traceback.print_exc()
+                READINESS.mark_failed(str(e))
 
-        # 在后台线程执行，避免阻塞 Django 启动
+        # 在后台线程执行，避免阻塞 Django 启动；加载完成前 /ready 返回 503
         print("[INIT] [Chatbot.ready] 开始后台初始化...")
-        threading.Thread(target=_init_in_background, daemon=True).start()
\ No newline at end of file
+        threading.Thread(target=_init_in_background, daemon=True).start()
@@ -0,0 +1,39 @@
+# backend/chatbot/langgraph_agent/async_pool.py
+# 在有界线程池中执行阻塞调用，可被 run_chat 的 cancel_event 打断
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional
+
+
+async def run_in_pool(pool: Executor,
+                      fn: Callable[..., Any],
+                      *args,
+                      cancel_event: Optional[asyncio.Event] = None) -> Any:
+    """
+    在 pool 中执行 fn(*args)，cancel_event 被设置时立即放弃等待
+
+    排队中的任务会被直接取消；已经开始的任务会继续在线程里跑完，但结果被丢弃。
+
+    Raises:
+        asyncio.CancelledError: cancel_event 被设置，或调用方被取消
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(pool, fn, *args)
+    if cancel_event is None:
+        return await future
+
+    cancel_waiter = asyncio.ensure_future(cancel_event.wait())
+    try:
+        done, _ = await asyncio.wait({future, cancel_waiter}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    finally:
+        cancel_waiter.cancel()
+
+    if future in done:
+        return future.result()
+    future.cancel()
+    print("[WARN] Hybrid search cancelled by cancel_event.")
+    raise asyncio.CancelledError()
@@ -41,6 +41,8 @@ ENABLE_VERBOSE_LOGGING = os.getenv("ENABLE_VERBOSE_LOGGING", "true").lower() ==
 MAX_MEMORY_MESSAGES = int(os.getenv("MAX_MEMORY_MESSAGES", "20"))
 MEMORY_CACHE_TTL = int(os.getenv("MEMORY_CACHE_TTL", "300"))
 TOP_K = int(os.getenv("TOP_K", "8"))
+# 检索时同时用改写后的查询和原始查询（一次批量检索，共享 encode / rerank）
+ENABLE_QUERY_FANOUT = os.getenv("ENABLE_QUERY_FANOUT", "false").lower() == "true"
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 #MEMORY_DIR = os.path.join(BASE_DIR, "memory_data")
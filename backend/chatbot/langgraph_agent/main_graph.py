@@ -237,7 +237,9 @@ async def run_chat(
         try:
             accumulated_state = dict(initial_state)
             
-            async for update_chunk in compiled.astream(initial_state, stream_mode="updates"):
+            # cancel_event 通过 configurable 传给需要它的节点（如 retrieve）
+            run_config = {"configurable": {"cancel_event": cancel_event}}
+            async for update_chunk in compiled.astream(initial_state, config=run_config, stream_mode="updates"):
                 # 检查是否需要取消
                 if cancel_event and cancel_event.is_set():
                     if ENABLE_VERBOSE_LOGGING:
@@ -1,8 +1,10 @@
 # backend/chatbot/langgraph_agent/node/retrieve.py
 
+import asyncio
 import traceback
 from typing import Dict, Any, List, Optional
-from ..core import TOP_K, ENABLE_VERBOSE_LOGGING, RESPONSE_TEMPLATES
+from langchain_core.runnables import RunnableConfig
+from ..core import TOP_K, ENABLE_VERBOSE_LOGGING, ENABLE_QUERY_FANOUT, RESPONSE_TEMPLATES
 
 # 导入强类型定义
 from ..schemas import (
@@ -14,7 +16,7 @@ from ..schemas import (
 from ..state import ChatState
 
 try:
-    from ..parallel_search_and_rerank import parallel_search_and_rerank
+    from ..parallel_search_and_rerank import aparallel_search_and_rerank, aparallel_search_and_rerank_many
     
     HYBRID_SEARCH_INITIALIZED = True
     if ENABLE_VERBOSE_LOGGING:
@@ -23,9 +25,27 @@ except ImportError as e:
     HYBRID_SEARCH_INITIALIZED = False
     print(f"[WARN] (Retrieve Node) 导入 'parallel_search_and_rerank' 失败: {e}")
     
-    def parallel_search_and_rerank(query: str, top_k: int) -> List:
+    async def aparallel_search_and_rerank(query: str, top_k: int, cancel_event=None) -> List:
         return []
 
+    async def aparallel_search_and_rerank_many(queries: List[str], top_k: int, cancel_event=None) -> List[List]:
+        return [[] for _ in queries]
+
+
+def _merge_fanout_results(results_per_query: List[List[dict]], top_k: int) -> List[dict]:
+    """
+    合并多个查询的检索结果：按 url/title 去重，保留最高分，按分数排序后截断
+    """
+    best: Dict[str, dict] = {}
+    for docs in results_per_query:
+        for doc in docs:
+            meta = doc.get("_metadata") or {}
+            key = meta.get("url") or meta.get("title") or doc.get("_text", "")[:80]
+            if key not in best or (doc.get("_score") or 0) > (best[key].get("_score") or 0):
+                best[key] = doc
+    merged = sorted(best.values(), key=lambda d: d.get("_score") or 0, reverse=True)
+    return merged[:top_k]
+
 
 def _doc_to_source(d: dict, idx: int) -> Source:
     """
@@ -100,13 +120,16 @@ def _doc_to_retrieved_document(doc: dict, idx: int) -> RetrievedDocument:
     return retrieved_doc
 
 
-def node_retrieve(state: ChatState) -> Dict[str, Any]:
+async def node_retrieve(state: ChatState, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:  # [OK] async def
     """
     [LangGraph 节点] - 检索
     
     这是 LangGraph 流程中的一个节点，负责执行混合检索和重排。
     现在使用强类型数据契约。
+    模型推理在检索服务的线程池中执行，不阻塞事件循环；
+    run_chat 通过 config["configurable"]["cancel_event"] 传入取消信号。
     """
+    cancel_event: Optional[asyncio.Event] = ((config or {}).get("configurable") or {}).get("cancel_event")
     try:
         # 1. 从状态中获取当前查询和历史文档
         original_query = state.get("query", "")
@@ -158,7 +181,14 @@ def node_retrieve(state: ChatState) -> Dict[str, Any]:
             }
         }
         
-        raw_docs = parallel_search_and_rerank(query_to_use , top_k=TOP_K) or []
+        if ENABLE_QUERY_FANOUT and query_to_use != original_query and original_query:
+            # 改写查询 + 原始查询一起检索：一次 encode、一次 rerank
+            results_per_query = await aparallel_search_and_rerank_many(
+                [query_to_use, original_query], top_k=TOP_K, cancel_event=cancel_event
+            )
+            raw_docs = _merge_fanout_results(results_per_query, TOP_K)
+        else:
+            raw_docs = await aparallel_search_and_rerank(query_to_use, top_k=TOP_K, cancel_event=cancel_event) or []
         
         if ENABLE_VERBOSE_LOGGING:
             print(f"[Docs] RETRIEVE: 混合检索+重排后，找到 {len(raw_docs)} 个文档")
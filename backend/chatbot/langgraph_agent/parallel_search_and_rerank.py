@@ -9,6 +9,7 @@ import time
 import pickle
 import asyncio
 import threading  # 新增
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
@@ -28,10 +29,121 @@ if str(PROJECT_ROOT) not in sys.path:
 
 # 导入 KnowledgeGraphQuery
 try:
-    from .tools.knowledge_graph_query import KnowledgeGraphQuery
+    from .tools.knowledge_graph_query import KnowledgeGraphQuery, get_knowledge_graph
 except ImportError:
     print("WARNING: Could not use relative import for KGQuery. Trying absolute.")
-    from backend.chatbot.langgraph_agent.tools.knowledge_graph_query import KnowledgeGraphQuery
+    from backend.chatbot.langgraph_agent.tools.knowledge_graph_query import KnowledgeGraphQuery, get_knowledge_graph
+
+# 持久化 embedding 缓存（与 RAG_database/build_vector_store.py 共用同一份磁盘缓存）
+try:
+    from RAG_database.embedding_cache import EmbeddingCache
+except ImportError as e:
+    print(f"WARNING: Could not import EmbeddingCache, query embeddings will not be cached: {e}")
+    EmbeddingCache = None
+
+# CrossEncoder 跨请求微批处理
+try:
+    from .rerank_batcher import RerankBatcher
+except ImportError:
+    from backend.chatbot.langgraph_agent.rerank_batcher import RerankBatcher
+
+# 检索结果缓存（精确 + 近似两级）
+try:
+    from .search_result_cache import SearchResultCache, VersionWatch, file_version
+except ImportError:
+    from backend.chatbot.langgraph_agent.search_result_cache import SearchResultCache, VersionWatch, file_version
+
+# CrossEncoder 分数缓存（多轮检索只算新增的 pair）
+try:
+    from .rerank_score_cache import RerankScoreCache
+except ImportError:
+    from backend.chatbot.langgraph_agent.rerank_score_cache import RerankScoreCache
+
+# 两阶段重排序：廉价打分剪枝 + 代码型查询直接用知识图谱
+try:
+    from . import rerank_cascade
+except ImportError:
+    from backend.chatbot.langgraph_agent import rerank_cascade
+
+# 启动就绪状态（/ready 接口）
+try:
+    from .readiness import READINESS
+    from .async_pool import run_in_pool
+except ImportError:
+    from backend.chatbot.langgraph_agent.readiness import READINESS
+    from backend.chatbot.langgraph_agent.async_pool import run_in_pool
+
+# 可选的检索 sidecar（多个 web worker 共享一份模型）
+try:
+    from .retrieval_sidecar import RetrievalClient, RETRIEVAL_SERVER_SOCKET
+except ImportError:
+    from backend.chatbot.langgraph_agent.retrieval_sidecar import RetrievalClient, RETRIEVAL_SERVER_SOCKET
+
+# 可选的量化查询编码器（torch 动态 int8 / ONNX）
+try:
+    from RAG_database.query_encoder import load_query_encoder, encoder_cache_key
+except ImportError as e:
+    print(f"WARNING: Could not import query_encoder, using fp32 SentenceTransformer: {e}")
+    load_query_encoder = None
+
+# 进程内向量索引（启动时从 Chroma 导出一次）
+try:
+    from RAG_database.vector_index import InMemoryVectorIndex
+except ImportError as e:
+    print(f"WARNING: Could not import InMemoryVectorIndex, vector search will query Chroma directly: {e}")
+    InMemoryVectorIndex = None
+
+# BM25 倒排索引（postings 文件由 build_vector_store.py 生成）
+try:
+    from RAG_database.bm25_index import BM25Index, bm25_path_for
+except ImportError as e:
+    print(f"WARNING: Could not import BM25Index, lexical channel disabled: {e}")
+    BM25Index = None
+
+ENABLE_EMBEDDING_CACHE = os.getenv("ENABLE_EMBEDDING_CACHE", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR") or str(PROJECT_ROOT / "course_data" / "embedding_cache")
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+QUERY_ENCODER_BACKEND = os.getenv("QUERY_ENCODER_BACKEND", "torch").lower()  # torch / torch-int8 / onnx / onnx-int8
+ENABLE_RERANK_MICROBATCH = os.getenv("ENABLE_RERANK_MICROBATCH", "true").lower() == "true"
+RERANK_BATCH_MAX_PAIRS = int(os.getenv("RERANK_BATCH_MAX_PAIRS", "64"))
+RERANK_BATCH_WAIT_MS = float(os.getenv("RERANK_BATCH_WAIT_MS", "5"))
+# 向量通道和知识图谱通道并行执行（各自超时，超时的通道结果为空）
+ENABLE_PARALLEL_CHANNELS = os.getenv("ENABLE_PARALLEL_CHANNELS", "true").lower() == "true"
+# 0 = 通道数（向量 / BM25 / 知识图谱）× RETRIEVAL_MAX_CONCURRENCY，并发检索时通道不排队
+RETRIEVAL_CHANNEL_WORKERS = int(os.getenv("RETRIEVAL_CHANNEL_WORKERS", "0"))
+VECTOR_CHANNEL_TIMEOUT = float(os.getenv("VECTOR_CHANNEL_TIMEOUT", "5.0"))
+KG_CHANNEL_TIMEOUT = float(os.getenv("KG_CHANNEL_TIMEOUT", "2.0"))
+# 知识图谱 pickle 的检查间隔（秒）；文件变化后在后台线程重新加载，通道继续用已加载的实例
+KG_RELOAD_CHECK_INTERVAL = float(os.getenv("KG_RELOAD_CHECK_INTERVAL", "5.0"))
+ENABLE_BM25_CHANNEL = os.getenv("ENABLE_BM25_CHANNEL", "true").lower() == "true"
+LEXICAL_CHANNEL_TIMEOUT = float(os.getenv("LEXICAL_CHANNEL_TIMEOUT", "1.0"))
+RRF_K = int(os.getenv("RRF_K", "60"))  # reciprocal rank fusion 的平滑常数
+# asearch 使用的有界线程池：同一进程内最多同时进行这么多次检索，其余排队
+RETRIEVAL_MAX_CONCURRENCY = int(os.getenv("RETRIEVAL_MAX_CONCURRENCY", "4"))
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "numpy").lower()  # chroma / numpy / ivf
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")  # float32 / float16 / int8
+VECTOR_INDEX_IVF_LISTS = int(os.getenv("VECTOR_INDEX_IVF_LISTS", "0"))  # 0 = sqrt(N)
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+# ids / 文档 / metadata 存成 numpy 字节缓冲（gunicorn preload + fork 时各 worker 共享，见 backend/gunicorn.conf.py）
+VECTOR_INDEX_PACKED = os.getenv("VECTOR_INDEX_PACKED", "false").lower() == "true"
+ENABLE_SEARCH_RESULT_CACHE = os.getenv("ENABLE_SEARCH_RESULT_CACHE", "true").lower() == "true"
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "512"))
+SEARCH_RESULT_CACHE_TTL = float(os.getenv("SEARCH_RESULT_CACHE_TTL", "600"))
+SEARCH_RESULT_CACHE_SIM_THRESHOLD = float(os.getenv("SEARCH_RESULT_CACHE_SIM_THRESHOLD", "0"))  # 0 = 只用精确层
+ENABLE_RERANK_SCORE_CACHE = os.getenv("ENABLE_RERANK_SCORE_CACHE", "true").lower() == "true"
+RERANK_SCORE_CACHE_SIZE = int(os.getenv("RERANK_SCORE_CACHE_SIZE", "20000"))
+ENABLE_RERANK_CASCADE = os.getenv("ENABLE_RERANK_CASCADE", "true").lower() == "true"
+RERANK_CASCADE_KEEP = float(os.getenv("RERANK_CASCADE_KEEP", "2.0"))  # 进入 CrossEncoder 的候选数 = top_k * KEEP
+RERANK_CASCADE_LEXICAL_WEIGHT = float(os.getenv("RERANK_CASCADE_LEXICAL_WEIGHT", "0.5"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))  # CrossEncoder 的 query + passage token 预算（与级联无关）
+KG_EXACT_HIT_SCORE = float(os.getenv("KG_EXACT_HIT_SCORE", "10.0"))  # 跳过 rerank 时知识图谱结果的分数
+
+RETRIEVAL_CHANNELS = 3  # 向量 / BM25 / 知识图谱
+
+
+def channel_pool_size() -> int:
+    """通道线程池大小：RETRIEVAL_MAX_CONCURRENCY 次检索同时进行时，每个通道都有线程可用"""
+    return RETRIEVAL_CHANNEL_WORKERS or RETRIEVAL_CHANNELS * max(1, RETRIEVAL_MAX_CONCURRENCY)
 
 # --- 3. VectorSearch 类（保持不变）---
 
@@ -59,31 +171,91 @@ class VectorSearch:
     def __init__(self,
                  persist_directory: str,
                  model_name: str = 'BAAI/bge-large-en-v1.5',
-                 collection_name: str = "unsw_courses"):
+                 collection_name: str = "unsw_courses",
+                 cache_dir: Optional[str] = None,
+                 cache_dtype: str = "float32",
+                 index_backend: str = "chroma",
+                 index_dtype: str = "float32",
+                 ivf_lists: int = 0,
+                 ivf_nprobe: int = 8,
+                 index_packed: bool = False,
+                 encoder_backend: str = "torch"):
         self.persist_directory = Path(persist_directory)
         self.collection_name = collection_name
         self.model_name = model_name
 
-        print(f"Loading local embedding model: {self.model_name}...")
-        device_to_use = 'cuda' if torch.cuda.is_available() else 'cpu'
-        print(f"Using device: {device_to_use}")
-        self.model = SentenceTransformer(self.model_name, device=device_to_use)
+        print(f"Loading local embedding model: {self.model_name} (backend={encoder_backend})...")
+        if load_query_encoder is not None:
+            self.model, self.encoder_backend = load_query_encoder(self.model_name, encoder_backend)
+            cache_model_key = encoder_cache_key(self.model_name, self.encoder_backend)
+        else:
+            device_to_use = 'cuda' if torch.cuda.is_available() else 'cpu'
+            print(f"Using device: {device_to_use}")
+            self.model = SentenceTransformer(self.model_name, device=device_to_use)
+            self.encoder_backend = "torch"
+            cache_model_key = self.model_name
         self.dimensions = self.model.get_sentence_embedding_dimension()
         print(f"[OK] Local model loaded. Dimensions: {self.dimensions}")
+
+        # 只读：只命中构建时写入的语料向量，用户查询不写入（文件和内存索引不会随查询增长）
+        self.embedding_cache = None
+        if cache_dir and EmbeddingCache is not None:
+            try:
+                self.embedding_cache = EmbeddingCache(cache_dir, cache_model_key, self.dimensions,
+                                                      dtype=cache_dtype, read_only=True)
+                print(f"[OK] Embedding cache loaded: {len(self.embedding_cache)} entries")
+            except Exception as e:
+                print(f"[WARN] Failed to open embedding cache: {e}")
         
+        self._open_collection()
+
+        # 进程内索引：Chroma 仍是数据源，这里只在启动时导出一次
+        self.index = None
+        if index_backend in ("numpy", "ivf") and InMemoryVectorIndex is not None:
+            try:
+                lists = 0
+                if index_backend == "ivf":
+                    lists = ivf_lists or int(self.collection.count() ** 0.5)
+                self.index = InMemoryVectorIndex.from_chroma(
+                    self.collection, dtype=index_dtype, ivf_lists=lists, nprobe=ivf_nprobe, packed=index_packed
+                )
+            except Exception as e:
+                print(f"[WARN] Failed to build in-memory index, falling back to Chroma queries: {e}")
+                self.index = None
+
+    def _open_collection(self):
         self.chroma_client = chromadb.PersistentClient(
-            path=str(persist_directory),
+            path=str(self.persist_directory),
             settings=Settings(anonymized_telemetry=False)
         )
         
         try:
-            self.collection = self.chroma_client.get_collection(name=collection_name)
-            print(f"[OK] Loaded collection '{collection_name}' with {self.collection.count()} documents\n")
+            self.collection = self.chroma_client.get_collection(name=self.collection_name)
+            print(f"[OK] Loaded collection '{self.collection_name}' with {self.collection.count()} documents\n")
         except Exception as e:
-            raise RuntimeError(f"Failed to load collection '{collection_name}': {e}")
+            raise RuntimeError(f"Failed to load collection '{self.collection_name}': {e}")
+
+    def reopen_after_fork(self):
+        """
+        fork 出的 worker 里重新打开 Chroma
+
+        Chroma 的客户端持有 SQLite 连接和后台线程，不能跨 fork 使用；
+        它按路径缓存 System 实例，需要先清掉从 master 继承来的缓存。
+        """
+        try:
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        except Exception as e:
+            print(f"[WARN] Failed to clear Chroma system cache: {e}")
+        self._open_collection()
 
     def _get_query_embedding(self, query: str) -> List[float]:
         try:
+            if self.embedding_cache is not None:
+                return self.embedding_cache.encode(
+                    [query],
+                    lambda texts: self.model.encode(texts, show_progress_bar=False)
+                )[0].tolist()
             embedding_array = self.model.encode([query], show_progress_bar=False)
             return embedding_array[0].tolist()
         except Exception as e:
@@ -134,11 +306,25 @@ class VectorSearch:
             return where
         return None
 
+    def _get_query_embeddings(self, queries: List[str]):
+        """批量查询向量：所有（未命中缓存的）查询只调用一次 model.encode"""
+        if self.embedding_cache is not None:
+            return self.embedding_cache.encode(
+                queries,
+                lambda texts: self.model.encode(texts, show_progress_bar=False)
+            )
+        return self.model.encode(list(queries), show_progress_bar=False)
+
     def search(self,
                query: str,
                top_k: int = 5,
                **filters) -> SearchResponse:
         query_embedding = self._get_query_embedding(query)
+        # 进程内索引：过滤条件先解析成（缓存的）候选掩码，再打分
+        if self.index is not None and self.index.filters.supports(filters):
+            mask = self.index.filters.mask(**filters) if filters else None
+            hits = self.index.search(query_embedding, top_k, mask=mask)
+            return self._index_response(query, hits, filters)
         where_filter = self._build_where_filter(**filters)
         
         results = self.collection.query(
@@ -147,17 +333,65 @@ class VectorSearch:
             where=where_filter,
             include=["documents", "metadatas", "distances"]
         )
-        
+        return self._chroma_response(query, results, 0, filters)
+
+    def search_many(self,
+                    queries: List[str],
+                    top_k: int = 5,
+                    **filters) -> List[SearchResponse]:
+        """
+        批量检索：一次 encode + 一次矩阵乘（或一次 Chroma query）
+
+        Returns:
+            与 queries 顺序一致的 SearchResponse 列表
+        """
+        if not queries:
+            return []
+        return self.search_many_by_embedding(self._get_query_embeddings(queries), queries, top_k, **filters)
+
+    def search_many_by_embedding(self,
+                                 query_embeddings,
+                                 queries: List[str],
+                                 top_k: int = 5,
+                                 **filters) -> List[SearchResponse]:
+        """
+        用已经算好的查询向量批量检索（例如结果缓存近似层已经 encode 过的查询）
+
+        Args:
+            query_embeddings: 与 queries 一一对应的查询向量
+            queries: 写入 SearchResponse.query
+        """
+        if not queries:
+            return []
+        if self.index is not None and self.index.filters.supports(filters):
+            mask = self.index.filters.mask(**filters) if filters else None
+            all_hits = self.index.search_many(query_embeddings, top_k, mask=mask)
+            return [self._index_response(q, hits, filters) for q, hits in zip(queries, all_hits)]
+
+        results = self.collection.query(
+            query_embeddings=[list(map(float, e)) for e in query_embeddings],
+            n_results=top_k,
+            where=self._build_where_filter(**filters),
+            include=["documents", "metadatas", "distances"]
+        )
+        return [self._chroma_response(q, results, i, filters) for i, q in enumerate(queries)]
+
+    def _chroma_response(self,
+                         query: str,
+                         results: Dict[str, Any],
+                         i: int,
+                         filters: Dict[str, Any]) -> SearchResponse:
+        """解析 Chroma query 结果中第 i 个查询"""
         search_results = []
-        if results['ids'] and results['ids'][0]:
-            for i in range(len(results['ids'][0])):
+        if results['ids'] and len(results['ids']) > i and results['ids'][i]:
+            for j in range(len(results['ids'][i])):
                 result = SearchResult(
-                    id=results['ids'][0][i],
-                    text=results['documents'][0][i],
-                    metadata=results['metadatas'][0][i],
-                    distance=results['distances'][0][i],
-                    score=1.0 - results['distances'][0][i],
-                    source_type=results['metadatas'][0][i].get('source_type', 'unknown')
+                    id=results['ids'][i][j],
+                    text=results['documents'][i][j],
+                    metadata=results['metadatas'][i][j],
+                    distance=results['distances'][i][j],
+                    score=1.0 - results['distances'][i][j],
+                    source_type=results['metadatas'][i][j].get('source_type', 'unknown')
                 )
                 search_results.append(result)
         
@@ -168,21 +402,65 @@ class VectorSearch:
             filters_applied=filters
         )
     
+    def _index_response(self,
+                        query: str,
+                        hits: List[Tuple[int, float]],
+                        filters: Dict[str, Any]) -> SearchResponse:
+        """把进程内索引的 (row, distance) 转成 SearchResponse（格式与 Chroma 分支一致）"""
+        search_results = []
+        for row, distance in hits:
+            metadata = dict(self.index.metadatas[row])
+            search_results.append(SearchResult(
+                id=self.index.ids[row],
+                text=self.index.documents[row],
+                metadata=metadata,
+                distance=distance,
+                score=1.0 - distance,
+                source_type=metadata.get('source_type', 'unknown')
+            ))
+        return SearchResponse(
+            query=query,
+            results=search_results,
+            total_results=len(search_results),
+            filters_applied=filters
+        )
+
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the collection"""
         try:
             count = self.collection.count()
-            return {
+            stats = {
                 "collection_name": self.collection_name,
                 "total_documents": count,
-                "persist_directory": str(self.persist_directory)
+                "persist_directory": str(self.persist_directory),
+                "encoder_backend": self.encoder_backend
             }
+            if self.embedding_cache is not None:
+                stats["embedding_cache"] = self.embedding_cache.stats()
+            if self.index is not None:
+                stats["vector_index"] = self.index.stats()
+            return stats
         except Exception as e:
             print(f"Error getting collection stats: {e}")
             return {}
     
+    def get_by_ids(self, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量版 get_by_id：{id: {"id", "text", "metadata"}}，不存在的 id 被跳过"""
+        if not doc_ids:
+            return {}
+        if self.index is not None:
+            docs = (self.index.get_by_id(doc_id) for doc_id in doc_ids)
+            return {doc["id"]: doc for doc in docs if doc}
+        result = self.collection.get(ids=list(doc_ids), include=["documents", "metadatas"])
+        return {
+            doc_id: {"id": doc_id, "text": text, "metadata": meta}
+            for doc_id, text, meta in zip(result['ids'], result['documents'], result['metadatas'])
+        }
+
     def get_by_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get a document by its ID"""
+        if self.index is not None:
+            return self.index.get_by_id(doc_id)
         try:
             result = self.collection.get(ids=[doc_id], include=["documents", "metadatas"])
             if result['ids']:
@@ -216,8 +494,23 @@ class HybridSearchService:
         
         # 组件（延迟初始化）
         self.reranker = None
+        self.rerank_batcher: Optional[RerankBatcher] = None
         self.searcher = None
+        self.bm25 = None
         self.kg_query = None
+        self._kg_watch: Optional[VersionWatch] = None
+        self._kg_watch_lock = threading.Lock()
+        self._kg_reload_thread: Optional[threading.Thread] = None
+        self._kg_generation = 0  # 每次后台重新加载换入新图 +1（缓存版本的一部分）
+        self.result_cache: Optional[SearchResultCache] = None
+        self.rerank_score_cache: Optional[RerankScoreCache] = None
+        
+        # 检索通道线程池（向量 / 知识图谱并行）
+        self._channel_pool: Optional[ThreadPoolExecutor] = None
+        # asearch 的模型线程池（encode / rerank 不占用事件循环）
+        self._search_pool = ThreadPoolExecutor(
+            max_workers=RETRIEVAL_MAX_CONCURRENCY, thread_name_prefix="retrieval"
+        )
         
         # 初始化标志
         self._initialized = False
@@ -236,49 +529,192 @@ class HybridSearchService:
             
             # 1. Reranker
             print("Loading Reranker model (BAAI/bge-reranker-base)...")
+            start = time.time()
             try:
                 device = 'cuda' if torch.cuda.is_available() else 'cpu'
                 self.reranker = CrossEncoder(
                     'BAAI/bge-reranker-base',
-                    max_length=512,
+                    max_length=RERANK_MAX_LENGTH,
                     device=device
                 )
                 print(f"[OK] Reranker loaded on device: {device}")
+                if ENABLE_RERANK_MICROBATCH:
+                    # 所有并发请求共享一个 worker，合并成一次 predict
+                    self.rerank_batcher = RerankBatcher(
+                        self.reranker,
+                        max_batch_pairs=RERANK_BATCH_MAX_PAIRS,
+                        max_wait_ms=RERANK_BATCH_WAIT_MS
+                    )
+                    print(f"[OK] Rerank micro-batching enabled "
+                          f"(max {RERANK_BATCH_MAX_PAIRS} pairs / {RERANK_BATCH_WAIT_MS}ms)")
+                READINESS.record("reranker", time.time() - start)
             except Exception as e:
                 print(f"[WARN] Failed to load Reranker: {e}")
                 self.reranker = None
+                READINESS.record("reranker", time.time() - start, error=str(e))
             
             # 2. VectorSearch
             print(f"Loading Vector Store from: {self.vector_store_path}")
+            start = time.time()
             try:
                 self.searcher = VectorSearch(
                     persist_directory=str(self.vector_store_path),
                     model_name='BAAI/bge-small-en-v1.5',
-                    collection_name="unsw_courses"
+                    collection_name="unsw_courses",
+                    cache_dir=EMBEDDING_CACHE_DIR if ENABLE_EMBEDDING_CACHE else None,
+                    cache_dtype=EMBEDDING_CACHE_DTYPE,
+                    index_backend=VECTOR_INDEX_BACKEND,
+                    index_dtype=VECTOR_INDEX_DTYPE,
+                    ivf_lists=VECTOR_INDEX_IVF_LISTS,
+                    ivf_nprobe=VECTOR_INDEX_NPROBE,
+                    index_packed=VECTOR_INDEX_PACKED,
+                    encoder_backend=QUERY_ENCODER_BACKEND
                 )
                 print("[OK] VectorSearch initialized.")
+                READINESS.record("vector_search", time.time() - start)
             except Exception as e:
                 print(f"[WARN] Failed to initialize VectorSearch: {e}")
                 traceback.print_exc()
                 self.searcher = None
+                READINESS.record("vector_search", time.time() - start, error=str(e))
+            
+            # 2b. BM25（与向量库同一批分块）
+            if ENABLE_BM25_CHANNEL and BM25Index is not None and self.searcher is not None:
+                bm25_path = bm25_path_for(str(self.vector_store_path))
+                start = time.time()
+                try:
+                    if bm25_path.exists():
+                        self.bm25 = BM25Index.load(str(bm25_path))
+                    elif self.searcher.index is not None:
+                        print(f"[WARN] {bm25_path} not found, building BM25 from the in-memory index "
+                              f"(re-run build_vector_store.py to persist it).")
+                        self.bm25 = BM25Index.build(self.searcher.index.ids, self.searcher.index.documents)
+                    else:
+                        print(f"[WARN] {bm25_path} not found, lexical channel disabled.")
+                    READINESS.record("bm25", time.time() - start,
+                                     error=None if self.bm25 is not None else "postings file not found")
+                except Exception as e:
+                    print(f"[WARN] Failed to load BM25 index: {e}")
+                    self.bm25 = None
+                    READINESS.record("bm25", time.time() - start, error=str(e))
             
             # 3. KnowledgeGraph
             print(f"Loading Knowledge Graph from: {self.kg_path}")
+            start = time.time()
             try:
-                self.kg_query = KnowledgeGraphQuery(graph_path=str(self.kg_path))
+                # 与 knowledge_graph_search 工具共用同一个实例
+                self.kg_query = get_knowledge_graph(str(self.kg_path))
+                self._kg_watch = VersionWatch(
+                    lambda: file_version([self.kg_path]), KG_RELOAD_CHECK_INTERVAL, name="knowledge graph"
+                )
                 print("[OK] KnowledgeGraphQuery initialized.")
+                READINESS.record("knowledge_graph", time.time() - start)
             except Exception as e:
                 print(f"[WARN] Failed to initialize KnowledgeGraph: {e}")
                 traceback.print_exc()
                 self.kg_query = None
+                READINESS.record("knowledge_graph", time.time() - start, error=str(e))
+            
+            if ENABLE_PARALLEL_CHANNELS:
+                self._channel_pool = ThreadPoolExecutor(
+                    max_workers=channel_pool_size(), thread_name_prefix="retrieval-channel"
+                )
+            
+            self._create_caches()
             
             self._initialized = True
             print("--- Hybrid Search Service Ready ---")
     
+    def _create_caches(self):
+        """结果缓存 / rerank 分数缓存"""
+        # 向量库 / 知识图谱重建后（文件 mtime 变化）缓存自动失效
+        if ENABLE_SEARCH_RESULT_CACHE:
+            self.result_cache = SearchResultCache(
+                max_entries=SEARCH_RESULT_CACHE_SIZE,
+                ttl_seconds=SEARCH_RESULT_CACHE_TTL,
+                similarity_threshold=SEARCH_RESULT_CACHE_SIM_THRESHOLD,
+                version_fn=self._data_version
+            )
+            print(f"[OK] Search result cache enabled "
+                  f"(size={SEARCH_RESULT_CACHE_SIZE}, ttl={SEARCH_RESULT_CACHE_TTL:.0f}s, "
+                  f"similarity={SEARCH_RESULT_CACHE_SIM_THRESHOLD or 'off'})")
+        if ENABLE_RERANK_SCORE_CACHE and self.reranker is not None:
+            self.rerank_score_cache = RerankScoreCache(
+                max_entries=RERANK_SCORE_CACHE_SIZE, version_fn=self._data_version
+            )
+            print(f"[OK] Rerank score cache enabled (size={RERANK_SCORE_CACHE_SIZE})")
+
     def ensure_initialized(self):
         """确保服务已初始化（懒加载）"""
         if not self._initialized:
             self._initialize()
+
+    def warmup(self):
+        """
+        启动预热：加载全部组件，并各跑一次最小的 encode / 检索 / rerank
+
+        第一次前向会触发 kernel 选择、线程池创建、内存分配等一次性开销，
+        这里直接调用模型（绕过 embedding / 结果 / 分数缓存），不污染缓存统计。
+        """
+        self.ensure_initialized()
+        start = time.time()
+        try:
+            if self.searcher:
+                vector = self.searcher.model.encode(["warmup query"], show_progress_bar=False)
+                if self.searcher.index is not None:
+                    self.searcher.index.search(vector[0], 1)
+            if self.reranker:
+                self.reranker.predict([("warmup query", "warmup passage")], show_progress_bar=False)
+            if self.bm25 is not None:
+                self.bm25.search("warmup query", 1)
+            READINESS.record("warmup", time.time() - start)
+            print(f"[OK] Hybrid search warm-up finished in {time.time() - start:.2f}s")
+        except Exception as e:
+            print(f"[WARN] Hybrid search warm-up failed: {e}")
+            READINESS.record("warmup", time.time() - start, error=str(e))
+
+    def reset_after_fork(self):
+        """
+        在 fork 出的 worker 里重建不能继承的部分（gunicorn post_fork 调用，见 chatbot/prefork.py）
+
+        模型权重、向量矩阵、BM25 postings、知识图谱在 master 里加载后与 worker 共享（copy-on-write）；
+        线程不会被 fork 复制（RerankBatcher 的 worker、线程池），锁可能被 master 的其他线程持有，
+        Chroma 客户端持有 SQLite 连接——这些都在子进程里重新创建。
+        """
+        self._init_lock = threading.Lock()
+        self._kg_watch_lock = threading.Lock()
+        self._kg_reload_thread = None
+        self._search_pool = ThreadPoolExecutor(
+            max_workers=RETRIEVAL_MAX_CONCURRENCY, thread_name_prefix="retrieval"
+        )
+        if self._channel_pool is not None:
+            self._channel_pool = ThreadPoolExecutor(
+                max_workers=channel_pool_size(), thread_name_prefix="retrieval-channel"
+            )
+        if self.rerank_batcher is not None:
+            self.rerank_batcher = RerankBatcher(
+                self.reranker,
+                max_batch_pairs=RERANK_BATCH_MAX_PAIRS,
+                max_wait_ms=RERANK_BATCH_WAIT_MS
+            )
+        if self.searcher is not None:
+            try:
+                self.searcher.reopen_after_fork()
+            except Exception as e:
+                print(f"[WARN] Failed to reopen Chroma after fork: {e}")
+        if self._initialized:
+            self._create_caches()
+
+    def _data_version(self) -> Tuple:
+        """
+        检索数据的版本：向量库 manifest / chroma.sqlite3 的 (mtime, size) + 已换入的知识图谱代数
+
+        知识图谱不用 pickle 的 mtime：文件改写后到后台重新加载完成之前，检索仍在用旧图。
+        """
+        return file_version([
+            self.vector_store_path.with_name(f"{self.vector_store_path.name}_manifest.json"),
+            self.vector_store_path / "chroma.sqlite3",
+        ]) + (("kg", self._kg_generation),)
     
     def _standardize_vector_doc(self, doc: SearchResult) -> Optional[Dict[str, Any]]:
         """标准化 VectorSearch 结果"""
@@ -297,6 +733,7 @@ class HybridSearchService:
             snippet = text if text and len(text.split()) >= 5 else meta.get("description", text)
 
             return {
+                "doc_id": doc.id,
                 "_text": text,
                 "metadata": meta,
                 "url": url,
@@ -332,6 +769,7 @@ class HybridSearchService:
                 return None
 
             return {
+                "doc_id": f"kg:{entity_code}",
                 "_text": text,
                 "metadata": node_data,
                 "url": url,
@@ -353,105 +791,350 @@ class HybridSearchService:
     
     def _run_rerank(self, query: str, docs: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
         """重排序文档"""
+        return self._run_rerank_many([query], [docs], top_k)[0]
+
+    def _run_rerank_many(self,
+                         queries: List[str],
+                         docs_per_query: List[List[Dict[str, Any]]],
+                         top_k: int) -> List[List[Dict[str, Any]]]:
+        """
+        批量重排序：所有查询的 (query, passage) 对合并成一次 CrossEncoder.predict
+        """
         if not self.reranker:
             print("[WARN] Reranker not available, returning original order.")
-            return docs[:top_k]
-        
-        if not docs:
-            return []
+            return [docs[:top_k] for docs in docs_per_query]
+
+        pairs = [
+            (query, d.get("snippet") or d.get("_text"))
+            for query, docs in zip(queries, docs_per_query)
+            for d in docs
+        ]
+        if not pairs:
+            return [[] for _ in docs_per_query]
 
-        pairs = [(query, d.get("snippet") or d.get("_text")) for d in docs]
-        print(f"Reranking {len(pairs)} document pairs...")
         start_time = time.time()
-        
-        try:
-            scores = self.reranker.predict(pairs, show_progress_bar=False)
-            
-            for doc, score in zip(docs, scores):
+        scores: List[Optional[float]] = [None] * len(pairs)
+        keys = None
+        if self.rerank_score_cache is not None:
+            # 没有稳定 id 的文档退回用 url/title
+            keys = [
+                key
+                for query, docs in zip(queries, docs_per_query)
+                for key in self.rerank_score_cache.make_keys(
+                    query, [d.get("doc_id") or d.get("url") or d.get("title") or "" for d in docs]
+                )
+            ]
+            scores = self.rerank_score_cache.get_many(keys)
+
+        # 只有没见过的 pair 送去 predict（同一批里重复的 pair 也只算一次）
+        todo: Dict[Any, List[int]] = {}
+        for i, score in enumerate(scores):
+            if score is None:
+                todo.setdefault(keys[i] if keys is not None else i, []).append(i)
+        todo_idx = [positions[0] for positions in todo.values()]
+        print(f"Reranking {len(pairs)} document pairs for {len(queries)} queries "
+              f"({len(pairs) - len(todo_idx)} cached)...")
+
+        if todo_idx:
+            todo_pairs = [pairs[i] for i in todo_idx]
+            try:
+                if self.rerank_batcher is not None:
+                    new_scores = self.rerank_batcher.predict(todo_pairs)
+                else:
+                    new_scores = self.reranker.predict(todo_pairs, show_progress_bar=False)
+            except Exception as e:
+                print(f"[WARN] Reranking failed: {e}. Returning original order.")
+                return [docs[:top_k] for docs in docs_per_query]
+            for positions, score in zip(todo.values(), new_scores):
+                for i in positions:
+                    scores[i] = float(score)
+            if self.rerank_score_cache is not None:
+                self.rerank_score_cache.put_many([keys[i] for i in todo_idx], [scores[i] for i in todo_idx])
+
+        results = []
+        offset = 0
+        kept = 0
+        for docs in docs_per_query:
+            for doc, score in zip(docs, scores[offset:offset + len(docs)]):
                 doc["rerank_score"] = float(score)
-            
+            offset += len(docs)
+
             sorted_docs = sorted(docs, key=lambda x: x["rerank_score"], reverse=True)
             filtered_docs = [d for d in sorted_docs if d["rerank_score"] > self.min_rerank_score]
-            
-            end_time = time.time()
-            print(f"[OK] Reranking finished in {end_time - start_time:.2f}s. "
-                  f"Filtered {len(sorted_docs)} -> {len(filtered_docs)} docs.")
-            
-            return filtered_docs[:top_k]
-        
+            kept += len(filtered_docs)
+            results.append(filtered_docs[:top_k])
+
+        end_time = time.time()
+        print(f"[OK] Reranking finished in {end_time - start_time:.2f}s. "
+              f"Filtered {len(pairs)} -> {kept} docs.")
+        return results
+
+    def _run_cascade_rerank(self,
+                            queries: List[str],
+                            docs_per_query: List[List[Dict[str, Any]]],
+                            kg_docs_per_query: List[List[Dict[str, Any]]],
+                            top_k: int) -> List[List[Dict[str, Any]]]:
+        """
+        两阶段重排序
+            - 只问代码且知识图谱精确命中的查询：不调用 CrossEncoder
+            - 其余查询：bi-encoder 分数 + 词重叠率剪枝，只对前 top_k * RERANK_CASCADE_KEEP 个做 rerank
+        """
+        keep = max(top_k, int(round(top_k * RERANK_CASCADE_KEEP)))
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+        rerank_slots, rerank_docs = [], []
+
+        for i, (query, docs, kg_docs) in enumerate(zip(queries, docs_per_query, kg_docs_per_query)):
+            entities = self._extract_entities(query)
+            direct = rerank_cascade.kg_exact_answer(query, entities, kg_docs, docs, top_k, KG_EXACT_HIT_SCORE)
+            if direct is not None:
+                print(f"[Cascade] '{query}': exact KG hit for {sorted(entities)}, "
+                      f"skipped reranking {len(docs)} pairs.")
+                results[i] = direct
+                continue
+
+            survivors = rerank_cascade.prune_candidates(query, docs, keep, RERANK_CASCADE_LEXICAL_WEIGHT)
+            if len(survivors) < len(docs):
+                print(f"[Cascade] '{query}': {len(docs)} -> {len(survivors)} candidates, "
+                      f"saved {len(docs) - len(survivors)} rerank pairs.")
+            rerank_slots.append(i)
+            rerank_docs.append(survivors)
+
+        if rerank_slots:
+            reranked = self._run_rerank_many([queries[i] for i in rerank_slots], rerank_docs, top_k)
+            for i, docs in zip(rerank_slots, reranked):
+                results[i] = docs
+        return results
+
+    def _vector_channel(self,
+                        queries: List[str],
+                        initial_k: int,
+                        embeddings: Optional[List[Any]] = None) -> List[List[SearchResult]]:
+        """
+        向量通道：一次批量检索
+
+        Args:
+            embeddings: 可选，与 queries 对应的查询向量（已经 encode 过时不再重复 encode）
+        """
+        if not self.searcher:
+            return [[] for _ in queries]
+        start_time = time.time()
+        if embeddings is not None:
+            responses = self.searcher.search_many_by_embedding(embeddings, list(queries), top_k=initial_k)
+        else:
+            responses = self.searcher.search_many(list(queries), top_k=initial_k)
+        results = [r.results for r in responses]
+        print(f"Found {sum(len(r) for r in results)} vector results for {len(queries)} queries "
+              f"({time.time() - start_time:.2f}s).")
+        return results
+
+    def _lexical_channel(self, queries: List[str], initial_k: int) -> List[List[SearchResult]]:
+        """
+        BM25 通道：补充课程代码、科目名、UOC / 学期代码等关键词召回
+
+        只由 BM25 召回的分块没有向量距离，score 记为 0.0、distance 记为 1.0。
+        """
+        if self.bm25 is None or not self.searcher:
+            return [[] for _ in queries]
+        start_time = time.time()
+        hits_per_query = self.bm25.search_many(queries, top_k=initial_k)
+        docs = self.searcher.get_by_ids(list({self.bm25.ids[row] for hits in hits_per_query for row, _ in hits}))
+        results = []
+        for hits in hits_per_query:
+            query_results = []
+            for row, _ in hits:
+                doc = docs.get(self.bm25.ids[row])
+                if doc is None:
+                    # postings 文件比向量库旧
+                    continue
+                meta = doc["metadata"] or {}
+                query_results.append(SearchResult(
+                    id=doc["id"],
+                    text=doc["text"],
+                    metadata=meta,
+                    distance=1.0,
+                    score=0.0,
+                    source_type=meta.get('source_type', 'unknown')
+                ))
+            results.append(query_results)
+        print(f"Found {sum(len(r) for r in results)} BM25 results for {len(queries)} queries "
+              f"({time.time() - start_time:.2f}s).")
+        return results
+
+    @staticmethod
+    def _fuse_rrf(dense: List[SearchResult], lexical: List[SearchResult], limit: int) -> List[SearchResult]:
+        """
+        Reciprocal rank fusion: score(d) = sum 1 / (RRF_K + rank)
+
+        两个通道都命中的分块保留向量通道的 SearchResult（带 bi-encoder 分数）
+        """
+        if not lexical:
+            return dense[:limit]
+        fused: Dict[str, float] = {}
+        by_id: Dict[str, SearchResult] = {}
+        for results in (dense, lexical):
+            for rank, result in enumerate(results, 1):
+                fused[result.id] = fused.get(result.id, 0.0) + 1.0 / (RRF_K + rank)
+                by_id.setdefault(result.id, result)
+        order = sorted(fused, key=lambda doc_id: fused[doc_id], reverse=True)
+        return [by_id[doc_id] for doc_id in order[:limit]]
+
+    def _knowledge_graph(self) -> Optional[KnowledgeGraphQuery]:
+        """
+        最近一次加载的实例，不阻塞检索
+
+        每 KG_RELOAD_CHECK_INTERVAL 秒最多 stat 一次图文件；变化时在后台线程里走共享注册表
+        （内容哈希 + 反序列化 + 邻接索引 / 传递闭包），完成后替换 self.kg_query。
+        重新加载期间（以及失败时）通道继续使用旧实例。
+        """
+        if self.kg_query is None or self._kg_watch is None:
+            return self.kg_query
+        # 另一个检索正在检查时直接跳过，不排队等锁
+        if self._kg_watch_lock.acquire(blocking=False):
+            try:
+                if self._kg_watch.changed():
+                    self._start_kg_reload()
+            finally:
+                self._kg_watch_lock.release()
+        return self.kg_query
+
+    def _start_kg_reload(self):
+        """后台重新加载知识图谱（同时最多一个重新加载线程；调用方持有 _kg_watch_lock）"""
+        if self._kg_reload_thread is not None and self._kg_reload_thread.is_alive():
+            # 正在加载的可能是变化前的文件，下一次检查再确认一遍
+            self._kg_watch.version = None
+            return
+        self._kg_reload_thread = threading.Thread(
+            target=self._reload_knowledge_graph, name="kg-reload", daemon=True
+        )
+        self._kg_reload_thread.start()
+
+    def _reload_knowledge_graph(self):
+        start = time.time()
+        try:
+            kg_query = get_knowledge_graph(str(self.kg_path))
         except Exception as e:
-            print(f"[WARN] Reranking failed: {e}. Returning original order.")
-            return docs[:top_k]
-    
-    def search(self, query: str, top_k: int = 8) -> List[Dict[str, Any]]:
+            print(f"[WARN] Knowledge graph reload failed, keeping the loaded graph: {e}")
+            # 下一次检查重新尝试（例如文件还在写入）
+            with self._kg_watch_lock:
+                self._kg_watch.version = None
+            return
+        if kg_query is not self.kg_query:
+            self.kg_query = kg_query
+            self._kg_generation += 1
+            # 旧图算出的结果 / 分数立即作废，不等缓存自己的版本检查间隔
+            for cache in (self.result_cache, self.rerank_score_cache):
+                if cache is not None:
+                    cache.clear()
+            print(f"[OK] Knowledge graph swapped in after background reload ({time.time() - start:.2f}s)")
+
+    def _kg_channel(self, queries: List[str]) -> List[List[Dict[str, Any]]]:
+        """知识图谱通道：所有查询的实体一次性解析"""
+        kg_query = self._knowledge_graph()
+        if not kg_query:
+            return [[] for _ in queries]
+        entities_per_query = [self._extract_entities(query) for query in queries]
+        all_entities = [e for entities in entities_per_query for e in entities]
+        if not all_entities:
+            return [[] for _ in queries]
+
+        print(f"Found entities in queries: {sorted(set(all_entities))}")
+        nodes = kg_query.get_nodes_info(all_entities)
+        results = []
+        for entities in entities_per_query:
+            kg_docs = []
+            for entity in entities:
+                node_data = nodes.get(entity)
+                if node_data:
+                    s_doc = self._standardize_kg_doc(node_data, entity)
+                    if s_doc:
+                        kg_docs.append(s_doc)
+            results.append(kg_docs)
+        return results
+
+    def _run_channels(self, queries: List[str], initial_k: int, embeddings: Optional[List[Any]] = None):
         """
-        核心混合检索方法
-        
+        并行执行向量通道、BM25 通道和知识图谱通道
+
+        embeddings 为与 queries 对应的查询向量（可选），传给向量通道。
+
+        每个通道有独立的超时（从该通道开始执行时计时），超时或出错的通道返回空结果，
+        不影响其他通道。
+
         Returns:
-            List[Dict]: 标准化的文档列表，格式：
-                {
-                    "_text": str,
-                    "_metadata": dict,
-                    "_score": float
-                }
+            (vs_results, lexical_results, kg_results, degraded)，degraded 表示有通道超时或出错
         """
-        self.ensure_initialized()  # 懒加载
-        
-        print(f"\n--- Starting Hybrid Search for query: '{query}' ---")
-        
-        initial_k = max(top_k * self.initial_k_multiplier, 15)
-        standardized_docs = []
-        seen = set()
+        channels = [
+            ("Vector Search", self._vector_channel, (queries, initial_k, embeddings), VECTOR_CHANNEL_TIMEOUT),
+            ("Lexical", self._lexical_channel, (queries, initial_k), LEXICAL_CHANNEL_TIMEOUT),
+            ("Knowledge Graph", self._kg_channel, (queries,), KG_CHANNEL_TIMEOUT),
+        ]
+        failed = []
 
-        # 1. Vector Search
-        if self.searcher:
-            try:
-                vs_response = self.searcher.search(query, top_k=initial_k)
-                vs_results = vs_response.results
-                print(f"Found {len(vs_results)} vector results.")
-
-                for doc in vs_results:
-                    s_doc = self._standardize_vector_doc(doc)
-                    if not s_doc:
-                        continue
-                    
-                    doc_id = s_doc.get('url') or s_doc.get('title')
-                    if doc_id and doc_id not in seen:
-                        standardized_docs.append(s_doc)
-                        seen.add(doc_id)
-            except Exception as e:
-                print(f"[WARN] Vector Search failed: {e}")
-        
-        # 2. Knowledge Graph
-        if self.kg_query:
-            try:
-                entities = self._extract_entities(query)
-                if entities:
-                    print(f"Found entities in query: {entities}")
-                    
-                    for entity in entities:
-                        node_data = self.kg_query.get_course_info(entity)
-                        if not node_data:
-                            node_data = self.kg_query.get_major_info(entity)
-                        
-                        if node_data:
-                            s_doc = self._standardize_kg_doc(node_data, entity)
-                            if not s_doc:
-                                continue
-                            
-                            doc_id = s_doc.get('url') or s_doc.get('title')
-                            if doc_id and doc_id not in seen:
-                                standardized_docs.append(s_doc)
-                                seen.add(doc_id)
-            except Exception as e:
-                print(f"[WARN] Knowledge Graph Search failed: {e}")
+        if self._channel_pool is None:
+            # 串行回退
+            results = []
+            for name, fn, args, _ in channels:
+                try:
+                    results.append(fn(*args))
+                except Exception as e:
+                    print(f"[WARN] {name} channel failed: {e}")
+                    failed.append(name)
+                    results.append([[] for _ in queries])
+            return (*results, bool(failed))
 
-        print(f"Total {len(standardized_docs)} unique documents merged.")
+        start_time = time.time()
+        started = [threading.Event() for _ in channels]
+        started_at = [0.0] * len(channels)
 
-        # 3. Rerank
-        reranked_docs = self._run_rerank(query, standardized_docs, top_k)
-        
-        # 4. 格式化为标准输出
+        def run(i, fn, args):
+            started_at[i] = time.time()
+            started[i].set()
+            return fn(*args)
+
+        futures = [self._channel_pool.submit(run, i, fn, args) for i, (_, fn, args, _) in enumerate(channels)]
+
+        def collect(i, timeout, name):
+            # 超时从通道开始执行时计算；排队等待线程的时间另有同样长的上限
+            future = futures[i]
+            queue_wait = max(0.0, timeout - (time.time() - start_time))
+            if started[i].wait(queue_wait):
+                try:
+                    return future.result(timeout=max(0.0, started_at[i] + timeout - time.time()))
+                except FutureTimeoutError:
+                    # 已在运行的通道无法中断，结果丢弃，线程执行完后自动归还
+                    print(f"[WARN] {name} channel timed out after {timeout:.1f}s, continuing without it.")
+                except Exception as e:
+                    print(f"[WARN] {name} channel failed: {e}")
+            else:
+                # 还在排队：取消后不再占用线程（cancel 失败说明刚开始执行，同样丢弃结果）
+                future.cancel()
+                print(f"[WARN] {name} channel waited {timeout:.1f}s for a worker thread, continuing without it.")
+            failed.append(name)
+            return [[] for _ in queries]
+
+        # 超时短的通道先收
+        results: List[Any] = [None] * len(channels)
+        for i in sorted(range(len(channels)), key=lambda i: channels[i][3]):
+            name, _, _, timeout = channels[i]
+            results[i] = collect(i, timeout, name)
+        print(f"Retrieval channels finished in {time.time() - start_time:.2f}s.")
+        return (*results, bool(failed))
+
+    @staticmethod
+    def _merge_candidates(vs_docs: List[Dict[str, Any]], kg_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """合并单个查询的两个通道结果（向量结果在前，按 url/title 去重）"""
+        standardized_docs = []
+        seen = set()
+        for s_doc in list(vs_docs) + list(kg_docs):
+            doc_id = rerank_cascade.doc_key(s_doc)
+            if doc_id and doc_id not in seen:
+                standardized_docs.append(s_doc)
+                seen.add(doc_id)
+        return standardized_docs
+
+    @staticmethod
+    def _format_final_docs(reranked_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """格式化为标准输出"""
         final_docs = []
         for doc in reranked_docs:
             final_docs.append({
@@ -467,9 +1150,138 @@ class HybridSearchService:
                 },
                 "_score": doc.get("rerank_score", 0)
             })
-
+        return final_docs
+    
+    def search(self, query: str, top_k: int = 8) -> List[Dict[str, Any]]:
+        """
+        核心混合检索方法
+        
+        Returns:
+            List[Dict]: 标准化的文档列表，格式：
+                {
+                    "_text": str,
+                    "_metadata": dict,
+                    "_score": float
+                }
+        """
+        print(f"\n--- Starting Hybrid Search for query: '{query}' ---")
+        final_docs = self.search_many([query], top_k)[0]
         print(f"--- Hybrid Search finished, returning {len(final_docs)} docs ---")
         return final_docs
+
+    def search_many(self, queries: List[str], top_k: int = 8) -> List[List[Dict[str, Any]]]:
+        """
+        批量混合检索：每个阶段对所有查询只调用一次模型
+            - 向量检索: 一次 encode + 一次矩阵乘
+            - BM25: 倒排索引，与向量结果做 RRF 融合
+            - 知识图谱: 所有实体一次解析（与向量检索并行）
+            - 重排序: 一次 CrossEncoder.predict
+        命中结果缓存的查询跳过以上全部步骤。
+
+        Returns:
+            与 queries 顺序一致的文档列表（每个元素的格式同 search()）
+        """
+        self.ensure_initialized()  # 懒加载
+        if not queries:
+            return []
+        if self.result_cache is None:
+            return self._search_many_uncached(list(queries), top_k)[0]
+
+        cache = self.result_cache
+        # 实体（课程代码等）作为 guard：近似层不会把 COMP3900 的结果给 COMP3901
+        scopes = [cache.make_scope(top_k, guard=sorted(self._extract_entities(q))) for q in queries]
+        keys = [cache.make_key(q, scope) for q, scope in zip(queries, scopes)]
+        results: List[Optional[List[Dict[str, Any]]]] = [cache.get(key) for key in keys]
+        pending = [i for i, r in enumerate(results) if r is None]
+
+        embeddings = {}
+        if pending and cache.similarity_enabled and self.searcher:
+            # 这里算出的查询向量直接交给向量通道，不再 encode 第二次
+            vectors = self.searcher._get_query_embeddings([queries[i] for i in pending])
+            for i, vec in zip(pending, vectors):
+                results[i] = cache.get_similar(scopes[i], vec)
+                embeddings[i] = vec
+            pending = [i for i in pending if results[i] is None]
+
+        hits = len(queries) - len(pending)
+        if hits:
+            print(f"[OK] Search result cache: {hits}/{len(queries)} queries served from cache.")
+        if not pending:
+            return results
+
+        cache.record_miss(len(pending))
+        kg_generation = self._kg_generation
+        pending_embeddings = [embeddings[i] for i in pending] if embeddings else None
+        fresh, degraded = self._search_many_uncached([queries[i] for i in pending], top_k, pending_embeddings)
+        # 检索期间换入了新知识图谱时，这批结果是旧图算的，不缓存
+        cacheable = not degraded and kg_generation == self._kg_generation
+        for i, docs in zip(pending, fresh):
+            results[i] = docs
+            # 通道超时 / 出错时的残缺结果不缓存
+            if cacheable:
+                cache.put(keys[i], docs, embedding=embeddings.get(i))
+        return results
+
+    def _search_many_uncached(self,
+                              queries: List[str],
+                              top_k: int,
+                              embeddings: Optional[List[Any]] = None) -> Tuple[List[List[Dict[str, Any]]], bool]:
+        """
+        search_many 的实际检索流程（不经过结果缓存）
+
+        Args:
+            embeddings: 可选，已经算好的查询向量（结果缓存近似层 encode 过的）
+
+        Returns:
+            (每个查询的文档列表, 是否有检索通道降级)
+        """
+        initial_k = max(top_k * self.initial_k_multiplier, 15)
+
+        # 1. 向量通道 + BM25 通道 + 知识图谱通道（并行）
+        vs_results_per_query, lexical_per_query, kg_docs_per_query, degraded = \
+            self._run_channels(list(queries), initial_k, embeddings)
+
+        # 2. 合并（向量 + BM25 先做 RRF，再与知识图谱结果去重合并）
+        docs_per_query = []
+        for vs_results, lexical_results, kg_docs in zip(vs_results_per_query, lexical_per_query, kg_docs_per_query):
+            vs_results = self._fuse_rrf(vs_results, lexical_results, initial_k)
+            vs_docs = [d for d in (self._standardize_vector_doc(doc) for doc in vs_results) if d]
+            docs_per_query.append(self._merge_candidates(vs_docs, kg_docs))
+        print(f"Total {sum(len(d) for d in docs_per_query)} unique documents merged.")
+
+        # 3. Rerank（批量，级联时先剪枝）
+        if ENABLE_RERANK_CASCADE and self.reranker:
+            reranked_per_query = self._run_cascade_rerank(
+                list(queries), docs_per_query, kg_docs_per_query, top_k
+            )
+        else:
+            reranked_per_query = self._run_rerank_many(list(queries), docs_per_query, top_k)
+        
+        # 4. 格式化为标准输出
+        return [self._format_final_docs(reranked) for reranked in reranked_per_query], degraded
+    
+    async def _run_in_pool(self, fn, *args, cancel_event: Optional[asyncio.Event] = None):
+        """在有界线程池中执行阻塞的检索，cancel_event 被设置时立即放弃等待"""
+        return await run_in_pool(self._search_pool, fn, *args, cancel_event=cancel_event)
+
+    async def asearch(self,
+                      query: str,
+                      top_k: int = 8,
+                      cancel_event: Optional[asyncio.Event] = None) -> List[Dict[str, Any]]:
+        """
+        search() 的异步版本：模型推理在专用的有界线程池中执行，不阻塞事件循环
+
+        Args:
+            cancel_event: run_chat 的 cancel_event，被设置时抛出 asyncio.CancelledError
+        """
+        return await self._run_in_pool(self.search, query, top_k, cancel_event=cancel_event)
+
+    async def asearch_many(self,
+                           queries: List[str],
+                           top_k: int = 8,
+                           cancel_event: Optional[asyncio.Event] = None) -> List[List[Dict[str, Any]]]:
+        """search_many() 的异步版本"""
+        return await self._run_in_pool(self.search_many, list(queries), top_k, cancel_event=cancel_event)
     
     def get_stats(self) -> Optional[Dict[str, Any]]:
         """获取服务统计信息"""
@@ -477,7 +1289,16 @@ class HybridSearchService:
         if not self.searcher:
             return None
         try:
-            return self.searcher.get_collection_stats()
+            stats = self.searcher.get_collection_stats()
+            if stats is not None and self.rerank_batcher is not None:
+                stats["rerank_batcher"] = self.rerank_batcher.stats()
+            if stats is not None and self.result_cache is not None:
+                stats["result_cache"] = self.result_cache.stats()
+            if stats is not None and self.bm25 is not None:
+                stats["bm25"] = self.bm25.stats()
+            if stats is not None and self.rerank_score_cache is not None:
+                stats["rerank_score_cache"] = self.rerank_score_cache.stats()
+            return stats
         except Exception as e:
             print(f"Error in get_stats: {e}")
             return None
@@ -496,14 +1317,15 @@ class HybridSearchService:
 
 # --- 5. 全局单例实例 ---
 
-_HYBRID_SERVICE: Optional[HybridSearchService] = None
+_HYBRID_SERVICE = None  # HybridSearchService 或 RetrievalClient
 _SERVICE_LOCK = threading.Lock()
 
-def get_hybrid_search_service() -> HybridSearchService:
+def get_hybrid_search_service():
     """
     获取混合检索服务的单例实例
     
-    线程安全，确保只初始化一次
+    线程安全，确保只初始化一次。设置了 RETRIEVAL_SERVER_SOCKET 时返回
+    RetrievalClient（接口相同），模型由 retrieval_sidecar 进程持有。
     """
     global _HYBRID_SERVICE
     
@@ -514,7 +1336,19 @@ def get_hybrid_search_service() -> HybridSearchService:
         if _HYBRID_SERVICE is not None:
             return _HYBRID_SERVICE
         
-        _HYBRID_SERVICE = HybridSearchService()
+        if RETRIEVAL_SERVER_SOCKET:
+            print(f"[OK] Using retrieval sidecar at {RETRIEVAL_SERVER_SOCKET}")
+            _HYBRID_SERVICE = RetrievalClient(RETRIEVAL_SERVER_SOCKET)
+        else:
+            _HYBRID_SERVICE = HybridSearchService()
+        return _HYBRID_SERVICE
+
+def use_local_service() -> HybridSearchService:
+    """强制本进程在进程内加载模型（retrieval_sidecar 自身使用）"""
+    global _HYBRID_SERVICE
+    with _SERVICE_LOCK:
+        if not isinstance(_HYBRID_SERVICE, HybridSearchService):
+            _HYBRID_SERVICE = HybridSearchService()
         return _HYBRID_SERVICE
 
 
@@ -529,6 +1363,49 @@ def parallel_search_and_rerank(query: str, top_k: int = 8) -> List[Dict[str, Any
     service = get_hybrid_search_service()
     return service.search(query, top_k)
 
+def parallel_search_and_rerank_many(queries: List[str], top_k: int = 8) -> List[List[Dict[str, Any]]]:
+    """
+    批量版本：多个查询（改写 / 子查询）共享一次 encode 和一次 rerank
+    """
+    service = get_hybrid_search_service()
+    return service.search_many(queries, top_k)
+
+async def aparallel_search_and_rerank(query: str,
+                                     top_k: int = 8,
+                                     cancel_event: Optional[asyncio.Event] = None) -> List[Dict[str, Any]]:
+    """
+    [异步入口] 混合检索 + 重排序，不阻塞事件循环
+    """
+    service = get_hybrid_search_service()
+    return await service.asearch(query, top_k, cancel_event=cancel_event)
+
+async def aparallel_search_and_rerank_many(queries: List[str],
+                                           top_k: int = 8,
+                                           cancel_event: Optional[asyncio.Event] = None) -> List[List[Dict[str, Any]]]:
+    """[异步入口] 批量版本"""
+    service = get_hybrid_search_service()
+    return await service.asearch_many(queries, top_k, cancel_event=cancel_event)
+
+def warmup_hybrid_search():
+    """[启动入口] 预加载并预热检索组件（apps.py 调用）"""
+    get_hybrid_search_service().warmup()
+
+def preload_hybrid_search():
+    """
+    [启动入口] 只加载检索组件、不做推理（gunicorn preload 时在 master 里调用）
+
+    推理会在 master 里创建 torch 的 OpenMP 线程池，fork 之后子进程再用会卡死，
+    预热留给各 worker 在 fork 之后完成（warmup_hybrid_search）。
+    """
+    get_hybrid_search_service().ensure_initialized()
+
+def reset_after_fork():
+    """[gunicorn post_fork] 重建单例里不能跨 fork 继承的线程 / 锁 / 连接"""
+    global _SERVICE_LOCK
+    _SERVICE_LOCK = threading.Lock()
+    if _HYBRID_SERVICE is not None:
+        _HYBRID_SERVICE.reset_after_fork()
+
 def get_stats() -> Optional[Dict[str, Any]]:
     """获取统计信息（向后兼容）"""
     service = get_hybrid_search_service()
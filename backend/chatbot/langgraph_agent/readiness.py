@@ -0,0 +1,62 @@
+# backend/chatbot/langgraph_agent/readiness.py
+# 启动就绪状态（每个 worker 进程一份）
+#
+# apps.py 在启动时预加载模型 / 编译图，各组件把加载耗时记录在这里，
+# /ready 接口据此返回 200（就绪）或 503（仍在加载）。
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class ReadinessRegistry:
+    """记录各组件的加载状态和耗时（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._components: Dict[str, Dict[str, Any]] = {}
+        self._started_at = time.time()
+        self._ready_at: Optional[float] = None
+        self._mode = "eager"
+        self._error: Optional[str] = None
+
+    def record(self, name: str, seconds: float, error: Optional[str] = None):
+        """记录一个组件的加载结果"""
+        with self._lock:
+            self._components[name] = {
+                "status": "failed" if error else "ready",
+                "seconds": round(seconds, 3),
+                **({"error": error} if error else {}),
+            }
+
+    def mark_ready(self, mode: str = "eager"):
+        with self._lock:
+            self._mode = mode
+            self._ready_at = time.time()
+
+    def mark_failed(self, error: str):
+        """启动流程本身出错：仍然标记为就绪（请求会走懒加载），但在状态里给出错误"""
+        with self._lock:
+            self._error = error
+            self._ready_at = time.time()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready_at is not None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            components = {name: dict(info) for name, info in self._components.items()}
+            return {
+                "ready": self._ready_at is not None,
+                "mode": self._mode,
+                "pid": os.getpid(),
+                "degraded": any(c["status"] == "failed" for c in components.values()) or bool(self._error),
+                "startup_seconds": round((self._ready_at or time.time()) - self._started_at, 3),
+                "components": components,
+                **({"error": self._error} if self._error else {}),
+            }
+
+
+READINESS = ReadinessRegistry()
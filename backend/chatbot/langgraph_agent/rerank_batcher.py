@@ -0,0 +1,143 @@
+# backend/chatbot/langgraph_agent/rerank_batcher.py
+# CrossEncoder 跨请求微批处理
+#
+# 并发的对话轮次各自调用 reranker.predict 会争抢同一批 CPU 线程。
+# 这里所有请求把 (query, passage) 对放进同一个队列，由单个 worker 线程
+# 凑够 max_batch_pairs 个或等待 max_wait_ms 后合并成一次 predict，
+# 再通过 Future 把各自的分数切片还给调用方。
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_STOP = object()
+
+
+class RerankBatcher:
+    """单 worker 的 CrossEncoder 微批处理器"""
+
+    def __init__(self,
+                 model,
+                 max_batch_pairs: int = 64,
+                 max_wait_ms: float = 5.0,
+                 predict_batch_size: int = 32):
+        """
+        Args:
+            model: 带 predict(pairs, batch_size=..., show_progress_bar=...) 的 CrossEncoder
+            max_batch_pairs: 凑够这么多对就立即 flush
+            max_wait_ms: 第一个请求到达后最多再等多久
+            predict_batch_size: 传给 CrossEncoder.predict 的 batch_size
+        """
+        self.model = model
+        self.max_batch_pairs = max_batch_pairs
+        self.max_wait = max_wait_ms / 1000.0
+        self.predict_batch_size = predict_batch_size
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.pairs = 0
+        self.predict_seconds = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._worker.start()
+
+    # ------------------------------------------------------------------
+    # 公共接口
+    # ------------------------------------------------------------------
+
+    def submit(self, pairs: Sequence[Tuple[str, str]]) -> Future:
+        """提交一组 (query, passage)，返回结果为 np.ndarray 分数的 Future"""
+        future: Future = Future()
+        if not pairs:
+            future.set_result(np.zeros(0, dtype=np.float32))
+            return future
+        self._queue.put((list(pairs), future))
+        return future
+
+    def predict(self, pairs: Sequence[Tuple[str, str]], timeout: Optional[float] = None) -> np.ndarray:
+        """同步接口：与 CrossEncoder.predict 的返回一致"""
+        return self.submit(pairs).result(timeout=timeout)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._worker.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "pairs": self.pairs,
+                "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "avg_pairs_per_batch": round(self.pairs / self.batches, 2) if self.batches else 0.0,
+                "predict_seconds": round(self.predict_seconds, 3),
+            }
+
+    # ------------------------------------------------------------------
+    # worker
+    # ------------------------------------------------------------------
+
+    def _collect(self, first) -> Tuple[List[Tuple[List, Future]], bool]:
+        """从第一个请求开始攒批，返回 (本批请求, 是否收到停止信号)"""
+        batch = [first]
+        total = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while total < self.max_batch_pairs:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            total += len(item[0])
+        return batch, False
+
+    def _flush(self, batch: List[Tuple[List, Future]]):
+        # 调用方可能已经取消（超时），跳过这些请求
+        batch = [(pairs, future) for pairs, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        all_pairs = [pair for pairs, _ in batch for pair in pairs]
+        start = time.perf_counter()
+        try:
+            scores = np.asarray(
+                self.model.predict(all_pairs, batch_size=self.predict_batch_size, show_progress_bar=False),
+                dtype=np.float32
+            ).reshape(-1)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - start
+
+        offset = 0
+        for pairs, future in batch:
+            future.set_result(scores[offset:offset + len(pairs)])
+            offset += len(pairs)
+
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.pairs += len(all_pairs)
+            self.predict_seconds += elapsed
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+            self._flush(batch)
+            if stop:
+                return
@@ -0,0 +1,123 @@
+# backend/chatbot/langgraph_agent/rerank_cascade.py
+# 两阶段重排序的廉价第一阶段
+#
+# bge-reranker-base 对每个候选都要跑一遍完整的 cross-attention。这里先用已有的信号
+# （向量检索的 bi-encoder 分数 + 查询词重叠率）给候选打分，只把前面的候选交给 CrossEncoder；
+# 对只包含课程/专业代码的查询（"Tell me about COMP3900"），知识图谱精确命中就直接作为答案。
+
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# 代码型查询里常见的引导词，去掉后什么都不剩就视为"只问代码"
+_FILLER_WORDS = frozenset("""
+a an the me about tell what whats is are of on for in info information details detail
+show give describe explain overview summary course courses major majors program
+please can you i want to know
+""".split())
+
+_STOP_WORDS = _FILLER_WORDS | frozenset("""
+and or with which who how do does i my it this that be there any
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def is_code_only_query(query: str, entities: Sequence[str]) -> bool:
+    """去掉实体代码和引导词之后没有剩余内容"""
+    if not entities:
+        return False
+    codes = {e.lower() for e in entities}
+    return all(t in codes or t in _FILLER_WORDS for t in tokenize(query))
+
+
+def lexical_overlap(query_terms: set, doc: Dict[str, Any]) -> float:
+    """查询词（去停用词）在 title + snippet 里出现的比例"""
+    if not query_terms:
+        return 0.0
+    doc_terms = set(tokenize(f"{doc.get('title', '')} {doc.get('snippet') or doc.get('_text', '')}"))
+    return len(query_terms & doc_terms) / len(query_terms)
+
+
+def prune_candidates(query: str,
+                     docs: List[Dict[str, Any]],
+                     keep: int,
+                     lexical_weight: float = 0.5) -> List[Dict[str, Any]]:
+    """
+    第一阶段：按 bi-encoder 分数与词重叠率的加权和保留前 keep 个候选
+
+    知识图谱结果是实体精确命中，总是保留。
+
+    Args:
+        query: 用户查询
+        docs: 合并后的候选（_merge_candidates 的输出）
+        keep: 保留的候选数
+        lexical_weight: 词重叠率的权重，(1 - lexical_weight) 给 bi-encoder 分数
+
+    Returns:
+        保留的候选（保持原来的相对顺序）
+    """
+    if len(docs) <= keep:
+        return docs
+
+    query_terms = {t for t in tokenize(query) if t not in _STOP_WORDS}
+    scored = []
+    for pos, doc in enumerate(docs):
+        if doc.get("source_type") == "knowledge_graph":
+            continue
+        dense = doc.get("original_score") or 0.0
+        cheap = (1.0 - lexical_weight) * dense + lexical_weight * lexical_overlap(query_terms, doc)
+        doc["cascade_score"] = cheap
+        scored.append((cheap, pos))
+
+    kept = {pos for pos, doc in enumerate(docs) if doc.get("source_type") == "knowledge_graph"}
+    for _, pos in sorted(scored, reverse=True):
+        if len(kept) >= keep:
+            break
+        kept.add(pos)
+    return [doc for pos, doc in enumerate(docs) if pos in kept]
+
+
+def doc_key(doc: Dict[str, Any]) -> Optional[str]:
+    """候选的去重键（与 HybridSearchService._merge_candidates 相同：url，其次 title）"""
+    return doc.get("url") or doc.get("title")
+
+
+def kg_exact_answer(query: str,
+                    entities: Sequence[str],
+                    kg_docs: List[Dict[str, Any]],
+                    docs: List[Dict[str, Any]],
+                    top_k: int,
+                    exact_score: float) -> Optional[List[Dict[str, Any]]]:
+    """
+    只问代码且每个代码都在知识图谱里精确命中时，跳过 CrossEncoder
+
+    Args:
+        kg_docs: 知识图谱通道的原始结果（判断是否每个代码都命中）
+        docs: 合并去重后的候选（结果只从这里取）
+
+    Returns:
+        精确命中的候选（知识图谱结果，或与其 url 相同而在合并时保留下来的向量结果）在前，
+        分数为 exact_score；其余候选以 bi-encoder 分数作为 rerank_score 排在后面，取前 top_k 个。
+        不满足条件时返回 None
+    """
+    if not is_code_only_query(query, entities):
+        return None
+    hit_ids = {doc.get("doc_id") for doc in kg_docs}
+    if not all(f"kg:{e.upper()}" in hit_ids for e in entities):
+        return None
+
+    exact_keys = {doc_key(doc) for doc in kg_docs} - {None}
+    exact, rest = [], []
+    for doc in docs:
+        if doc.get("source_type") == "knowledge_graph" or doc_key(doc) in exact_keys:
+            doc["rerank_score"] = exact_score
+            exact.append(doc)
+        else:
+            doc["rerank_score"] = float(doc.get("original_score") or 0.0)
+            rest.append(doc)
+    rest.sort(key=lambda d: d["rerank_score"], reverse=True)
+    return (exact + rest)[:top_k]
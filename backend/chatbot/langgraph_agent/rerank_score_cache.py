@@ -0,0 +1,98 @@
+# backend/chatbot/langgraph_agent/rerank_score_cache.py
+# CrossEncoder 分数缓存
+#
+# 多轮检索（agentic_router -> retrieve -> evaluate_retrieval -> retrieve）经常用相同或改写后的
+# 查询对同一批 chunk 重排序。这里按 (查询哈希, chunk id) 缓存分数，只有没见过的 pair 才送去 predict。
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+try:
+    from .search_result_cache import VersionWatch
+except ImportError:
+    from backend.chatbot.langgraph_agent.search_result_cache import VersionWatch
+
+ScoreKey = Tuple[str, str]
+
+
+def query_digest(query: str) -> str:
+    """CrossEncoder 区分大小写，这里只去掉首尾空白"""
+    return hashlib.blake2b((query or "").strip().encode("utf-8"), digest_size=16).hexdigest()
+
+
+class RerankScoreCache:
+    """线程安全的 (query, chunk id) -> score LRU"""
+
+    def __init__(self,
+                 max_entries: int = 20000,
+                 version_fn: Optional[Callable[[], Hashable]] = None,
+                 version_check_interval: float = 5.0):
+        """
+        Args:
+            max_entries: 最多缓存的 pair 数
+            version_fn: 返回当前数据版本；chunk id 只在同一次构建内稳定，版本变化时清空
+            version_check_interval: 两次检查版本的最小间隔（秒）
+        """
+        self.max_entries = max(1, max_entries)
+
+        self._lock = threading.Lock()
+        self._scores: "OrderedDict[ScoreKey, float]" = OrderedDict()
+        self._version = VersionWatch(version_fn, version_check_interval, name="rerank cache")
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_keys(query: str, chunk_ids: Sequence[str]) -> List[ScoreKey]:
+        digest = query_digest(query)
+        return [(digest, chunk_id) for chunk_id in chunk_ids]
+
+    def get_many(self, keys: Sequence[ScoreKey]) -> List[Optional[float]]:
+        """按顺序返回分数，未命中为 None"""
+        with self._lock:
+            self._check_version()
+            scores = []
+            for key in keys:
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                scores.append(score)
+            return scores
+
+    def put_many(self, keys: Sequence[ScoreKey], scores: Sequence[float]):
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._scores[key] = float(score)
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._scores),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _check_version(self):
+        if self._version.changed():
+            self._scores.clear()
+            self.invalidations += 1
@@ -0,0 +1,345 @@
+# backend/chatbot/langgraph_agent/retrieval_sidecar.py
+# 检索 sidecar：一个进程持有全部检索模型，多个 web worker 通过 Unix socket 共享
+#
+# uvicorn --workers 4 时每个 worker 各加载一份 SentenceTransformer / bge-reranker-base / 知识图谱，
+# 内存翻 4 倍，每个 worker 只能用到 1/4 的 CPU。开启 sidecar 后:
+#   - sidecar 进程加载并预热 HybridSearchService，在 Unix socket 上提供 search / encode / rerank
+#   - web worker 设置 RETRIEVAL_SERVER_SOCKET 后，get_hybrid_search_service() 返回 RetrievalClient，
+#     不再加载任何模型
+#   - 所有 worker 的并发请求在 sidecar 里汇合，rerank 由 RerankBatcher 跨 worker 合批
+#
+# 启动（在 backend/ 目录下，两边使用同一个随机生成的 authkey）:
+#     export RETRIEVAL_SERVER_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+#     python -m chatbot.langgraph_agent.retrieval_sidecar      # 默认 $XDG_RUNTIME_DIR/unsw-retrieval/retrieval.sock
+#     RETRIEVAL_SERVER_SOCKET=$XDG_RUNTIME_DIR/unsw-retrieval/retrieval.sock uvicorn backend.asgi:application --workers 4
+#
+# 传输使用 multiprocessing.connection（带长度前缀的 pickle 消息 + authkey 的 HMAC 握手）。
+# 两端都会反序列化收到的消息，能连上 socket 并通过握手就能在对方进程里执行代码，所以:
+#   - 没有显式设置 RETRIEVAL_SERVER_AUTHKEY（至少 16 个字符）时 sidecar 和客户端都拒绝启动
+#   - socket 必须放在当前用户独占的 0700 目录里（不能是 /tmp 这类所有人可写的目录），
+#     防止其他用户抢先创建同名 socket 冒充 sidecar
+#   - 绑定前设置 umask 0o177，socket 文件创建时就是 0600
+
+import argparse
+import asyncio
+import os
+import queue
+import stat
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Connection, Listener
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from .async_pool import run_in_pool
+    from .readiness import READINESS
+except ImportError:
+    from backend.chatbot.langgraph_agent.async_pool import run_in_pool
+    from backend.chatbot.langgraph_agent.readiness import READINESS
+
+RETRIEVAL_SERVER_SOCKET = os.getenv("RETRIEVAL_SERVER_SOCKET", "")  # 为空 = 进程内加载模型
+RETRIEVAL_SERVER_AUTHKEY = os.getenv("RETRIEVAL_SERVER_AUTHKEY", "").encode("utf-8")  # 必须显式设置
+RETRIEVAL_SERVER_TIMEOUT = float(os.getenv("RETRIEVAL_SERVER_TIMEOUT", "30"))
+RETRIEVAL_SERVER_STARTUP_WAIT = float(os.getenv("RETRIEVAL_SERVER_STARTUP_WAIT", "300"))
+RETRIEVAL_MAX_CONCURRENCY = int(os.getenv("RETRIEVAL_MAX_CONCURRENCY", "4"))
+
+MIN_AUTHKEY_LENGTH = 16
+# 早期版本 .env.example 里的公开默认值
+_PUBLIC_AUTHKEYS = {b"unsw-retrieval"}
+
+
+def check_authkey(authkey: bytes) -> bytes:
+    """authkey 必须显式设置且不是公开的默认值，否则抛出 RuntimeError"""
+    if not authkey or authkey in _PUBLIC_AUTHKEYS or len(authkey) < MIN_AUTHKEY_LENGTH:
+        raise RuntimeError(
+            "RETRIEVAL_SERVER_AUTHKEY must be set to a private value of at least "
+            f"{MIN_AUTHKEY_LENGTH} characters (e.g. `python -c \"import secrets; print(secrets.token_hex(32))\"`)"
+        )
+    return authkey
+
+
+def default_socket_path() -> str:
+    """$XDG_RUNTIME_DIR/unsw-retrieval/retrieval.sock，没有 XDG_RUNTIME_DIR 时放在 backend/run/ 下"""
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    base = Path(runtime_dir) / "unsw-retrieval" if runtime_dir else Path(__file__).resolve().parents[2] / "run"
+    return str(base / "retrieval.sock")
+
+
+def check_socket_dir(socket_path: str, create: bool = False):
+    """
+    socket 所在目录必须属于当前用户且权限为 0700（组和其他用户不可读写），否则抛出 RuntimeError
+
+    Args:
+        create: 目录不存在时以 0700 创建（sidecar 使用）
+    """
+    directory = Path(socket_path).resolve().parent
+    if create:
+        directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    try:
+        st = directory.stat()
+    except FileNotFoundError:
+        return
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        raise RuntimeError(f"Retrieval socket directory {directory} is not owned by the current user")
+    if stat.S_IMODE(st.st_mode) & 0o077:
+        raise RuntimeError(f"Retrieval socket directory {directory} must be private (chmod 700), "
+                           f"got {stat.S_IMODE(st.st_mode):o}")
+
+
+# ----------------------------------------------------------------------
+# 服务端
+# ----------------------------------------------------------------------
+
+class RetrievalServer:
+    """在 Unix socket 上暴露 HybridSearchService（每个连接一个线程，检索并发数有上限）"""
+
+    def __init__(self,
+                 service,
+                 socket_path: str,
+                 authkey: bytes = RETRIEVAL_SERVER_AUTHKEY,
+                 max_concurrency: int = RETRIEVAL_MAX_CONCURRENCY):
+        """
+        Args:
+            max_concurrency: 同时执行的 search_many 数（与进程内 RETRIEVAL_MAX_CONCURRENCY 相同），
+                所有 worker 的其余请求在这里排队，避免挤爆共享的通道线程池
+        """
+        self.service = service
+        self.socket_path = socket_path
+        self.authkey = check_authkey(authkey)
+        self.requests = 0
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+        self._search_slots = threading.BoundedSemaphore(max(1, max_concurrency))
+
+    def _handle(self, op: str, kwargs: Dict[str, Any]) -> Any:
+        service = self.service
+        if op == "search_many":
+            with self._search_slots:
+                return service.search_many(kwargs["queries"], kwargs.get("top_k", 8))
+        if op == "encode":
+            if not service.searcher:
+                raise RuntimeError("VectorSearch not available")
+            return service.searcher._get_query_embeddings(list(kwargs["texts"]))
+        if op == "rerank":
+            if not service.reranker:
+                raise RuntimeError("Reranker not available")
+            pairs = [tuple(pair) for pair in kwargs["pairs"]]
+            if service.rerank_batcher is not None:
+                return service.rerank_batcher.predict(pairs)
+            return service.reranker.predict(pairs, show_progress_bar=False)
+        if op == "get_doc_by_id":
+            return service.get_doc_by_id(kwargs["doc_id"])
+        if op == "stats":
+            stats = service.get_stats() or {}
+            with self._stats_lock:
+                stats["sidecar"] = {"requests": self.requests, "errors": self.errors}
+            return stats
+        if op == "ping":
+            return READINESS.snapshot()
+        raise ValueError(f"Unknown op '{op}'")
+
+    def _serve_connection(self, conn: Connection):
+        with conn:
+            while True:
+                try:
+                    op, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ("ok", self._handle(op, kwargs))
+                except Exception as e:
+                    traceback.print_exc()
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                with self._stats_lock:
+                    self.requests += 1
+                    self.errors += reply[0] == "error"
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self):
+        check_socket_dir(self.socket_path, create=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        # socket 文件在 bind 时按 umask 创建为 0600，不留 chmod 之前的窗口
+        old_umask = os.umask(0o177)
+        try:
+            listener = Listener(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(old_umask)
+        print(f"[OK] Retrieval sidecar listening on {self.socket_path} (pid {os.getpid()})")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # 握手失败（authkey 不对等）不影响其他连接
+                    print(f"[WARN] Rejected retrieval client: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+
+# ----------------------------------------------------------------------
+# 客户端
+# ----------------------------------------------------------------------
+
+class RetrievalClient:
+    """
+    HybridSearchService 的客户端替身：接口相同，请求转发给 sidecar
+
+    每个线程从连接池借一个连接（一问一答），出错的连接直接丢弃并重试一次。
+    """
+
+    def __init__(self,
+                 socket_path: str,
+                 authkey: bytes = RETRIEVAL_SERVER_AUTHKEY,
+                 timeout: float = RETRIEVAL_SERVER_TIMEOUT):
+        self.socket_path = socket_path
+        self.authkey = check_authkey(authkey)
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[Connection]" = queue.LifoQueue()
+        self._search_pool = ThreadPoolExecutor(
+            max_workers=RETRIEVAL_MAX_CONCURRENCY, thread_name_prefix="retrieval-client"
+        )
+
+    def _connect(self) -> Connection:
+        # 不连接其他用户可写目录里的 socket（可能是冒充的 sidecar）
+        check_socket_dir(self.socket_path)
+        return Client(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+
+    def _call(self, op: str, **kwargs) -> Any:
+        for attempt in range(2):
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = None
+            try:
+                if conn is None:
+                    conn = self._connect()
+                conn.send((op, kwargs))
+                if not conn.poll(self.timeout):
+                    conn.close()
+                    raise TimeoutError(f"Retrieval sidecar did not answer '{op}' within {self.timeout:.0f}s")
+                status, result = conn.recv()
+            except TimeoutError:
+                # 请求可能已经在 sidecar 里执行，不重试
+                raise
+            except (EOFError, ConnectionError, FileNotFoundError, OSError) as e:
+                # sidecar 重启过：旧连接失效，换新连接重试一次
+                if conn is not None:
+                    conn.close()
+                if attempt == 0:
+                    continue
+                raise RuntimeError(f"Retrieval sidecar unavailable at {self.socket_path}: {e}") from e
+            self._pool.put(conn)
+            if status != "ok":
+                raise RuntimeError(f"Retrieval sidecar error: {result}")
+            return result
+
+    # --- 与 HybridSearchService 相同的接口 ---
+
+    def ensure_initialized(self):
+        pass
+
+    def reset_after_fork(self):
+        """fork 之后不能和 master 共用 socket 连接"""
+        self._pool = queue.LifoQueue()
+        self._search_pool = ThreadPoolExecutor(
+            max_workers=RETRIEVAL_MAX_CONCURRENCY, thread_name_prefix="retrieval-client"
+        )
+
+    def warmup(self):
+        """等待 sidecar 就绪（启动时调用），耗时记入 READINESS"""
+        start = time.time()
+        deadline = start + RETRIEVAL_SERVER_STARTUP_WAIT
+        while True:
+            try:
+                snapshot = self._call("ping")
+                if snapshot.get("ready", True):
+                    READINESS.record("retrieval_sidecar", time.time() - start)
+                    print(f"[OK] Connected to retrieval sidecar at {self.socket_path} "
+                          f"(pid {snapshot.get('pid')}) in {time.time() - start:.2f}s")
+                    return
+            except (RuntimeError, TimeoutError):
+                pass
+            if time.time() > deadline:
+                READINESS.record("retrieval_sidecar", time.time() - start,
+                                 error=f"not reachable at {self.socket_path}")
+                print(f"[WARN] Retrieval sidecar not reachable at {self.socket_path}")
+                return
+            time.sleep(1.0)
+
+    def search(self, query: str, top_k: int = 8) -> List[Dict[str, Any]]:
+        return self.search_many([query], top_k)[0]
+
+    def search_many(self, queries: List[str], top_k: int = 8) -> List[List[Dict[str, Any]]]:
+        if not queries:
+            return []
+        return self._call("search_many", queries=list(queries), top_k=top_k)
+
+    async def asearch(self,
+                      query: str,
+                      top_k: int = 8,
+                      cancel_event: Optional[asyncio.Event] = None) -> List[Dict[str, Any]]:
+        return await run_in_pool(self._search_pool, self.search, query, top_k, cancel_event=cancel_event)
+
+    async def asearch_many(self,
+                           queries: List[str],
+                           top_k: int = 8,
+                           cancel_event: Optional[asyncio.Event] = None) -> List[List[Dict[str, Any]]]:
+        return await run_in_pool(self._search_pool, self.search_many, list(queries), top_k,
+                                 cancel_event=cancel_event)
+
+    def encode(self, texts: Sequence[str]):
+        """查询向量（np.ndarray，与 VectorSearch._get_query_embeddings 一致）"""
+        return self._call("encode", texts=list(texts))
+
+    def rerank(self, pairs: Sequence[Tuple[str, str]]):
+        """CrossEncoder 分数（在 sidecar 中与其他 worker 的请求合批）"""
+        return self._call("rerank", pairs=[list(pair) for pair in pairs])
+
+    def get_stats(self) -> Optional[Dict[str, Any]]:
+        try:
+            return self._call("stats")
+        except Exception as e:
+            print(f"Error in get_stats: {e}")
+            return None
+
+    def get_doc_by_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._call("get_doc_by_id", doc_id=doc_id)
+        except Exception as e:
+            print(f"Error in get_doc_by_id: {e}")
+            return None
+
+
+# ----------------------------------------------------------------------
+# 入口
+# ----------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared retrieval model server for web workers")
+    parser.add_argument("--socket", default=RETRIEVAL_SERVER_SOCKET or default_socket_path(),
+                        help="Unix socket 路径（web worker 的 RETRIEVAL_SERVER_SOCKET 需一致）")
+    args = parser.parse_args()
+    # 在加载模型之前检查配置
+    check_authkey(RETRIEVAL_SERVER_AUTHKEY)
+    check_socket_dir(args.socket, create=True)
+
+    from . import parallel_search_and_rerank as psr
+
+    # 本进程始终在进程内加载模型（即使环境里设置了 RETRIEVAL_SERVER_SOCKET）
+    service = psr.use_local_service()
+    service.warmup()
+    READINESS.mark_ready(mode="sidecar")
+    RetrievalServer(service, args.socket).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
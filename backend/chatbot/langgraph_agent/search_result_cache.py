@@ -0,0 +1,274 @@
+# backend/chatbot/langgraph_agent/search_result_cache.py
+# 混合检索结果缓存（两级）
+#
+# 很多学生问的是几乎相同的问题（"prereqs for COMP3900"、"what AI courses are there for PG"），
+# 每次都重新跑 encode + 向量检索 + rerank。这里缓存最终的 rerank 结果：
+#   1. 精确层：键 = 归一化查询 + top_k + 过滤条件
+#   2. 近似层（可选）：查询向量与某个已缓存查询的余弦相似度 >= 阈值时复用其结果
+# 两层共享同一个 LRU + TTL，数据版本（向量库 / 知识图谱重建）变化时整体失效。
+
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?？!！.。,，]+$")
+
+
+def normalize_query(query: str) -> str:
+    """大小写、多余空白、结尾标点不影响检索结果"""
+    query = _WHITESPACE_RE.sub(" ", (query or "").strip().lower())
+    return _TRAILING_PUNCT_RE.sub("", query)
+
+
+def _freeze(value: Any) -> Hashable:
+    """把过滤条件（dict / list）转成可哈希的规范形式"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(_freeze(v) for v in value))
+    return value
+
+
+class _Entry:
+    __slots__ = ("results", "scope", "embedding", "created_at")
+
+    def __init__(self, results, scope, embedding, created_at):
+        self.results = results
+        self.scope = scope
+        self.embedding = embedding
+        self.created_at = created_at
+
+
+class SearchResultCache:
+    """线程安全的两级检索结果缓存"""
+
+    def __init__(self,
+                 max_entries: int = 512,
+                 ttl_seconds: float = 600.0,
+                 similarity_threshold: float = 0.0,
+                 version_fn: Optional[Callable[[], Hashable]] = None,
+                 version_check_interval: float = 5.0):
+        """
+        Args:
+            max_entries: LRU 容量（两层共用）
+            ttl_seconds: 条目存活时间，<= 0 表示不过期
+            similarity_threshold: 近似层余弦阈值，<= 0 关闭近似层
+            version_fn: 返回当前数据版本，版本变化时清空缓存
+            version_check_interval: 两次检查版本的最小间隔（秒）
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._version = VersionWatch(version_fn, version_check_interval, name="search cache")
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def similarity_enabled(self) -> bool:
+        return self.similarity_threshold > 0
+
+    # ------------------------------------------------------------------
+    # 键
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def make_scope(top_k: int, filters: Optional[Dict[str, Any]] = None, guard: Any = None) -> tuple:
+        """
+        近似层只在同一 scope 内比较向量
+
+        guard 用来区分向量很像但答案不同的查询，例如只差一个课程代码的
+        "prereqs for COMP3900" / "prereqs for COMP3901"
+        """
+        return (top_k, _freeze(filters or {}), _freeze(guard))
+
+    @staticmethod
+    def make_key(query: str, scope: tuple) -> tuple:
+        return (normalize_query(query),) + scope
+
+    # ------------------------------------------------------------------
+    # 公共接口
+    # ------------------------------------------------------------------
+
+    def get(self, key: tuple) -> Optional[List[Dict[str, Any]]]:
+        """精确层查找，命中时返回结果的深拷贝"""
+        with self._lock:
+            self._check_version()
+            entry = self._lookup(key)
+            if entry is None:
+                return None
+            self.exact_hits += 1
+            return copy.deepcopy(entry.results)
+
+    def get_similar(self, scope: tuple, embedding) -> Optional[List[Dict[str, Any]]]:
+        """近似层查找：同 scope 内余弦相似度最高且 >= 阈值的条目"""
+        if not self.similarity_enabled:
+            return None
+        query_vec = self._unit(embedding)
+        with self._lock:
+            self._check_version()
+            best_key, best_sim = None, self.similarity_threshold
+            for key, entry in list(self._entries.items()):
+                if entry.scope != scope or entry.embedding is None:
+                    continue
+                if self._expired(entry):
+                    self._drop_expired(key)
+                    continue
+                sim = float(np.dot(entry.embedding, query_vec))
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.similar_hits += 1
+            return copy.deepcopy(self._entries[best_key].results)
+
+    def record_miss(self, count: int = 1):
+        """两层都没命中（由调用方在真正执行检索前记录）"""
+        with self._lock:
+            self.misses += count
+
+    def put(self, key: tuple, results: List[Dict[str, Any]], embedding=None):
+        """写入结果；key 的 scope 部分即 key[1:]"""
+        vec = self._unit(embedding) if (embedding is not None and self.similarity_enabled) else None
+        entry = _Entry(copy.deepcopy(results), key[1:], vec, time.monotonic())
+        with self._lock:
+            self._check_version()
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            hits = self.exact_hits + self.similar_hits
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "similarity_threshold": self.similarity_threshold,
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "version": repr(self._version.version),
+            }
+
+    # ------------------------------------------------------------------
+    # 内部（调用方持有 self._lock）
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl > 0 and time.monotonic() - entry.created_at > self.ttl
+
+    def _drop_expired(self, key: tuple):
+        del self._entries[key]
+        self.expirations += 1
+
+    def _lookup(self, key: tuple) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._drop_expired(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _check_version(self):
+        if self._version.changed():
+            if self._entries:
+                print(f"[OK] Search data version changed, dropping {len(self._entries)} cached results.")
+            self._entries.clear()
+            self.invalidations += 1
+
+
+class VersionWatch:
+    """
+    节流的数据版本检查（检索结果缓存 / rerank 分数缓存共用）
+
+    两次调用 version_fn 至少间隔 check_interval 秒；不加锁，由调用方在自己的锁内调用 changed()。
+    """
+
+    def __init__(self,
+                 version_fn: Optional[Callable[[], Hashable]],
+                 check_interval: float = 5.0,
+                 name: str = "cache"):
+        """
+        Args:
+            version_fn: 返回当前数据版本（例如 file_version(...)）；None 表示从不失效
+            check_interval: 两次检查版本的最小间隔（秒）
+            name: 日志里的缓存名
+        """
+        self.version_fn = version_fn
+        self.check_interval = check_interval
+        self.name = name
+        self.version = self._read()
+        self._checked_at = time.monotonic()
+
+    def _read(self) -> Hashable:
+        if self.version_fn is None:
+            return None
+        try:
+            return self.version_fn()
+        except Exception as e:
+            print(f"[WARN] Failed to read {self.name} version: {e}")
+            return None
+
+    def changed(self) -> bool:
+        """距上次检查超过间隔时重新读取版本，版本变化返回 True（调用方清空缓存）"""
+        now = time.monotonic()
+        if self.version_fn is None or now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        version = self._read()
+        if version == self.version:
+            return False
+        self.version = version
+        return True
+
+
+def file_version(paths: Sequence) -> Tuple:
+    """
+    用文件的 (mtime_ns, size) 作为数据版本；文件不存在时记为 None
+
+    Args:
+        paths: 向量库 manifest / chroma.sqlite3 / 知识图谱 pickle 等构建产物
+    """
+    version = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            version.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            version.append(None)
+    return tuple(version)
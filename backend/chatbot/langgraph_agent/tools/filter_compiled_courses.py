@@ -29,6 +29,7 @@ Hard rule filter - Maximum data return with accurate constraints
 """
 
 import json
+import threading
 from pathlib import Path
 from typing import Dict, List, Set, Optional, Any, Tuple
 from dataclasses import dataclass, asdict, field
@@ -206,6 +207,102 @@ class CourseFilterOutput:
         }
 
 
+# --------------------------
+# Course catalogue (shared, read-only)
+# --------------------------
+# 毕业要求 + compiled_data.json 在每个进程里只解析一次，所有 CourseFilter 实例共用；
+# gunicorn preload 时在 master 里加载（见 chatbot/prefork.py），fork 后各 worker 共享同一份内存页。
+# filter_courses 只读取这两个 dict，调用方不要修改它们。
+
+_CATALOGUE_CACHE: Dict[Tuple[str, str], Tuple[tuple, Dict[str, Any], Dict[str, Any]]] = {}
+_CATALOGUE_LOCK = threading.Lock()
+
+
+def default_catalogue_paths() -> Tuple[Path, Path]:
+    """(graduation_req_dir, course_data_file) 的默认路径"""
+    project_root = Path(__file__).parent.parent.parent.parent.parent
+    return (
+        project_root / "course_data" / "cleaned_graduation_requirements",
+        project_root / "course_data" / "compiled_course_data" / "compiled_data.json",
+    )
+
+
+def _read_graduation_requirements(graduation_req_dir: Path) -> Dict[str, Any]:
+    requirements = {}
+    if not graduation_req_dir.exists():
+        return requirements
+
+    for json_file in graduation_req_dir.glob("cleaned_*.json"):
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                code = data.get("code") or data.get("cl_code")
+                if code:
+                    requirements[code] = data
+        except Exception as e:
+            print(f"Warning: Failed to load {json_file.name}: {e}")
+    return requirements
+
+
+def _read_course_details(course_data_file: Path) -> Dict[str, Any]:
+    if not course_data_file.exists():
+        return {}
+    with open(course_data_file, 'r', encoding='utf-8') as f:
+        courses = json.load(f)
+    return {course["course_code"]: course for course in courses}
+
+
+def _catalogue_version(graduation_req_dir: Path, course_data_file: Path) -> tuple:
+    """所有源文件的 (name, mtime_ns, size)，任一文件变化即重新加载"""
+    files = sorted(graduation_req_dir.glob("cleaned_*.json")) if graduation_req_dir.exists() else []
+    if course_data_file.exists():
+        files.append(course_data_file)
+    version = []
+    for path in files:
+        try:
+            st = path.stat()
+            version.append((path.name, st.st_mtime_ns, st.st_size))
+        except OSError:
+            continue
+    return tuple(version)
+
+
+def load_course_catalogue(graduation_req_dir: Path,
+                          course_data_file: Path) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    返回 (graduation_requirements, course_details)，按路径缓存
+
+    Returns:
+        graduation_requirements: major/specialisation code -> 毕业要求
+        course_details: course_code -> compiled course data
+    """
+    graduation_req_dir, course_data_file = Path(graduation_req_dir), Path(course_data_file)
+    key = (str(graduation_req_dir.resolve()), str(course_data_file.resolve()))
+    version = _catalogue_version(graduation_req_dir, course_data_file)
+
+    cached = _CATALOGUE_CACHE.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    with _CATALOGUE_LOCK:
+        cached = _CATALOGUE_CACHE.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+        graduation_requirements = _read_graduation_requirements(graduation_req_dir)
+        course_details = _read_course_details(course_data_file)
+        _CATALOGUE_CACHE[key] = (version, graduation_requirements, course_details)
+
+    print(f"[OK] Loaded {len(graduation_requirements)} graduation requirements")
+    print(f"[OK] Loaded {len(course_details)} course details\n")
+    return graduation_requirements, course_details
+
+
+def preload_course_catalogue() -> Tuple[int, int]:
+    """启动时加载默认路径的课程目录，返回 (毕业要求数, 课程数)"""
+    graduation_requirements, course_details = load_course_catalogue(*default_catalogue_paths())
+    return len(graduation_requirements), len(course_details)
+
+
 class CourseFilter:
     """Main course filtering class - Hard rule filter"""
 
@@ -216,39 +313,18 @@ class CourseFilter:
         self.graduation_req_dir = Path(graduation_req_dir)
         self.course_data_file = Path(course_data_file)
 
-        # Load data
-        self.graduation_requirements = self._load_graduation_requirements()
-        self.course_details = self._load_course_details()
-
-        # Debug info
-        # print kept minimal to avoid noisy logs when used as a tool
-        print(f"[OK] Loaded {len(self.graduation_requirements)} graduation requirements")
-        print(f"[OK] Loaded {len(self.course_details)} course details\n")
+        # Load data（进程内共享的只读目录，文件未变化时不再重新解析 JSON）
+        self.graduation_requirements, self.course_details = load_course_catalogue(
+            self.graduation_req_dir, self.course_data_file
+        )
 
     def _load_graduation_requirements(self) -> Dict[str, Any]:
         """Load all graduation requirements"""
-        requirements = {}
-        if not self.graduation_req_dir.exists():
-            return requirements
-
-        for json_file in self.graduation_req_dir.glob("cleaned_*.json"):
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    code = data.get("code") or data.get("cl_code")
-                    if code:
-                        requirements[code] = data
-            except Exception as e:
-                print(f"Warning: Failed to load {json_file.name}: {e}")
-        return requirements
+        return _read_graduation_requirements(self.graduation_req_dir)
 
     def _load_course_details(self) -> Dict[str, Any]:
         """Load course details"""
-        if not self.course_data_file.exists():
-            return {}
-        with open(self.course_data_file, 'r', encoding='utf-8') as f:
-            courses = json.load(f)
-        return {course["course_code"]: course for course in courses}
+        return _read_course_details(self.course_data_file)
 
     def _extract_course_level(self, course_code: str) -> int:
         """Extract course level from course code (e.g., COMP3411 -> 3)"""
@@ -722,14 +798,11 @@ def create_course_filter_and_run(
     - 将输入字典转换为 CourseFilterInput 并执行 filter_courses
     - 返回 CourseFilterOutput.to_dict()
     """
-    # determine default project root relative to this file
-    script_dir = Path(__file__).parent
-    project_root = script_dir.parent.parent.parent.parent
-
+    default_req_dir, default_course_file = default_catalogue_paths()
     if graduation_req_dir is None:
-        graduation_req_dir = project_root / "course_data" / "cleaned_graduation_requirements"
+        graduation_req_dir = default_req_dir
     if course_data_file is None:
-        course_data_file = project_root / "course_data" / "compiled_course_data" / "compiled_data.json"
+        course_data_file = default_course_file
 
     cf = CourseFilter(str(graduation_req_dir), str(course_data_file))
     processed_completed_courses = []
@@ -0,0 +1,500 @@
+"""
+Typed adjacency index for the course knowledge graph
+加载图时按关系类型（REQUIRES / COREQUISITE_OF / INCOMPATIBLE_WITH / PART_OF / BELONGS_TO / SATISFIES / UNLOCKS）
+各建一份出边、入边邻接表，KnowledgeGraphQuery 的访问器直接按行号取邻居，
+不再遍历 predecessors / successors 并扫描每条多重边的属性 dict。
+
+存储:
+    节点 -> 整数 id（names[i] 为节点名，id_of[name] 为行号）
+    每个关系、每个方向一份 CSR：neighbors[offsets[i]:offsets[i+1]] 为 i 的邻居 id
+    邻居顺序与 networkx 的 predecessors / successors 迭代顺序一致（访问器结果与原实现相同）
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import networkx as nx
+import numpy as np
+
+
+class _CSR:
+    """一个关系、一个方向的邻接表"""
+
+    __slots__ = ("offsets", "neighbors", "edge_data", "edge_rows")
+
+    def __init__(self, rows: Sequence[List[int]], edge_data: Optional[Sequence[List[Dict[str, Any]]]] = None):
+        self.offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        if rows:
+            self.offsets[1:] = np.cumsum([len(r) for r in rows])
+        self.neighbors = np.fromiter((j for r in rows for j in r), dtype=np.int32, count=int(self.offsets[-1]))
+        # 与 neighbors 平行：每条边所在的行（整表向量化计算时按行聚合用）
+        self.edge_rows = np.repeat(np.arange(len(rows), dtype=np.int32), np.diff(self.offsets))
+        # 与 neighbors 平行：每个 (i, j) 第一条匹配边的属性 dict（只在需要边属性的关系上保留）
+        self.edge_data = [d for r in edge_data for d in r] if edge_data is not None else None
+
+    def row(self, i: int) -> np.ndarray:
+        return self.neighbors[self.offsets[i]:self.offsets[i + 1]]
+
+    def degree(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+class TransitiveClosure:
+    """
+    一个关系的传递闭包：每个节点沿入边可达的全部节点（例如 REQUIRES 的全部先修），存成 Python int 位集
+
+    只给参与该关系的节点分配位；先把强连通分量缩点，再按拓扑序自底向上求并集，
+    环上的节点互为祖先（节点本身除外）。
+    """
+
+    def __init__(self, index: "KGAdjacencyIndex", relationship: str):
+        start = time.time()
+        inc, out = index.inc[relationship], index.out[relationship]
+        involved = np.flatnonzero((inc.degree() > 0) | (out.degree() > 0))
+        self.node_of_bit = involved.astype(np.int32)
+        self.bit_of: Dict[int, int] = {node: bit for bit, node in enumerate(involved.tolist())}
+
+        dag = nx.DiGraph()
+        dag.add_nodes_from(range(len(involved)))
+        for node, bit in self.bit_of.items():
+            dag.add_edges_from((self.bit_of[u], bit) for u in inc.row(node).tolist())
+        condensed = nx.condensation(dag)
+        component_of = condensed.graph["mapping"]
+
+        component_bits = {}
+        for c, data in condensed.nodes(data=True):
+            bits = 0
+            for member in data["members"]:
+                bits |= 1 << member
+            component_bits[c] = bits
+        ancestors_of_component = {}
+        for c in nx.topological_sort(condensed):
+            acc = 0
+            for p in condensed.predecessors(c):
+                acc |= ancestors_of_component[p] | component_bits[p]
+            if len(condensed.nodes[c]["members"]) > 1:
+                acc |= component_bits[c]
+            ancestors_of_component[c] = acc
+        self._ancestors: List[int] = [
+            ancestors_of_component[component_of[bit]] & ~(1 << bit) for bit in range(len(involved))
+        ]
+        self.build_seconds = time.time() - start
+
+    def ancestors(self, node_id: int) -> int:
+        bit = self.bit_of.get(node_id)
+        return 0 if bit is None else self._ancestors[bit]
+
+    def bits(self, node_ids) -> int:
+        """节点 id 集合 -> 位集（不参与该关系的节点忽略）"""
+        bits = 0
+        for node_id in node_ids:
+            bit = self.bit_of.get(node_id)
+            if bit is not None:
+                bits |= 1 << bit
+        return bits
+
+    def node_ids(self, bits: int) -> List[int]:
+        """位集 -> 节点 id（按位序）"""
+        ids = []
+        while bits:
+            low = bits & -bits
+            ids.append(int(self.node_of_bit[low.bit_length() - 1]))
+            bits ^= low
+        return ids
+
+
+class KGAdjacencyIndex:
+    """按关系类型拆分的邻接表（只读，图加载后构建一次）"""
+
+    # 这些关系的出边保留边属性（get_majors_for_course 需要 requirement_type）
+    EDGE_DATA_RELATIONSHIPS = ("PART_OF",)
+
+    def __init__(self, graph: nx.MultiDiGraph):
+        self.names: List[str] = [sys.intern(n) if isinstance(n, str) else n for n in graph.nodes]
+        self.id_of: Dict[Any, int] = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+
+        types = [data.get("node_type") for _, data in graph.nodes(data=True)]
+        self.type_names: List[Any] = list(dict.fromkeys(types))
+        type_code = {t: i for i, t in enumerate(self.type_names)}
+        self.node_type = np.asarray([type_code[t] for t in types], dtype=np.int16)
+
+        relationships = list(dict.fromkeys(
+            data.get("relationship") for _, _, data in graph.edges(data=True)
+        ))
+        out_rows = {r: [[] for _ in range(n)] for r in relationships}
+        out_data = {r: [[] for _ in range(n)] for r in self.EDGE_DATA_RELATIONSHIPS}
+        in_rows = {r: [[] for _ in range(n)] for r in relationships}
+
+        # 出边：按 successors 顺序；同一对节点的多重边里每种关系只记一次（取第一条边的属性）
+        for u, nbrs in graph.adj.items():
+            ui = self.id_of[u]
+            for v, keyed in nbrs.items():
+                vi = self.id_of[v]
+                seen = set()
+                for data in keyed.values():
+                    rel = data.get("relationship")
+                    if rel in seen:
+                        continue
+                    seen.add(rel)
+                    out_rows[rel][ui].append(vi)
+                    if rel in out_data:
+                        out_data[rel][ui].append(data)
+        # 入边：按 predecessors 顺序
+        for v, nbrs in graph.pred.items():
+            vi = self.id_of[v]
+            for u, keyed in nbrs.items():
+                ui = self.id_of[u]
+                for rel in dict.fromkeys(data.get("relationship") for data in keyed.values()):
+                    in_rows[rel][vi].append(ui)
+
+        self.out: Dict[Any, _CSR] = {r: _CSR(out_rows[r], out_data.get(r)) for r in relationships}
+        self.inc: Dict[Any, _CSR] = {r: _CSR(in_rows[r]) for r in relationships}
+        self._empty = _CSR([[] for _ in range(n)])
+
+        self._closures: Dict[str, TransitiveClosure] = {}
+        self._chain_cache: "OrderedDict[tuple, Tuple[List[List[str]], bool]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def __contains__(self, node) -> bool:
+        return node in self.id_of
+
+    def type_code(self, node_type: str) -> int:
+        """node_type -> 类型编号（不存在时为 -1）"""
+        try:
+            return self.type_names.index(node_type)
+        except ValueError:
+            return -1
+
+    def _ids(self, node, relationship: str, csr: Dict[Any, _CSR], node_type: Optional[str]) -> np.ndarray:
+        i = self.id_of.get(node)
+        if i is None:
+            return self._empty.neighbors
+        ids = csr.get(relationship, self._empty).row(i)
+        if node_type is not None:
+            ids = ids[self.node_type[ids] == self.type_code(node_type)]
+        return ids
+
+    def predecessors(self, node, relationship: str, node_type: Optional[str] = None) -> List[str]:
+        """所有 P -[relationship]-> node 的 P"""
+        names = self.names
+        return [names[j] for j in self._ids(node, relationship, self.inc, node_type).tolist()]
+
+    def successors(self, node, relationship: str, node_type: Optional[str] = None) -> List[str]:
+        """所有 node -[relationship]-> S 的 S"""
+        names = self.names
+        return [names[j] for j in self._ids(node, relationship, self.out, node_type).tolist()]
+
+    def successor_edges(self, node, relationship: str,
+                        node_type: Optional[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """(S, 边属性)，只支持 EDGE_DATA_RELATIONSHIPS"""
+        i = self.id_of.get(node)
+        csr = self.out.get(relationship)
+        if i is None or csr is None or csr.edge_data is None:
+            return []
+        start, end = csr.offsets[i], csr.offsets[i + 1]
+        code = self.type_code(node_type) if node_type is not None else None
+        return [
+            (self.names[j], csr.edge_data[k])
+            for k, j in zip(range(start, end), csr.neighbors[start:end].tolist())
+            if code is None or self.node_type[j] == code
+        ]
+
+    # ------------------------------------------------------------------
+    # 路径
+    # ------------------------------------------------------------------
+
+    def shortest_path(self, source, target, relationship: str) -> Optional[List[str]]:
+        """BFS：沿 relationship 出边从 source 到 target 的最短路径（边数最少），不可达返回 None"""
+        s, t = self.id_of.get(source), self.id_of.get(target)
+        csr = self.out.get(relationship)
+        if s is None or t is None or csr is None:
+            return None
+        if s == t:
+            return [self.names[s]]
+
+        parent = {s: -1}
+        frontier = [s]
+        while frontier:
+            next_frontier = []
+            for u in frontier:
+                for v in csr.row(u).tolist():
+                    if v in parent:
+                        continue
+                    parent[v] = u
+                    if v == t:
+                        path = [v]
+                        while parent[path[-1]] != -1:
+                            path.append(parent[path[-1]])
+                        return [self.names[i] for i in reversed(path)]
+                    next_frontier.append(v)
+            frontier = next_frontier
+        return None
+
+    def distances_to(self, target, relationship: str, max_hops: int) -> Dict[int, int]:
+        """反向 BFS：max_hops 步内能沿 relationship 到达 target 的节点 id -> 步数"""
+        t = self.id_of.get(target)
+        csr = self.inc.get(relationship)
+        if t is None or csr is None:
+            return {}
+        dist = {t: 0}
+        frontier = [t]
+        for hop in range(1, max_hops + 1):
+            next_frontier = []
+            for v in frontier:
+                for u in csr.row(v).tolist():
+                    if u not in dist:
+                        dist[u] = hop
+                        next_frontier.append(u)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return dist
+
+    def iter_simple_paths(self,
+                          source,
+                          target,
+                          relationship: str,
+                          max_length: int,
+                          deadline: Optional[float] = None) -> Iterator[List[str]]:
+        """
+        惰性枚举 source -> target 的简单路径（最多 max_length 条边），顺序与 nx.all_simple_paths 相同
+
+        只往能在剩余步数内到达 target 的节点走（distances_to 剪枝），死胡同分支不会被展开。
+
+        Args:
+            deadline: time.monotonic() 截止时间，超过后停止枚举
+        """
+        s, t = self.id_of.get(source), self.id_of.get(target)
+        csr = self.out.get(relationship)
+        if s is None or t is None or csr is None:
+            return
+        if s == t:
+            yield [self.names[s]]
+            return
+
+        dist = self.distances_to(target, relationship, max_length)
+        if dist.get(s, max_length + 1) > max_length:
+            return
+
+        names = self.names
+        path = [s]
+        on_path = {s}
+        stack = [iter(csr.row(s).tolist())]
+        steps = 0
+        while stack:
+            steps += 1
+            if deadline is not None and steps % 256 == 0 and time.monotonic() > deadline:
+                return
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                on_path.discard(path.pop())
+                continue
+            if child in on_path:
+                continue
+            edges = len(path)  # 走到 child 之后的边数
+            if child == t:
+                yield [names[i] for i in path] + [names[t]]
+                continue
+            if dist.get(child, max_length + 1) > max_length - edges:
+                continue
+            path.append(child)
+            on_path.add(child)
+            stack.append(iter(csr.row(child).tolist()))
+
+    def find_paths(self,
+                   source,
+                   target,
+                   relationship: str,
+                   max_length: int,
+                   max_paths: int,
+                   time_budget: float) -> Tuple[List[List[str]], bool]:
+        """
+        有上限的路径枚举
+
+        Returns:
+            (paths, truncated)：truncated 表示达到 max_paths 或 time_budget（秒）后提前停止
+        """
+        deadline = time.monotonic() + time_budget
+        paths = list(islice(self.iter_simple_paths(source, target, relationship, max_length, deadline), max_paths))
+        truncated = len(paths) >= max_paths or time.monotonic() > deadline
+        return paths, truncated
+
+    # ------------------------------------------------------------------
+    # 传递闭包 / 链
+    # ------------------------------------------------------------------
+
+    def closure(self, relationship: str) -> Optional[TransitiveClosure]:
+        """关系的传递闭包（首次调用时构建，之后复用）"""
+        if relationship not in self.inc:
+            return None
+        closure = self._closures.get(relationship)
+        if closure is None:
+            with self._lock:
+                closure = self._closures.get(relationship)
+                if closure is None:
+                    closure = TransitiveClosure(self, relationship)
+                    self._closures[relationship] = closure
+        return closure
+
+    def ancestors(self, node, relationship: str, exclude: Sequence[Any] = ()) -> List[str]:
+        """
+        沿 relationship 入边可达的全部节点（不含 node 本身）
+
+        Args:
+            exclude: 从结果中去掉的节点（例如学生已修课程），一次位运算完成
+        """
+        closure = self.closure(relationship)
+        i = self.id_of.get(node)
+        if closure is None or i is None:
+            return []
+        bits = closure.ancestors(i)
+        if exclude:
+            bits &= ~closure.bits(self.id_of[e] for e in exclude if e in self.id_of)
+        names = self.names
+        return [names[j] for j in closure.node_ids(bits)]
+
+    def count_ancestors(self, node, relationship: str) -> int:
+        closure = self.closure(relationship)
+        i = self.id_of.get(node)
+        return 0 if closure is None or i is None else closure.ancestors(i).bit_count()
+
+    def _iter_chains(self, csr: _CSR, current: int, path: List[int], on_path: set,
+                     depth: int, max_depth: int, deadline: Optional[float]) -> Iterator[List[str]]:
+        if depth > max_depth:
+            return
+        row = csr.row(current).tolist()
+        if not row:
+            if path:
+                yield [self.names[i] for i in path]
+            return
+        for prereq in row:
+            if prereq in on_path:
+                continue
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            path.append(prereq)
+            on_path.add(prereq)
+            yield from self._iter_chains(csr, prereq, path, on_path, depth + 1, max_depth, deadline)
+            path.pop()
+            on_path.discard(prereq)
+
+    def chains(self,
+               node,
+               relationship: str,
+               max_depth: int,
+               max_chains: int,
+               time_budget: float,
+               cache_size: int = 1024) -> Tuple[List[List[str]], bool]:
+        """
+        从 node 沿入边走到叶子（没有入边的节点）的全部链，顺序与原来的递归 DFS 相同
+
+        链的数量随分叉指数增长，这里按 max_chains / time_budget（秒）截断，结果按参数缓存（LRU）。
+
+        Returns:
+            (chains, truncated)
+        """
+        key = (node, relationship, max_depth, max_chains)
+        with self._lock:
+            cached = self._chain_cache.get(key)
+            if cached is not None:
+                self._chain_cache.move_to_end(key)
+                return [list(c) for c in cached[0]], cached[1]
+
+        i = self.id_of.get(node)
+        csr = self.inc.get(relationship)
+        if i is None or csr is None:
+            return [], False
+        deadline = time.monotonic() + time_budget
+        # 递归深度 = 链长，限制在解释器递归上限以内
+        max_depth = min(max_depth, 64)
+        found = list(islice(self._iter_chains(csr, i, [], set(), 0, max_depth, deadline), max_chains))
+        timed_out = len(found) < max_chains and time.monotonic() > deadline
+        truncated = timed_out or len(found) >= max_chains
+
+        if not timed_out:
+            # 超时的结果不缓存（和机器负载有关）
+            with self._lock:
+                self._chain_cache[key] = (found, truncated)
+                while len(self._chain_cache) > cache_size:
+                    self._chain_cache.popitem(last=False)
+        return [list(c) for c in found], truncated
+
+    # ------------------------------------------------------------------
+    # 整表向量化查询（先修矩阵 A[i, j] = 1 表示 j -[relationship]-> i，即 inc CSR）
+    # ------------------------------------------------------------------
+
+    def mask_of(self, nodes) -> np.ndarray:
+        """节点集合 -> 长度为节点数的 bool 向量（不在图中的节点忽略）"""
+        mask = np.zeros(len(self.names), dtype=bool)
+        mask[[self.id_of[n] for n in nodes if n in self.id_of]] = True
+        return mask
+
+    def _missing_counts(self, relationship: str, done: np.ndarray) -> Tuple[_CSR, np.ndarray, np.ndarray]:
+        """每个节点还没满足的入边数（A · !done），以及每条入边是否已满足"""
+        csr = self.inc.get(relationship, self._empty)
+        edge_done = done[csr.neighbors]
+        missing = csr.degree() - np.bincount(csr.edge_rows[edge_done], minlength=len(self.names))
+        return csr, missing, edge_done
+
+    def unlocked(self, relationship: str, done_nodes, node_type: str) -> List[str]:
+        """入边全部来自 done_nodes（或没有入边）、自身不在 done_nodes 里的 node_type 节点，按节点顺序"""
+        done = self.mask_of(done_nodes)
+        _, missing, _ = self._missing_counts(relationship, done)
+        ids = np.flatnonzero((missing == 0) & ~done & (self.node_type == self.type_code(node_type)))
+        names = self.names
+        return [names[j] for j in ids.tolist()]
+
+    def rank_by_unlocks(self,
+                        relationship: str,
+                        done_nodes,
+                        node_type: str,
+                        candidates_unlocked_only: bool = True,
+                        top_k: int = 20) -> List[Tuple[str, int, int]]:
+        """
+        按"再完成这个节点能新满足多少节点"排序
+
+        只差一条入边的节点把这条边的起点计一次：gains = A^T · [missing == 1]（只取未满足的边）。
+
+        Args:
+            candidates_unlocked_only: 只在当前已满足（可以直接选）的节点里排序
+            top_k: 返回前 k 个（gain 为 0 的不返回）
+
+        Returns:
+            [(name, gain, total)]，total 为该节点的出边总数（不考虑已完成）
+        """
+        done = self.mask_of(done_nodes)
+        csr, missing, edge_done = self._missing_counts(relationship, done)
+        of_type = self.node_type == self.type_code(node_type)
+        one_left = (missing == 1) & ~done & of_type
+        pending_edges = ~edge_done & one_left[csr.edge_rows]
+        gains = np.bincount(csr.neighbors[pending_edges], minlength=len(self.names))
+        totals = np.bincount(csr.neighbors, minlength=len(self.names))
+
+        candidates = of_type & ~done & (gains > 0)
+        if candidates_unlocked_only:
+            candidates &= missing == 0
+        ids = np.flatnonzero(candidates)
+        # gain 降序，其次出边总数降序，再按节点顺序
+        ids = ids[np.lexsort((ids, -totals[ids], -gains[ids]))][:top_k]
+        names = self.names
+        return [(names[j], int(gains[j]), int(totals[j])) for j in ids.tolist()]
+
+    def nodes_of_type(self, node_type: str) -> List[str]:
+        names = self.names
+        return [names[j] for j in np.flatnonzero(self.node_type == self.type_code(node_type)).tolist()]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "nodes": len(self.names),
+            "relationships": {str(r): int(csr.offsets[-1]) for r, csr in self.out.items()},
+        }
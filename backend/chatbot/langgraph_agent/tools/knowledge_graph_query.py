@@ -3,7 +3,10 @@ Knowledge Graph Query Interface
 Provides various query methods for course relationship navigation
 """
 
+import hashlib
+import os
 import pickle
+import threading
 from pathlib import Path
 from typing import List, Set, Dict, Optional, Any, Tuple
 import networkx as nx
@@ -13,7 +16,17 @@ import re
 from pathlib import Path
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool
+
+try:
+    from .kg_index import KGAdjacencyIndex
+except ImportError:
+    from backend.chatbot.langgraph_agent.tools.kg_index import KGAdjacencyIndex
 ENABLE_VERBOSE_LOGGING = True
+# find_prerequisite_path 的上限：密集的先修网里简单路径数是指数级的
+PATH_SEARCH_MAX_PATHS = int(os.getenv("PATH_SEARCH_MAX_PATHS", "50"))
+PATH_SEARCH_TIME_BUDGET_MS = float(os.getenv("PATH_SEARCH_TIME_BUDGET_MS", "200"))
+# get_prerequisite_chain(include_chains=True) 最多枚举的链数（耗时上限同 PATH_SEARCH_TIME_BUDGET_MS）
+PREREQ_CHAIN_MAX_CHAINS = int(os.getenv("PREREQ_CHAIN_MAX_CHAINS", "100"))
 @dataclass
 class PrerequisiteChain:
     """Represents a chain of prerequisites"""
@@ -43,6 +56,12 @@ class KnowledgeGraphQuery:
         """
         self.graph_path = Path(graph_path)
         self.graph = self._load_graph()
+        # 按关系类型拆分的邻接表：访问器按行号取邻居，不再扫描多重边的属性 dict
+        self.index = KGAdjacencyIndex(self.graph)
+        # REQUIRES 的传递闭包在加载时建好（prefork 时随图一起在 master 里共享）
+        closure = self.index.closure("REQUIRES")
+        if closure is not None:
+            print(f"[OK] Prerequisite closure: {len(closure.bit_of)} courses ({closure.build_seconds * 1000:.0f}ms)")
 
     def _load_graph(self) -> nx.MultiDiGraph:
         """Load graph from disk"""
@@ -71,16 +90,26 @@ class KnowledgeGraphQuery:
 
         return dict(self.graph.nodes[course_code])
 
+    def get_nodes_info(self, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Resolve many course / major codes in one pass
+
+        Args:
+            codes: Course or major codes (e.g., ["COMP3900", "COMPA1"])
+
+        Returns:
+            {code: node attributes} for the codes that exist in the graph
+        """
+        nodes = self.graph.nodes
+        return {code: dict(nodes[code]) for code in dict.fromkeys(codes) if code in nodes}
+
     def course_exists(self, course_code: str) -> bool:
         """Check if course exists in graph"""
         return course_code in self.graph
 
     def get_all_courses(self) -> List[str]:
         """Get all course codes"""
-        return [
-            node for node, data in self.graph.nodes(data=True)
-            if data.get("node_type") == "Course"
-        ]
+        return self.index.nodes_of_type("Course")
 
     # ========================================================================
     # Prerequisite Queries
@@ -96,59 +125,43 @@ class KnowledgeGraphQuery:
         Returns:
             List of prerequisite course codes
         """
-        if course_code not in self.graph:
-            return []
-
-        prereqs = []
-        # 遍历前驱节点 (predecessor)，即 P -> course_code
-        for predecessor in self.graph.predecessors(course_code):
-            # 修复: 检查 P -> course_code 这条边
-            # 原始错误代码: self.graph[course_code][predecessor]
-            for key, edge_data in self.graph[predecessor][course_code].items():
-                if edge_data.get("relationship") == "REQUIRES":
-                    prereqs.append(predecessor)
-                    break
-
-        return prereqs
-
-    def get_prerequisite_chain(self, course_code: str, max_depth: int = 10) -> PrerequisiteChain:
+        # P -[REQUIRES]-> course_code
+        return self.index.predecessors(course_code, "REQUIRES")
+
+    def get_prerequisite_chain(self,
+                               course_code: str,
+                               max_depth: int = 10,
+                               include_chains: bool = False,
+                               max_chains: Optional[int] = None) -> PrerequisiteChain:
         """
-        Get all prerequisite chains (multi-hop)
+        Get all prerequisites (transitive) and, optionally, the prerequisite chains
+
+        all_prerequisites 直接取自加载时建好的传递闭包（不受 max_depth 限制）；
+        链的数量随分叉指数增长，只在 include_chains=True 时按上限枚举（结果缓存）。
 
         Args:
             course_code: Target course code
-            max_depth: Maximum depth to search
+            max_depth: Maximum chain depth (only used for chains)
+            include_chains: Also enumerate the chains down to courses without prerequisites
+            max_chains: Stop after this many chains (default PREREQ_CHAIN_MAX_CHAINS)
 
         Returns:
-            PrerequisiteChain object with all paths
+            PrerequisiteChain object (chains is empty unless include_chains)
         """
         if course_code not in self.graph:
             return PrerequisiteChain(course_code, [], set())
 
-        all_prereqs = set()
+        all_prereqs = set(self.index.ancestors(course_code, "REQUIRES"))
         chains = []
-
-        def dfs_prereqs(current: str, path: List[str], depth: int):
-            if depth > max_depth:
-                return
-
-            # (这个函数递归调用 get_direct_prerequisites, 所以也会被修正)
-            direct_prereqs = self.get_direct_prerequisites(current)
-
-            if not direct_prereqs:
-                # Leaf node - save this chain
-                if path:
-                    chains.append(path[:])
-                return
-
-            for prereq in direct_prereqs:
-                if prereq not in path:  # Avoid cycles
-                    all_prereqs.add(prereq)
-                    path.append(prereq)
-                    dfs_prereqs(prereq, path, depth + 1)
-                    path.pop()
-
-        dfs_prereqs(course_code, [], 0)
+        if include_chains:
+            max_chains = max_chains or PREREQ_CHAIN_MAX_CHAINS
+            chains, truncated = self.index.chains(
+                course_code, "REQUIRES", max_depth,
+                max_chains=max_chains, time_budget=PATH_SEARCH_TIME_BUDGET_MS / 1000.0
+            )
+            if truncated and ENABLE_VERBOSE_LOGGING:
+                print(f"[WARN] Prerequisite chains of {course_code} stopped at {len(chains)} chains "
+                      f"(max_chains={max_chains}, budget={PATH_SEARCH_TIME_BUDGET_MS:.0f}ms)")
 
         return PrerequisiteChain(
             target_course=course_code,
@@ -167,21 +180,8 @@ class KnowledgeGraphQuery:
         Returns:
             List of unlocked course codes
         """
-        if course_code not in self.graph:
-            return []
-
-        unlocked = []
-        # 遍历后继节点 (successor)，即 course_code -> S
-        for successor in self.graph.successors(course_code):
-            # 检查 course_code -> S 这条边
-            for key, edge_data in self.graph[course_code][successor].items():
-                # 修复: 逻辑上 P -> S 的边是 "REQUIRES"
-                # 原始错误代码: "UNLOCKS"
-                if edge_data.get("relationship") == "REQUIRES":
-                    unlocked.append(successor)
-                    break
-
-        return unlocked
+        # course_code -[REQUIRES]-> S
+        return self.index.successors(course_code, "REQUIRES")
 
     def get_all_unlocked_courses(self, completed_courses: Set[str]) -> List[str]:
         """
@@ -193,19 +193,32 @@ class KnowledgeGraphQuery:
         Returns:
             List of course codes that prerequisites are satisfied
         """
-        available = []
-
-        for course in self.get_all_courses():
-            if course in completed_courses:
-                continue
+        # 在 REQUIRES 入边 CSR 上一次向量化：未满足的先修数为 0 的课程
+        return self.index.unlocked("REQUIRES", completed_courses, node_type="Course")
 
-            prereqs = self.get_direct_prerequisites(course)
+    def rank_courses_by_unlocks(self,
+                                completed_courses: Set[str],
+                                top_k: int = 20,
+                                available_only: bool = True) -> List[Dict[str, Any]]:
+        """
+        Rank courses by how many new courses completing them would unlock
 
-            # Check if all prerequisites are completed
-            if all(prereq in completed_courses for prereq in prereqs):
-                available.append(course)
+        Args:
+            completed_courses: Set of completed course codes
+            top_k: Number of courses to return
+            available_only: Only rank courses whose prerequisites are already satisfied
 
-        return available
+        Returns:
+            List of dicts with course_code, unlocks (courses that become available
+            after completing it) and total_unlocks (all courses requiring it)
+        """
+        return [
+            {"course_code": course, "unlocks": gain, "total_unlocks": total}
+            for course, gain, total in self.index.rank_by_unlocks(
+                "REQUIRES", completed_courses, node_type="Course",
+                candidates_unlocked_only=available_only, top_k=top_k
+            )
+        ]
 
     # ========================================================================
     # Corequisite Queries
@@ -213,20 +226,8 @@ class KnowledgeGraphQuery:
 
     def get_corequisites(self, course_code: str) -> List[str]:
         """Get courses that must be taken together"""
-        if course_code not in self.graph:
-            return []
-
-        coreqs = []
-        # 遍历前驱节点 (predecessor)，即 C -> course_code
-        for predecessor in self.graph.predecessors(course_code):
-            # 修复: 检查 C -> course_code 这条边
-            # 原始错误代码: self.graph[course_code][predecessor]
-            for key, edge_data in self.graph[predecessor][course_code].items():
-                if edge_data.get("relationship") == "COREQUISITE_OF":
-                    coreqs.append(predecessor)
-                    break
-
-        return coreqs
+        # C -[COREQUISITE_OF]-> course_code
+        return self.index.predecessors(course_code, "COREQUISITE_OF")
 
     # ========================================================================
     # Incompatibility Queries
@@ -234,27 +235,11 @@ class KnowledgeGraphQuery:
 
     def get_incompatible_courses(self, course_code: str) -> List[str]:
         """Get courses that cannot be taken together with this course"""
-        if course_code not in self.graph:
-            return []
-        
-        # 修复: 必须进行对称检查 (入边和出边)
-        incompatible_set = set()
-        for neighbor in self.graph.neighbors(course_code):
-            # 检查出边: course_code -> neighbor
-            if self.graph.has_edge(course_code, neighbor):
-                for key, edge_data in self.graph[course_code][neighbor].items():
-                    if edge_data.get("relationship") == "INCOMPATIBLE_WITH":
-                        incompatible_set.add(neighbor)
-                        break
-
-            # 检查入边: neighbor -> course_code
-            if self.graph.has_edge(neighbor, course_code):
-                for key, edge_data in self.graph[neighbor][course_code].items():
-                    if edge_data.get("relationship") == "INCOMPATIBLE_WITH":
-                        incompatible_set.add(neighbor)
-                        break
-
-        return list(incompatible_set)
+        # 对称检查（入边和出边），去重
+        return list(dict.fromkeys(
+            self.index.successors(course_code, "INCOMPATIBLE_WITH")
+            + self.index.predecessors(course_code, "INCOMPATIBLE_WITH")
+        ))
 
     def check_incompatibility_conflict(self,
                                          course_code: str,
@@ -275,20 +260,8 @@ class KnowledgeGraphQuery:
 
     def get_courses_in_major(self, major_code: str) -> List[str]:
         """Get all courses that are part of a major_code"""
-        if major_code not in self.graph:
-            return []
-
-        courses = []
-        # 查找 Course -> major_code 的边
-        for predecessor in self.graph.predecessors(major_code):
-            # 访问 (predecessor, major_code) 边
-            for key, edge_data in self.graph[predecessor][major_code].items():
-                if edge_data.get("relationship") == "PART_OF":
-                    if self.graph.nodes[predecessor].get("node_type") == "Course":
-                        courses.append(predecessor)
-                        break
-
-        return courses
+        # Course -[PART_OF]-> major_code
+        return self.index.predecessors(major_code, "PART_OF", node_type="Course")
 
     def get_majors_for_course(self, course_code: str) -> List[Dict[str, str]]:
         """
@@ -297,23 +270,11 @@ class KnowledgeGraphQuery:
         Returns:
             List of dicts with major_code and requirement_type
         """
-        if course_code not in self.graph:
-            return []
-
-        majors = []
-        # 查找 Course -> major_code 的边
-        for successor in self.graph.successors(course_code):
-            # 访问 (course_code, successor) 边
-            for key, edge_data in self.graph[course_code][successor].items():
-                if edge_data.get("relationship") == "PART_OF":
-                    if self.graph.nodes[successor].get("node_type") == "major_code":
-                        majors.append({
-                            "major_code": successor,
-                            "requirement_type": edge_data.get("requirement_type", "")
-                        })
-                        break
-
-        return majors
+        # Course -[PART_OF]-> major_code，requirement_type 取自第一条 PART_OF 边
+        return [
+            {"major_code": major, "requirement_type": edge_data.get("requirement_type", "")}
+            for major, edge_data in self.index.successor_edges(course_code, "PART_OF", node_type="major_code")
+        ]
 
     def get_major_info(self, major_code: str) -> Optional[Dict[str, Any]]:
         """Get major_code information"""
@@ -328,35 +289,13 @@ class KnowledgeGraphQuery:
 
     def get_requirement_groups_for_major(self, major_code: str) -> List[str]:
         """Get all requirement groups for a major_code"""
-        if major_code not in self.graph:
-            return []
-
-        groups = []
-        # 查找 Group -> major_code 的边
-        for predecessor in self.graph.predecessors(major_code):
-            for key, edge_data in self.graph[predecessor][major_code].items():
-                if edge_data.get("relationship") == "BELONGS_TO":
-                    if self.graph.nodes[predecessor].get("node_type") == "RequirementGroup":
-                        groups.append(predecessor)
-                        break
-
-        return groups
+        # Group -[BELONGS_TO]-> major_code
+        return self.index.predecessors(major_code, "BELONGS_TO", node_type="RequirementGroup")
 
     def get_courses_in_requirement_group(self, group_id: str) -> List[str]:
         """Get all courses that satisfy a requirement group"""
-        if group_id not in self.graph:
-            return []
-
-        courses = []
-        # 查找 Course -> Group 的边
-        for predecessor in self.graph.predecessors(group_id):
-            for key, edge_data in self.graph[predecessor][group_id].items():
-                if edge_data.get("relationship") == "SATISFIES":
-                    if self.graph.nodes[predecessor].get("node_type") == "Course":
-                        courses.append(predecessor)
-                        break
-
-        return courses
+        # Course -[SATISFIES]-> Group
+        return self.index.predecessors(group_id, "SATISFIES", node_type="Course")
 
     # ========================================================================
     # Path Finding
@@ -365,47 +304,40 @@ class KnowledgeGraphQuery:
     def find_prerequisite_path(self,
                                  from_course: str,
                                  to_course: str,
-                                 max_length: int = 10) -> List[List[str]]:
+                                 max_length: int = 10,
+                                 max_paths: Optional[int] = None,
+                                 time_budget_ms: Optional[float] = None) -> List[List[str]]:
         """
-        Find all paths from one course to another via REQUIRES relationships
+        Find paths from one course to another via REQUIRES relationships
 
         Args:
             from_course: Starting course
             to_course: Target course
             max_length: Maximum path length
+            max_paths: Stop after this many paths (default PATH_SEARCH_MAX_PATHS)
+            time_budget_ms: Stop after this much time (default PATH_SEARCH_TIME_BUDGET_MS)
 
         Returns:
-            List of paths (each path is a list of course codes)
+            List of paths (each path is a list of course codes), in the same order as
+            nx.all_simple_paths, possibly truncated by max_paths / time_budget_ms
         """
-        if from_course not in self.graph or to_course not in self.graph:
-            return []
-
-        # Create a filtered graph with only REQUIRES edges
-        requires_graph = nx.DiGraph()
-        for u, v, key, data in self.graph.edges(keys=True, data=True):
-            if data.get("relationship") == "REQUIRES":
-                requires_graph.add_edge(u, v)
-
-        try:
-            # Find all simple paths
-            paths = list(nx.all_simple_paths(
-                requires_graph,
-                from_course,
-                to_course,
-                cutoff=max_length
-            ))
-            return paths
-        except nx.NetworkXNoPath:
-            return []
+        max_paths = max_paths or PATH_SEARCH_MAX_PATHS
+        time_budget_ms = time_budget_ms or PATH_SEARCH_TIME_BUDGET_MS
+        # 在加载时建好的 REQUIRES 邻接表上惰性枚举，路径数和耗时都有上限
+        paths, truncated = self.index.find_paths(
+            from_course, to_course, "REQUIRES", max_length,
+            max_paths=max_paths, time_budget=time_budget_ms / 1000.0
+        )
+        if truncated and ENABLE_VERBOSE_LOGGING:
+            print(f"[WARN] Prerequisite path search {from_course} -> {to_course} stopped at "
+                  f"{len(paths)} paths (max_paths={max_paths}, budget={time_budget_ms:.0f}ms)")
+        return paths
 
     def get_shortest_prerequisite_path(self,
                                          from_course: str,
                                          to_course: str) -> Optional[List[str]]:
-        """Find shortest prerequisite path between two courses"""
-        paths = self.find_prerequisite_path(from_course, to_course)
-        if not paths:
-            return None
-        return min(paths, key=len)
+        """Find shortest prerequisite path between two courses (BFS over REQUIRES edges)"""
+        return self.index.shortest_path(from_course, to_course, "REQUIRES")
 
     # ========================================================================
     # Advanced Queries
@@ -413,25 +345,32 @@ class KnowledgeGraphQuery:
 
     def get_missing_prerequisites(self,
                                     course_code: str,
-                                    completed_courses: Set[str]) -> Dict[str, Any]:
+                                    completed_courses: Set[str],
+                                    include_chains: bool = False) -> Dict[str, Any]:
         """
         Get detailed missing prerequisite information
 
+        Args:
+            include_chains: Also return prerequisite_chains (bounded, see get_prerequisite_chain)
+
         Returns:
-            Dict with direct_missing, all_missing, and prerequisite_tree
+            Dict with direct_missing, all_missing, and prerequisite_chains
         """
-        chain = self.get_prerequisite_chain(course_code)
         direct_prereqs = self.get_direct_prerequisites(course_code)
-
         direct_missing = [p for p in direct_prereqs if p not in completed_courses]
-        all_missing = [p for p in chain.all_prerequisites if p not in completed_courses]
+        # 闭包位集与已修课程位集做一次差集
+        all_missing = self.index.ancestors(course_code, "REQUIRES", exclude=list(completed_courses))
+        chains = (
+            self.get_prerequisite_chain(course_code, include_chains=True).chains
+            if include_chains else []
+        )
 
         return {
             "course_code": course_code,
             "direct_missing": direct_missing,
             "all_missing": all_missing,
-            "prerequisite_chains": chain.chains,
-            "total_prerequisites": len(chain.all_prerequisites)
+            "prerequisite_chains": chains,
+            "total_prerequisites": self.index.count_ancestors(course_code, "REQUIRES")
         }
 
     def get_course_relationships(self, course_code: str) -> Dict[str, List[str]]:
@@ -472,6 +411,79 @@ class KnowledgeGraphQuery:
             stats["relationship_types"][rel_type] = stats["relationship_types"].get(rel_type, 0) + 1
 
         return stats
+
+# ============================================================================
+# Shared graph registry
+# ============================================================================
+# 反序列化 course_kg.pkl（整个 MultiDiGraph）开销很大；同一路径在进程内只加载一次，
+# knowledge_graph_search 工具和 HybridSearchService 共用同一个 KnowledgeGraphQuery。
+# 文件 (mtime, size) 变化时再比较内容哈希，内容确实变了才重新加载（build_knowledge_graph.py 重建后生效）。
+# 调用方持有的旧实例不受影响，下一次 get_knowledge_graph() 拿到新实例。
+
+@dataclass
+class _RegistryEntry:
+    signature: Tuple[int, int]
+    digest: str
+    kg: KnowledgeGraphQuery
+
+
+_KG_REGISTRY: Dict[str, _RegistryEntry] = {}
+_KG_REGISTRY_LOCK = threading.Lock()
+
+
+def default_graph_path() -> Path:
+    """course_data/knowledge_graph/course_kg.pkl"""
+    project_root = Path(__file__).parent.parent.parent.parent.parent
+    return project_root / "course_data" / "knowledge_graph" / "course_kg.pkl"
+
+
+def _file_signature(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def get_knowledge_graph(graph_path: Optional[str] = None) -> KnowledgeGraphQuery:
+    """
+    进程内共享的 KnowledgeGraphQuery（线程安全，按路径缓存）
+
+    Args:
+        graph_path: pickle 路径，默认 course_data/knowledge_graph/course_kg.pkl
+
+    Raises:
+        FileNotFoundError: 图文件不存在
+    """
+    path = Path(graph_path) if graph_path else default_graph_path()
+    key = str(path.resolve())
+    signature = _file_signature(path)
+
+    entry = _KG_REGISTRY.get(key)
+    if entry is not None and entry.signature == signature:
+        return entry.kg
+
+    with _KG_REGISTRY_LOCK:
+        entry = _KG_REGISTRY.get(key)
+        if entry is not None and entry.signature == signature:
+            return entry.kg
+        digest = _file_digest(path)
+        if entry is not None and entry.digest == digest:
+            # 只是 touch / 重新拷贝，内容没变
+            entry.signature = signature
+            return entry.kg
+        kg = KnowledgeGraphQuery(str(path))
+        _KG_REGISTRY[key] = _RegistryEntry(signature, digest, kg)
+        if entry is not None:
+            print(f"[OK] Knowledge graph reloaded: {path.name} changed on disk")
+        return kg
+
+
 def _to_jsonable(x):
     """辅助：把不可序列化类型转换成 JSON 可序列化类型"""
     if isinstance(x, set):
@@ -547,6 +559,8 @@ class KnowledgeGraphArgs(BaseModel):
     group_id: Optional[str] = Field(default=None, description="RequirementGroup 的 ID")
     max_depth: int = Field(default=10, description="最大检索深度")
     max_length: int = Field(default=10, description="路径最大长度")
+    top_k: int = Field(default=20, description="rank_by_unlocks 返回的课程数")
+    include_chains: bool = Field(default=False, description="missing_prereqs 是否同时返回先修链（较慢，默认只返回缺少的课程）")
     graph_path: Optional[str] = Field(default=None, description="可选：覆盖默认的 KG pickle 路径")
 
 @tool(args_schema=KnowledgeGraphArgs)
@@ -564,6 +578,8 @@ def knowledge_graph_search(**kwargs) -> Dict[str, Any]:
       - major_code: str
       - completed_courses: list[str] 或 set
       - max_depth / max_length: int
+      - include_chains: bool（missing_prereqs 是否返回先修链）
+      - top_k: int（rank_by_unlocks 返回的课程数）
       - graph_path: str (可选，覆盖默认路径)
 
     支持的 action 列表 & 含义:
@@ -574,6 +590,7 @@ def knowledge_graph_search(**kwargs) -> Dict[str, Any]:
       - "prereq_chain"
       - "unlocks_by"
       - "all_unlocked"
+      - "rank_by_unlocks"（可选课程按完成后能新解锁的课程数排序）
       - "corequisites"
       - "incompatible"
       - "check_incompatibility_conflict"
@@ -609,14 +626,8 @@ def knowledge_graph_search(**kwargs) -> Dict[str, Any]:
         return {"status": "error", "error": "缺少必需的 'action' 参数"}
 
     try:
-        # 加载知识图谱 (逻辑不变)
-        graph_path = args.graph_path
-        if not graph_path:
-            script_dir = Path(__file__).parent
-            project_root = script_dir.parent.parent.parent.parent # 根据你的项目结构调整
-            graph_path = project_root / "course_data" / "knowledge_graph" / "course_kg.pkl"
-        
-        kg = KnowledgeGraphQuery(str(graph_path))
+        # 进程内共享的图实例（文件未变化时不重新反序列化）
+        kg = get_knowledge_graph(args.graph_path)
     except Exception as e:
         if ENABLE_VERBOSE_LOGGING:
             print(f"[ERR] [KGS Tool] 加载知识图谱失败: {e}")
@@ -643,7 +654,7 @@ def knowledge_graph_search(**kwargs) -> Dict[str, Any]:
             return {"status":"ok","result": kg.get_direct_prerequisites(args.course_code)}
         if args.action == "prereq_chain":
             if not args.course_code: return {"status":"error","error":"prereq_chain 需要 course_code"}
-            chain = kg.get_prerequisite_chain(args.course_code, max_depth=args.max_depth)
+            chain = kg.get_prerequisite_chain(args.course_code, max_depth=args.max_depth, include_chains=True)
             return {"status":"ok","result": {"target_course": chain.target_course, "chains": chain.chains, "all_prerequisites": list(chain.all_prerequisites)}}
         if args.action == "unlocks_by":
             if not args.course_code: return {"status":"error","error":"unlocks_by 需要 course_code"}
@@ -651,10 +662,13 @@ def knowledge_graph_search(**kwargs) -> Dict[str, Any]:
         if args.action == "all_unlocked":
             completed_set = set(args.completed_courses or [])
             return {"status":"ok","result": kg.get_all_unlocked_courses(completed_set)}
+        if args.action == "rank_by_unlocks":
+            completed_set = set(args.completed_courses or [])
+            return {"status":"ok","result": kg.rank_courses_by_unlocks(completed_set, top_k=args.top_k)}
         if args.action == "missing_prereqs":
             if not args.course_code: return {"status":"error","error":"missing_prereqs 需要 course_code"}
             completed_set = set(args.completed_courses or [])
-            res = kg.get_missing_prerequisites(args.course_code, completed_set)
+            res = kg.get_missing_prerequisites(args.course_code, completed_set, include_chains=args.include_chains)
             return {"status":"ok","result": _to_jsonable(res)}
 
         # --- Other Relationships ---
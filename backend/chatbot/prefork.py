@@ -0,0 +1,122 @@
+# backend/chatbot/prefork.py
+# 多 worker 部署：master 里一次加载只读检索资产，fork 后各 worker 共享（copy-on-write）
+#
+# 默认（uvicorn --workers N）每个 worker 各自 import 并加载模型 / 向量矩阵 / 知识图谱 / 课程目录，
+# 内存 = N 份。用 gunicorn --preload（backend/gunicorn.conf.py）时:
+#   1. master 执行 preload_before_fork()：加载全部只读资产，但不做任何推理
+#   2. gc.freeze() 把这些对象移出 GC 的追踪代，worker 里的 GC 不会再写它们的对象头
+#   3. fork 出的 worker 执行 after_fork()：重建线程 / 锁 / Chroma 连接，在后台预热
+#
+# 向量矩阵、BM25 postings、packed 的 ids/文档/metadata（VECTOR_INDEX_PACKED）都是 numpy 缓冲，
+# 读取不会写页，fork 后一直共享；模型权重是 torch tensor 的存储，同样只读共享。
+#
+# 用 backend/test/memory_report.py 对比开启前后每个 worker 的独占内存（USS）。
+
+import asyncio
+import gc
+import os
+import threading
+import time
+import traceback
+
+# gunicorn.conf.py 设置；apps.ready() 据此改为同步加载（必须在 fork 之前完成）
+RETRIEVAL_PREFORK = os.getenv("RETRIEVAL_PREFORK", "false").lower() == "true"
+# 每个 worker 的 torch 线程数（0 = 按 CPU 数 / worker 数平分）
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))
+
+
+def preload_before_fork():
+    """
+    在 gunicorn master 里加载只读资产（apps.ready 在 RETRIEVAL_PREFORK=true 时调用）
+
+    顺序与 apps.ready 的后台初始化一致：检索组件 -> 课程目录 -> 提示词 -> LangGraph，
+    区别是这里不做推理（见 preload_hybrid_search）。
+    """
+    from chatbot.langgraph_agent.readiness import READINESS
+
+    start = time.time()
+    try:
+        import torch
+        # master 里不创建 OpenMP 线程池：fork 之后继承的线程池不可用
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    print(f"[INIT] [prefork] 在 master (pid {os.getpid()}) 中加载只读检索资产...")
+    from chatbot.langgraph_agent.parallel_search_and_rerank import preload_hybrid_search
+    preload_hybrid_search()
+
+    step = time.time()
+    try:
+        from chatbot.langgraph_agent.tools.filter_compiled_courses import preload_course_catalogue
+        requirements, courses = preload_course_catalogue()
+        READINESS.record("course_catalogue", time.time() - step)
+        print(f"[OK] [prefork] 课程目录: {requirements} graduation requirements, {courses} courses")
+    except Exception as e:
+        READINESS.record("course_catalogue", time.time() - step, error=str(e))
+        print(f"[WARN] [prefork] 课程目录加载失败: {e}")
+
+    step = time.time()
+    try:
+        from chatbot.langgraph_agent.node.prompt_loader import load_prompts
+        load_prompts()
+        READINESS.record("prompts", time.time() - step)
+    except Exception as e:
+        READINESS.record("prompts", time.time() - step, error=str(e))
+        print(f"[WARN] [prefork] 提示词加载失败: {e}")
+
+    step = time.time()
+    try:
+        from chatbot.langgraph_agent.main_graph import warmup_graph
+        graph = asyncio.run(warmup_graph())
+        READINESS.record("graph", time.time() - step, error=None if graph else "compile failed")
+    except Exception as e:
+        READINESS.record("graph", time.time() - step, error=str(e))
+        print(f"[WARN] [prefork] LangGraph 预编译失败: {e}")
+
+    freeze_shared_heap()
+    print(f"[OK] [prefork] 只读资产已加载 ({time.time() - start:.2f}s)，等待 fork worker")
+
+
+def freeze_shared_heap():
+    """
+    回收一次后把现存对象全部移入永久代（gc.freeze）
+
+    fork 之后 worker 里的 GC 不再遍历这些对象，它们所在的内存页不会因为 GC 写对象头而被复制。
+    """
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+        print(f"[OK] [prefork] gc.freeze(): {gc.get_freeze_count()} objects moved to the permanent generation")
+
+
+def after_fork(num_workers: int = 1):
+    """
+    在每个 worker 里执行（gunicorn post_fork）
+
+    Args:
+        num_workers: worker 总数，用于平分 torch 线程
+    """
+    from chatbot.langgraph_agent.readiness import READINESS
+    from chatbot.langgraph_agent.parallel_search_and_rerank import reset_after_fork, warmup_hybrid_search
+
+    try:
+        import torch
+        threads = TORCH_THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // max(1, num_workers))
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    reset_after_fork()
+
+    def _warmup():
+        # 第一次前向的一次性开销（kernel 选择、线程池创建）留在 worker 里完成
+        try:
+            warmup_hybrid_search()
+            READINESS.mark_ready(mode="prefork")
+            print(f"[DONE] [prefork] worker {os.getpid()} 已就绪")
+        except Exception as e:
+            traceback.print_exc()
+            READINESS.mark_failed(str(e))
+
+    threading.Thread(target=_warmup, daemon=True).start()
@@ -9,6 +9,7 @@ import time
 
 from chatbot.langgraph_agent.timeline_store import get as timeline_get
 from chatbot.langgraph_agent.main_graph import run_chat
+from chatbot.langgraph_agent.readiness import READINESS
 
 
 import asyncio
@@ -119,4 +120,16 @@ async def turn_timeline(request, turn_id: str):
     return JsonResponse(
         {"status": "ok", "turn_id": turn_id, "events": events}, 
         status=200
-    )
\ No newline at end of file
+    )
+
+
+def ready(request):
+    """
+    就绪检查：启动预加载（模型 / 向量库 / 知识图谱 / 图编译）完成前返回 503
+
+    返回各组件的加载耗时，供负载均衡 / 容器探针使用。
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Only GET"}, status=405)
+    snapshot = READINESS.snapshot()
+    return JsonResponse(snapshot, status=200 if snapshot["ready"] else 503)
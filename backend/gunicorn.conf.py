@@ -0,0 +1,33 @@
+# backend/gunicorn.conf.py
+# 多 worker 部署：master 预加载只读检索资产，fork 后各 worker 共享（见 chatbot/prefork.py）
+#
+# 启动（在 backend/ 目录下）:
+#     gunicorn -c gunicorn.conf.py backend.asgi:application
+#
+# 对比 `uvicorn --workers N`（每个 worker 各加载一份模型 / 向量 / 知识图谱）的内存:
+#     python test/memory_report.py --master <gunicorn master pid> --save after.json --compare before.json
+
+import os
+
+# 在 import 应用之前设置：apps.ready() 改为在 master 里同步加载，向量索引使用 packed 列存储
+os.environ.setdefault("RETRIEVAL_PREFORK", "true")
+os.environ.setdefault("VECTOR_INDEX_PACKED", "true")
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# 模型已在 master 里加载，worker 启动很快；请求本身（LLM 流式输出）可能较长
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+
+
+def when_ready(server):
+    server.log.info("Read-only retrieval assets loaded in master (pid %s), forking %s workers",
+                    os.getpid(), server.cfg.workers)
+
+
+def post_fork(server, worker):
+    from chatbot.prefork import after_fork
+
+    after_fork(num_workers=server.cfg.workers)
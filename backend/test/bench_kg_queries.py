@@ -0,0 +1,436 @@
+"""
+知识图谱查询微基准（离线，不需要启动服务）
+
+对比 KnowledgeGraphQuery 的访问器与旧实现（遍历 predecessors / successors 并扫描多重边属性）:
+  1. 每个访问器在所有节点上的结果一致
+  2. 单次调用耗时（µs）和加速比
+  3. 先修路径查询（find_prerequisite_path / get_shortest_prerequisite_path）与
+     "每次重建 REQUIRES 子图 + 完整枚举 nx.all_simple_paths" 的结果和耗时
+  4. 全部先修 / 缺少的先修（传递闭包）与旧的递归 DFS（每次调用都枚举全部链）的结果和耗时
+  5. get_all_unlocked_courses / rank_courses_by_unlocks（整表向量化）与逐课程循环的结果和耗时
+
+用法:
+    python backend/test/bench_kg_queries.py                       # 使用 course_data/knowledge_graph/course_kg.pkl
+    python backend/test/bench_kg_queries.py --synthetic 5000      # 生成同结构的随机图
+    python backend/test/bench_kg_queries.py --repeat 5
+"""
+
+import argparse
+import pickle
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import networkx as nx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.chatbot.langgraph_agent.tools.knowledge_graph_query import KnowledgeGraphQuery  # noqa: E402
+
+DEFAULT_GRAPH = PROJECT_ROOT / "course_data" / "knowledge_graph" / "course_kg.pkl"
+
+
+# ----------------------------------------------------------------------
+# 旧实现（逐条扫描多重边的 relationship 属性）
+# ----------------------------------------------------------------------
+
+def _legacy_in(graph: nx.MultiDiGraph, node: str, relationship: str, node_type: str = None) -> List[str]:
+    if node not in graph:
+        return []
+    result = []
+    for predecessor in graph.predecessors(node):
+        for _, edge_data in graph[predecessor][node].items():
+            if edge_data.get("relationship") == relationship:
+                if node_type is None or graph.nodes[predecessor].get("node_type") == node_type:
+                    result.append(predecessor)
+                    break
+    return result
+
+
+def _legacy_out(graph: nx.MultiDiGraph, node: str, relationship: str) -> List[str]:
+    if node not in graph:
+        return []
+    result = []
+    for successor in graph.successors(node):
+        for _, edge_data in graph[node][successor].items():
+            if edge_data.get("relationship") == relationship:
+                result.append(successor)
+                break
+    return result
+
+
+def _legacy_incompatible(graph: nx.MultiDiGraph, node: str) -> List[str]:
+    if node not in graph:
+        return []
+    found = set()
+    for neighbor in graph.neighbors(node):
+        if graph.has_edge(node, neighbor):
+            for _, edge_data in graph[node][neighbor].items():
+                if edge_data.get("relationship") == "INCOMPATIBLE_WITH":
+                    found.add(neighbor)
+                    break
+        if graph.has_edge(neighbor, node):
+            for _, edge_data in graph[neighbor][node].items():
+                if edge_data.get("relationship") == "INCOMPATIBLE_WITH":
+                    found.add(neighbor)
+                    break
+    return list(found)
+
+
+def _legacy_majors(graph: nx.MultiDiGraph, node: str) -> List[Dict[str, str]]:
+    if node not in graph:
+        return []
+    majors = []
+    for successor in graph.successors(node):
+        for _, edge_data in graph[node][successor].items():
+            if edge_data.get("relationship") == "PART_OF":
+                if graph.nodes[successor].get("node_type") == "major_code":
+                    majors.append({"major_code": successor, "requirement_type": edge_data.get("requirement_type", "")})
+                    break
+    return majors
+
+
+def _legacy_paths(graph: nx.MultiDiGraph, source: str, target: str, max_length: int) -> List[List[str]]:
+    """每次调用都重建 REQUIRES 子图，再完整枚举所有简单路径"""
+    requires_graph = nx.DiGraph()
+    for u, v, _, data in graph.edges(keys=True, data=True):
+        if data.get("relationship") == "REQUIRES":
+            requires_graph.add_edge(u, v)
+    try:
+        return list(nx.all_simple_paths(requires_graph, source, target, cutoff=max_length))
+    except (nx.NetworkXNoPath, nx.NodeNotFound):
+        return []
+
+
+def _legacy_chain(graph: nx.MultiDiGraph, course: str, max_depth: int) -> Tuple[List[List[str]], set]:
+    """旧的 get_prerequisite_chain：递归 DFS 枚举所有链，同时收集全部先修"""
+    all_prereqs, chains = set(), []
+
+    def dfs(current: str, path: List[str], depth: int):
+        if depth > max_depth:
+            return
+        direct = _legacy_in(graph, current, "REQUIRES")
+        if not direct:
+            if path:
+                chains.append(path[:])
+            return
+        for prereq in direct:
+            if prereq not in path:
+                all_prereqs.add(prereq)
+                path.append(prereq)
+                dfs(prereq, path, depth + 1)
+                path.pop()
+
+    if course in graph:
+        dfs(course, [], 0)
+    return chains, all_prereqs
+
+
+def _legacy_unlocked(graph: nx.MultiDiGraph, completed: set) -> List[str]:
+    """旧的 get_all_unlocked_courses：逐课程扫描先修"""
+    courses = [n for n, d in graph.nodes(data=True) if d.get("node_type") == "Course"]
+    return [c for c in courses
+            if c not in completed and all(p in completed for p in _legacy_in(graph, c, "REQUIRES"))]
+
+
+def _legacy_unlock_gain(graph: nx.MultiDiGraph, completed: set, course: str) -> int:
+    """再完成 course 后新增的可选课程数"""
+    return len(_legacy_unlocked(graph, completed | {course})) - len(_legacy_unlocked(graph, completed)) + 1
+
+
+# ----------------------------------------------------------------------
+# 随机图（与 build_knowledge_graph.py 的节点 / 关系类型一致）
+# ----------------------------------------------------------------------
+
+def synthetic_graph(num_courses: int, seed: int = 0) -> nx.MultiDiGraph:
+    rng = random.Random(seed)
+    graph = nx.MultiDiGraph()
+    subjects = ("COMP", "MATH", "ELEC", "DATA")
+    courses = [f"{subjects[i % len(subjects)]}{1000 + i}" for i in range(num_courses)]
+    for code in courses:
+        graph.add_node(code, node_type="Course", title=f"Course {code}")
+    majors = [f"MAJ{i:03d}" for i in range(max(1, num_courses // 100))]
+    for major in majors:
+        graph.add_node(major, node_type="major_code", title=major)
+        for g in range(4):
+            group = f"{major}_group_{g}"
+            graph.add_node(group, node_type="RequirementGroup", major_code=major)
+            graph.add_edge(group, major, relationship="BELONGS_TO")
+            for code in rng.sample(courses, min(len(courses), 12)):
+                graph.add_edge(code, group, relationship="SATISFIES")
+                graph.add_edge(code, major, relationship="PART_OF", requirement_type=f"Group {g}")
+    # 先修只指向更"高"的课程（DAG），和真实数据一样有多条边连着同一对节点
+    for i, code in enumerate(courses):
+        for prereq in rng.sample(courses[:i], min(i, rng.randint(0, 3))):
+            graph.add_edge(prereq, code, relationship="REQUIRES", prerequisite_structure={})
+            graph.add_edge(code, prereq, relationship="UNLOCKS")
+        if i and rng.random() < 0.05:
+            other = courses[rng.randrange(i)]
+            graph.add_edge(code, other, relationship="INCOMPATIBLE_WITH")
+            graph.add_edge(other, code, relationship="INCOMPATIBLE_WITH")
+        if i and rng.random() < 0.03:
+            graph.add_edge(courses[rng.randrange(i)], code, relationship="COREQUISITE_OF", corequisite_structure={})
+    return graph
+
+
+# ----------------------------------------------------------------------
+# 计时
+# ----------------------------------------------------------------------
+
+def per_call_us(fn: Callable, args: List, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for arg in args:
+            fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best / max(1, len(args)) * 1e6
+
+
+def run(kg: KnowledgeGraphQuery, repeat: int):
+    graph = kg.graph
+    courses = kg.get_all_courses()
+    majors = [n for n, d in graph.nodes(data=True) if d.get("node_type") == "major_code"]
+    groups = [n for n, d in graph.nodes(data=True) if d.get("node_type") == "RequirementGroup"]
+
+    cases = [
+        ("get_direct_prerequisites", courses, kg.get_direct_prerequisites,
+         lambda c: _legacy_in(graph, c, "REQUIRES"), False),
+        ("get_courses_unlocked_by", courses, kg.get_courses_unlocked_by,
+         lambda c: _legacy_out(graph, c, "REQUIRES"), False),
+        ("get_corequisites", courses, kg.get_corequisites,
+         lambda c: _legacy_in(graph, c, "COREQUISITE_OF"), False),
+        ("get_incompatible_courses", courses, kg.get_incompatible_courses,
+         lambda c: _legacy_incompatible(graph, c), True),
+        ("get_majors_for_course", courses, kg.get_majors_for_course,
+         lambda c: _legacy_majors(graph, c), False),
+        ("get_courses_in_major", majors, kg.get_courses_in_major,
+         lambda m: _legacy_in(graph, m, "PART_OF", "Course"), False),
+        ("get_requirement_groups_for_major", majors, kg.get_requirement_groups_for_major,
+         lambda m: _legacy_in(graph, m, "BELONGS_TO", "RequirementGroup"), False),
+        ("get_courses_in_requirement_group", groups, kg.get_courses_in_requirement_group,
+         lambda g: _legacy_in(graph, g, "SATISFIES", "Course"), False),
+    ]
+
+    print(f"\n{'accessor':<34} {'calls':>6} {'legacy(us)':>11} {'indexed(us)':>12} {'speedup':>8}")
+    failures = 0
+    for name, args, new_fn, old_fn, unordered in cases:
+        if not args:
+            continue
+        for arg in args:
+            new, old = new_fn(arg), old_fn(arg)
+            if (sorted(new) != sorted(old)) if unordered else (new != old):
+                failures += 1
+                print(f"[ERR] {name}({arg}): indexed={new} legacy={old}")
+                break
+        old_us = per_call_us(old_fn, args, repeat)
+        new_us = per_call_us(new_fn, args, repeat)
+        print(f"{name:<34} {len(args):>6} {old_us:>11.2f} {new_us:>12.2f} {old_us / max(new_us, 1e-9):>7.1f}x")
+
+    print("\n[OK] All accessors match the legacy implementation" if not failures else f"\n[ERR] {failures} mismatches")
+    return failures
+
+
+def sample_path_pairs(kg: KnowledgeGraphQuery, count: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """(祖先, 课程)：从有先修的课程出发沿先修随机往上走 2~5 步"""
+    rng = random.Random(seed)
+    targets = [c for c in kg.get_all_courses() if kg.get_direct_prerequisites(c)]
+    pairs = []
+    for _ in range(count * 20):
+        if not targets or len(pairs) >= count:
+            break
+        target = current = rng.choice(targets)
+        for _ in range(rng.randint(2, 5)):
+            prereqs = kg.get_direct_prerequisites(current)
+            if not prereqs:
+                break
+            current = rng.choice(prereqs)
+        if current != target:
+            pairs.append((current, target))
+    return pairs
+
+
+def run_paths(kg: KnowledgeGraphQuery, num_pairs: int, max_length: int):
+    """find_prerequisite_path / get_shortest_prerequisite_path 与旧实现对比"""
+    pairs = sample_path_pairs(kg, num_pairs)
+    if not pairs:
+        print("\n[SKIP] No prerequisite chains to benchmark")
+        return 0
+
+    failures = 0
+    legacy_s = new_s = shortest_s = worst_new = 0.0
+    truncated = 0
+    for source, target in pairs:
+        start = time.perf_counter()
+        old = _legacy_paths(kg.graph, source, target, max_length)
+        legacy_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = kg.find_prerequisite_path(source, target, max_length=max_length)
+        elapsed = time.perf_counter() - start
+        new_s += elapsed
+        worst_new = max(worst_new, elapsed)
+
+        start = time.perf_counter()
+        shortest = kg.get_shortest_prerequisite_path(source, target)
+        shortest_s += time.perf_counter() - start
+
+        if len(new) < len(old):
+            truncated += 1
+        if new != old[:len(new)]:
+            failures += 1
+            print(f"[ERR] find_prerequisite_path({source}, {target}) differs from nx.all_simple_paths")
+        expected = min((len(p) for p in old), default=None)
+        if expected is not None and (shortest is None or len(shortest) > expected):
+            failures += 1
+            print(f"[ERR] get_shortest_prerequisite_path({source}, {target}) = {shortest}, expected length {expected}")
+
+    n = len(pairs)
+    print(f"\nPath queries: {n} pairs, max_length={max_length} ({truncated} capped by max_paths / time budget)")
+    print(f"  legacy (rebuild + all_simple_paths): {legacy_s / n * 1e3:9.2f} ms/query")
+    print(f"  find_prerequisite_path:              {new_s / n * 1e3:9.2f} ms/query (worst {worst_new * 1e3:.2f} ms)")
+    print(f"  get_shortest_prerequisite_path:      {shortest_s / n * 1e3:9.2f} ms/query")
+    print("[OK] Path results match nx.all_simple_paths" if not failures else f"[ERR] {failures} path mismatches")
+    return failures
+
+
+def run_closure(kg: KnowledgeGraphQuery, num_courses: int, max_depth: int):
+    """全部先修 / 缺少的先修 / 先修链与旧的递归 DFS 对比（旧实现是指数级的，只抽样少量课程）"""
+    requires_graph = nx.DiGraph()
+    requires_graph.add_nodes_from(kg.graph)
+    for u, v, data in kg.graph.edges(data=True):
+        if data.get("relationship") == "REQUIRES":
+            requires_graph.add_edge(u, v)
+
+    failures = 0
+    courses = kg.get_all_courses()
+    for course in courses:
+        expected = nx.ancestors(requires_graph, course)
+        if kg.get_prerequisite_chain(course).all_prerequisites != expected:
+            failures += 1
+            print(f"[ERR] all_prerequisites({course}) differs from nx.ancestors")
+            break
+
+    rng = random.Random(0)
+    targets = [c for c in courses if kg.get_direct_prerequisites(c)]
+    sample = rng.sample(targets, min(num_courses, len(targets)))
+    legacy_s = closure_s = missing_s = chains_s = 0.0
+    for course in sample:
+        completed = set(rng.sample(courses, min(len(courses), 30)))
+
+        start = time.perf_counter()
+        old_chains, old_all = _legacy_chain(kg.graph, course, max_depth)
+        old_missing = {p for p in old_all if p not in completed}
+        legacy_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        all_prereqs = kg.get_prerequisite_chain(course, max_depth=max_depth).all_prerequisites
+        closure_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        missing = kg.get_missing_prerequisites(course, completed)
+        missing_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        chains = kg.get_prerequisite_chain(course, max_depth=max_depth, include_chains=True).chains
+        chains_s += time.perf_counter() - start
+
+        # 旧实现受 max_depth 限制，闭包不受限制
+        if not old_all <= all_prereqs or not old_missing <= set(missing["all_missing"]):
+            failures += 1
+            print(f"[ERR] closure of {course} misses prerequisites found by the legacy DFS")
+        if set(missing["all_missing"]) != all_prereqs - completed:
+            failures += 1
+            print(f"[ERR] get_missing_prerequisites({course}) != all_prerequisites - completed")
+        if chains != old_chains[:len(chains)]:
+            failures += 1
+            print(f"[ERR] bounded chains of {course} differ from the legacy DFS")
+
+    n = max(1, len(sample))
+    print(f"\nPrerequisite closure: {len(courses)} courses checked against nx.ancestors, "
+          f"{len(sample)} sampled for the legacy DFS (max_depth={max_depth})")
+    print(f"  legacy DFS (chains + all prereqs):   {legacy_s / n * 1e3:9.2f} ms/query")
+    print(f"  all_prerequisites (closure):         {closure_s / n * 1e3:9.3f} ms/query")
+    print(f"  get_missing_prerequisites:           {missing_s / n * 1e3:9.3f} ms/query")
+    print(f"  chains (bounded, cached):            {chains_s / n * 1e3:9.3f} ms/query")
+    print("[OK] Closure results match" if not failures else f"[ERR] {failures} closure mismatches")
+    return failures
+
+
+def run_unlocked(kg: KnowledgeGraphQuery, num_profiles: int):
+    """随机的已修课程集合（按先修顺序选课，接近真实学生）上对比可选课程和解锁排序"""
+    rng = random.Random(0)
+    courses = kg.get_all_courses()
+    failures = 0
+    legacy_s = new_s = rank_s = 0.0
+    for _ in range(num_profiles):
+        completed = set()
+        for _ in range(rng.randint(0, 40)):
+            available = kg.get_all_unlocked_courses(completed)
+            if not available:
+                break
+            completed.add(rng.choice(available))
+
+        start = time.perf_counter()
+        old = _legacy_unlocked(kg.graph, completed)
+        legacy_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = kg.get_all_unlocked_courses(completed)
+        new_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        ranked = kg.rank_courses_by_unlocks(completed, top_k=5)
+        rank_s += time.perf_counter() - start
+
+        if new != old:
+            failures += 1
+            print(f"[ERR] get_all_unlocked_courses differs from the per-course loop ({len(new)} vs {len(old)})")
+        for row in ranked:
+            if row["course_code"] not in old or row["unlocks"] != _legacy_unlock_gain(kg.graph, completed, row["course_code"]):
+                failures += 1
+                print(f"[ERR] rank_courses_by_unlocks: {row}")
+                break
+
+    n = max(1, num_profiles)
+    print(f"\nUnlocked courses: {num_profiles} random profiles over {len(courses)} courses")
+    print(f"  legacy (per-course loop):            {legacy_s / n * 1e3:9.2f} ms/query")
+    print(f"  get_all_unlocked_courses:            {new_s / n * 1e3:9.3f} ms/query")
+    print(f"  rank_courses_by_unlocks:             {rank_s / n * 1e3:9.3f} ms/query")
+    print("[OK] Unlocked courses match" if not failures else f"[ERR] {failures} unlocked mismatches")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KnowledgeGraphQuery accessor microbenchmark")
+    parser.add_argument("--graph", default=str(DEFAULT_GRAPH), help="course_kg.pkl 路径")
+    parser.add_argument("--synthetic", type=int, default=0, help="生成 N 门课程的随机图代替真实图")
+    parser.add_argument("--repeat", type=int, default=3, help="每个访问器重复计时的次数（取最快）")
+    parser.add_argument("--path-pairs", type=int, default=50, help="路径查询的 (起点, 终点) 对数")
+    parser.add_argument("--path-length", type=int, default=6, help="路径查询的 max_length（旧实现会完整枚举）")
+    parser.add_argument("--chain-courses", type=int, default=20, help="与旧的递归 DFS 对比的课程数")
+    parser.add_argument("--profiles", type=int, default=20, help="get_all_unlocked_courses 对比的随机已修课程集合数")
+    parser.add_argument("--chain-depth", type=int, default=6, help="旧的递归 DFS 的 max_depth")
+    args = parser.parse_args()
+
+    graph_path = args.graph
+    if args.synthetic:
+        tmp = tempfile.NamedTemporaryFile(suffix=".pkl", delete=False)
+        with tmp:
+            pickle.dump(synthetic_graph(args.synthetic), tmp)
+        graph_path = tmp.name
+    elif not Path(graph_path).exists():
+        sys.exit(f"[ERR] 图文件未找到: {graph_path}（先运行 build_knowledge_graph.py，或使用 --synthetic N）")
+
+    start = time.perf_counter()
+    kg = KnowledgeGraphQuery(graph_path)
+    print(f"Load + index build: {time.perf_counter() - start:.2f}s")
+    failures = run(kg, args.repeat)
+    failures += run_paths(kg, args.path_pairs, args.path_length)
+    failures += run_closure(kg, args.chain_courses, args.chain_depth)
+    failures += run_unlocked(kg, args.profiles)
+    sys.exit(1 if failures else 0)
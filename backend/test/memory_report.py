@@ -0,0 +1,138 @@
+"""
+多 worker 内存报告（Linux，读取 /proc/<pid>/smaps_rollup）
+
+每个进程输出:
+  RSS  驻留内存（共享页在每个进程里都算一次，多 worker 时会重复计算）
+  PSS  按共享进程数均摊后的内存
+  USS  进程独占的内存（Private_Clean + Private_Dirty），即多开一个 worker 的实际成本
+
+用法:
+    # 1. 默认部署（每个 worker 各加载一份模型）
+    uvicorn backend.asgi:application --workers 4 &
+    python backend/test/memory_report.py --master <uvicorn master pid> --save before.json
+
+    # 2. gunicorn preload（master 加载，worker 共享，见 backend/gunicorn.conf.py）
+    (cd backend && gunicorn -c gunicorn.conf.py backend.asgi:application) &
+    python backend/test/memory_report.py --master <gunicorn master pid> --save after.json --compare before.json
+
+等 /ready 返回 200（所有 worker 预热完）之后再采样，最好先发几条请求。
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+
+def read_smaps(pid: int) -> Dict[str, int]:
+    """单个进程的内存统计（kB）；旧内核没有 smaps_rollup 时逐段累加 smaps"""
+    totals = {field: 0 for field in FIELDS}
+    path = Path(f"/proc/{pid}/smaps_rollup")
+    if not path.exists():
+        path = Path(f"/proc/{pid}/smaps")
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].rstrip(":") in totals:
+                totals[parts[0].rstrip(":")] += int(parts[1])
+    totals["Uss"] = totals["Private_Clean"] + totals["Private_Dirty"]
+    return totals
+
+
+def child_pids(master_pid: int) -> List[int]:
+    """master 的直接子进程（gunicorn / uvicorn 的 worker）"""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # comm 字段可能带空格，从最后一个 ')' 之后解析
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == master_pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def collect(master_pid: int = 0, pids: List[int] = ()) -> Dict[str, object]:
+    workers = list(pids) or child_pids(master_pid)
+    report = {"master": None, "workers": {}}
+    if master_pid:
+        report["master"] = {"pid": master_pid, **read_smaps(master_pid)}
+    for pid in workers:
+        try:
+            report["workers"][str(pid)] = read_smaps(pid)
+        except OSError as e:
+            print(f"[WARN] Skipping pid {pid}: {e}")
+    return report
+
+
+def summarize(report: Dict[str, object]) -> Dict[str, float]:
+    workers = list(report["workers"].values())
+    n = max(1, len(workers))
+    master = report.get("master") or {}
+    return {
+        "workers": len(workers),
+        "avg_worker_rss_mb": sum(w["Rss"] for w in workers) / n / 1024,
+        "avg_worker_uss_mb": sum(w["Uss"] for w in workers) / n / 1024,
+        # 整个服务的实际占用：master + 所有 worker 的 PSS 之和
+        "total_pss_mb": (master.get("Pss", 0) + sum(w["Pss"] for w in workers)) / 1024,
+    }
+
+
+def print_report(report: Dict[str, object], title: str):
+    print(f"\n=== {title} ===")
+    print(f"{'pid':>8} {'role':>7} {'RSS(MB)':>9} {'PSS(MB)':>9} {'USS(MB)':>9} {'shared(MB)':>11}")
+    rows = []
+    if report.get("master"):
+        rows.append(("master", report["master"]))
+    rows += [("worker", {"pid": int(pid), **stats}) for pid, stats in report["workers"].items()]
+    for role, stats in rows:
+        shared = stats["Shared_Clean"] + stats["Shared_Dirty"]
+        print(f"{stats['pid']:>8} {role:>7} {stats['Rss'] / 1024:>9.1f} {stats['Pss'] / 1024:>9.1f} "
+              f"{stats['Uss'] / 1024:>9.1f} {shared / 1024:>11.1f}")
+    summary = summarize(report)
+    print(f"workers={summary['workers']}  avg RSS={summary['avg_worker_rss_mb']:.1f}MB  "
+          f"avg USS={summary['avg_worker_uss_mb']:.1f}MB  total PSS={summary['total_pss_mb']:.1f}MB")
+
+
+def print_comparison(before: Dict[str, object], after: Dict[str, object]):
+    b, a = summarize(before), summarize(after)
+    print("\n=== before -> after ===")
+    for key in ("avg_worker_rss_mb", "avg_worker_uss_mb", "total_pss_mb"):
+        delta = a[key] - b[key]
+        ratio = f" ({delta / b[key] * 100:+.0f}%)" if b[key] else ""
+        print(f"{key:>18}: {b[key]:9.1f} -> {a[key]:9.1f} MB{ratio}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-worker RSS / PSS / USS report for multi-worker servers")
+    parser.add_argument("--master", type=int, default=0, help="gunicorn / uvicorn master 进程 pid")
+    parser.add_argument("--pids", type=int, nargs="*", default=[], help="直接指定 worker pid（不传 --master 时）")
+    parser.add_argument("--save", help="把报告保存为 JSON")
+    parser.add_argument("--compare", help="与之前保存的报告（JSON）对比")
+    args = parser.parse_args()
+
+    if not args.master and not args.pids:
+        parser.error("需要 --master 或 --pids")
+    if not Path("/proc/self/smaps").exists():
+        sys.exit("[ERR] /proc/<pid>/smaps 不可用（仅支持 Linux）")
+
+    current = collect(args.master, args.pids)
+    if not current["workers"]:
+        sys.exit(f"[ERR] 没有找到 pid {args.master} 的子进程")
+    print_report(current, "current")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(current, indent=2))
+        print(f"[OK] Saved to {args.save}")
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text())
+        print_report(previous, f"baseline ({args.compare})")
+        print_comparison(previous, current)
@@ -0,0 +1,144 @@
+"""
+查询编码器后端一致性测试（离线，不需要启动服务）
+
+对比 fp32 PyTorch 与量化后端 (torch-int8 / onnx / onnx-int8):
+  1. 分词结果完全一致
+  2. 每条查询的向量余弦相似度 >= 阈值
+  3. 两个后端的 top-k 检索结果大体一致（在同一批候选文本上）
+并打印单条查询延迟和进程 RSS 增量。
+
+用法:
+    python backend/test/test_encoder_parity.py --backend torch-int8
+    python backend/test/test_encoder_parity.py --backend onnx-int8 --min-cosine 0.98
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from RAG_database.query_encoder import ENCODER_BACKENDS, load_query_encoder  # noqa: E402
+
+MODEL_NAME = "BAAI/bge-small-en-v1.5"
+
+QUERIES = [
+    "What AI courses are available for postgraduate?",
+    "Tell me about COMP3900",
+    "prerequisites for machine learning and data mining",
+    "database management systems SQL",
+    "Which level 3 courses are offered in T1?",
+    "computer science major core requirements",
+    "人工智能相关的课程有哪些",
+    "operating systems concurrency and scheduling",
+    "Can I take COMP9417 without COMP9021?",
+    "software engineering capstone project group work",
+]
+
+PASSAGES = [
+    "Course Code: COMP9417 (PG). Course Name: Machine Learning and Data Mining. Overview: supervised and unsupervised learning.",
+    "Course Code: COMP3311 (UG). Course Name: Database Systems. Overview: relational model, SQL, transactions.",
+    "Course Code: COMP3231 (UG). Course Name: Operating Systems. Overview: processes, concurrency, scheduling, memory.",
+    "Course Code: COMP3900 (UG). Course Name: Computer Science Project. Overview: capstone software project in teams.",
+    "Course Code: COMP9444 (PG). Course Name: Neural Networks and Deep Learning.",
+    "Requirement Group: Core Courses. Major: COMPA1. Includes courses: COMP1511, COMP1521, COMP2521.",
+]
+
+
+def print_success(msg: str):
+    print(f"[OK] {msg}")
+
+
+def print_error(msg: str):
+    print(f"[ERR] {msg}")
+
+
+def rss_mb() -> float:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def encode(model, texts):
+    return np.asarray(model.encode(texts, show_progress_bar=False, normalize_embeddings=True), dtype=np.float32)
+
+
+def time_single_queries(model, repeat: int = 3) -> float:
+    encode(model, QUERIES[:1])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in QUERIES:
+            encode(model, [q])
+    return (time.perf_counter() - start) / (repeat * len(QUERIES)) * 1000
+
+
+def test_parity(backend: str, min_cosine: float, min_overlap: float) -> bool:
+    rss_start = rss_mb()
+    reference, _ = load_query_encoder(MODEL_NAME, "torch", device="cpu")
+    rss_reference = rss_mb()
+    candidate, used = load_query_encoder(MODEL_NAME, backend)
+    rss_candidate = rss_mb()
+
+    if used != backend:
+        print_error(f"Backend '{backend}' could not be loaded (fell back to '{used}')")
+        return False
+
+    ok = True
+
+    # 1. 分词一致
+    ref_tokens = reference.tokenize(QUERIES + PASSAGES)["input_ids"]
+    cand_tokens = candidate.tokenize(QUERIES + PASSAGES)["input_ids"]
+    if np.array_equal(np.asarray(ref_tokens), np.asarray(cand_tokens)):
+        print_success("Tokenization identical")
+    else:
+        print_error("Tokenization differs")
+        ok = False
+
+    # 2. 向量余弦相似度
+    ref_vecs = encode(reference, QUERIES)
+    cand_vecs = encode(candidate, QUERIES)
+    cosines = np.sum(ref_vecs * cand_vecs, axis=1)
+    print(f"  cosine(fp32, {backend}): min={cosines.min():.4f} mean={cosines.mean():.4f}")
+    if cosines.min() >= min_cosine:
+        print_success(f"All query embeddings within tolerance (>= {min_cosine})")
+    else:
+        print_error(f"Query embedding cosine below {min_cosine}: {cosines.min():.4f}")
+        ok = False
+
+    # 3. 检索结果一致
+    ref_rank = np.argsort(-(ref_vecs @ encode(reference, PASSAGES).T), axis=1)[:, :3]
+    cand_rank = np.argsort(-(cand_vecs @ encode(candidate, PASSAGES).T), axis=1)[:, :3]
+    overlap = np.mean([len(set(a) & set(b)) / 3 for a, b in zip(ref_rank, cand_rank)])
+    print(f"  top-3 overlap: {overlap:.2%}")
+    if overlap >= min_overlap:
+        print_success("Retrieval ranking preserved")
+    else:
+        print_error(f"Top-3 overlap below {min_overlap:.0%}")
+        ok = False
+
+    # 4. 延迟 / 内存（仅报告）
+    ref_ms = time_single_queries(reference)
+    cand_ms = time_single_queries(candidate)
+    print(f"  latency per query: fp32 {ref_ms:.1f}ms -> {backend} {cand_ms:.1f}ms ({ref_ms / max(cand_ms, 1e-6):.2f}x)")
+    print(f"  RSS delta: fp32 +{rss_reference - rss_start:.0f}MB, {backend} +{rss_candidate - rss_reference:.0f}MB")
+
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query encoder backend parity test")
+    parser.add_argument("--backend", default="torch-int8", choices=[b for b in ENCODER_BACKENDS if b != "torch"])
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--min-overlap", type=float, default=0.8)
+    args = parser.parse_args()
+
+    passed = test_parity(args.backend, args.min_cosine, args.min_overlap)
+    print("\nPASSED" if passed else "\nFAILED")
+    sys.exit(0 if passed else 1)